@@ -0,0 +1,121 @@
+# Data handlers that copy MetaWear samples straight out of the C structs libmetawear hands
+# to the callback, into a SampleWriter block or a NumPy SampleRing.
+#
+# parse_value(ptr) builds a CartesianFloat / EulerAngles / Quaternion copy per sample and
+# the handler then reads .x/.y/.z back out as Python floats. These handlers know the layout
+# of each signal's struct (SIGNAL_COLUMNS, all float32) and memmove the epoch and the value
+# bytes into the next record of the sink, so no per-sample objects are built beyond the
+# pointer ctypes passes in. The record layout (int64 epoch, float32 values, packed) is the
+# same in both sinks.
+import ctypes
+from sample_writer import SIGNAL_COLUMNS
+
+# epoch is the first field of the Data struct
+EPOCH_BYTES = 8
+
+
+class SampleRing:
+    """
+    Fixed-size ring of the latest samples of one signal, as a NumPy structured array
+    with an int64 'epoch' field and one float32 field per column.
+
+    One producer (the handler make_handler builds, on libmetawear's thread) writes
+    through reserve() / commit(), one consumer reads with drain() or latest(). There
+    is no lock: the producer only moves count forward once a sample is written, and
+    the consumer only moves read. When the consumer falls more than capacity samples
+    behind, the oldest are overwritten and counted in dropped, so memory stays fixed
+    and a drain always ends at the newest sample.
+
+    count is the number of samples written so far, read the number drained.
+    """
+    def __init__(self, signal, capacity=1024):
+        # numpy is only needed by the live views, the loggers on the Pi only use make_handler
+        import numpy as np
+        self.signal = signal
+        self.columns = SIGNAL_COLUMNS[signal]
+        self.capacity = capacity
+        self.dtype = np.dtype([('epoch', '<i8')] + [(column, '<f4') for column in self.columns])
+        self.buffer = np.zeros(capacity, dtype=self.dtype)
+        self.count = 0
+        self.read = 0
+        self.dropped = 0
+        self._address = self.buffer.ctypes.data
+        self._itemsize = self.dtype.itemsize
+
+    def reserve(self):
+        """Address of the slot the next sample goes to"""
+        return self._address + (self.count % self.capacity) * self._itemsize
+
+    def commit(self):
+        self.count += 1
+
+    def _copy(self, start, end):
+        """Copy of samples start..end (sample numbers, at most capacity apart), oldest first"""
+        first, last = start % self.capacity, end % self.capacity
+        if first < last or start == end:
+            return self.buffer[first:last].copy()
+        import numpy as np
+        return np.concatenate((self.buffer[first:], self.buffer[:last]))
+
+    def _overwritten(self, start):
+        """Samples from start on that the producer may have overwritten since they were copied"""
+        # the slot of sample count is being written already, it held sample count - capacity
+        return max(0, self.count - self.capacity + 1 - start)
+
+    def drain(self):
+        """
+        Samples written since the last drain, oldest first.
+
+        Returns:
+            np.ndarray: a copy, safe to keep while the producer carries on
+        """
+        end = self.count
+        start = max(self.read, end - self.capacity)
+        samples = self._copy(start, end)
+        overwritten = min(self._overwritten(start), len(samples))
+        if overwritten:
+            samples = samples[overwritten:]
+        self.dropped += start - self.read + overwritten
+        self.read = end
+        return samples
+
+    def latest(self, n=None):
+        """Copy of the last n samples (all the ring holds by default), oldest first; does not move read"""
+        end = self.count
+        available = min(end, self.capacity)
+        n = available if n is None else min(n, available)
+        samples = self._copy(end - n, end)
+        return samples[min(self._overwritten(end - n), len(samples)):]
+
+
+def make_handler(sink, signal):
+    """
+    libmetawear data callback copying each sample of signal into sink.
+
+    Args:
+        sink: SampleWriter or SampleRing, anything with reserve() -> address of the
+            next record and commit()
+        signal (str): key of SIGNAL_COLUMNS, e.g. 'accelerometer' or 'euler_angle'
+
+    Returns:
+        FnVoid_VoidP_DataP: the callback, keep a reference to it while subscribed
+    """
+    from mbientlab.metawear.cbindings import FnVoid_VoidP_DataP
+    return FnVoid_VoidP_DataP(copy_sample_fn(sink, signal))
+
+
+def copy_sample_fn(sink, signal):
+    """The Python function behind make_handler's callback, called with the Data pointer"""
+    value_bytes = 4 * len(SIGNAL_COLUMNS[signal])
+    reserve, commit, memmove = sink.reserve, sink.commit, ctypes.memmove
+
+    def handler(ctx, ptr):
+        data = ptr.contents
+        # a shorter value than the signal's struct means the handler is on the wrong signal
+        if data.length < value_bytes:
+            return
+        address = reserve()
+        memmove(address, ptr, EPOCH_BYTES)
+        memmove(address + EPOCH_BYTES, data.value, value_bytes)
+        commit()
+    return handler
@@ -4,11 +4,13 @@ import sys
 import os
 sys.path.append('/home/rpi5/metawear/MetaWear-SDK-Python')
 sys.path.append("/hdd/side_projects/imu_project/MetaWear-SDK-Python")
-from mbientlab.metawear import MetaWear, libmetawear, parse_value, create_voidp
+from mbientlab.metawear import MetaWear, libmetawear, create_voidp
 from mbientlab.metawear.cbindings import *
 from time import sleep, strftime
 from threading import Event
 import yaml
+from sample_writer import SampleWriter, convert_run_directory
+from fast_handlers import make_handler
 
 sys.stdout.reconfigure(line_buffering=True)  # Python 3.7+
 # OR
@@ -44,24 +46,22 @@ print("Connected to " + d.address + " over " + ("USB" if d.usb.is_connected else
 
 # Event setup
 e = Event()
+handlers = []
 
 # Callback handlers
 class DataHandler:
-    def __init__(self, sensor_name):
-        self.filename = os.path.join(run_directory, f"{sensor_name}-{strftime('%Y%m%d-%H%M%S')}.csv")
-        self.file = None
-        self.data_handler_fn = FnVoid_VoidP_DataP(lambda ctx, ptr: self.data_handler(ptr))
+    def __init__(self, sensor_name, odr=0.0, sample_range=0.0):
+        # binary records, buffered and flushed by a background thread; converted to CSV after the download
+        self.filename = os.path.join(run_directory, f"{sensor_name}-{strftime('%Y%m%d-%H%M%S')}.bin")
+        self.writer = SampleWriter(self.filename, sensor_name, odr, sample_range)
+        # copies each sample's bytes straight into the writer's block, no parse_value objects
+        self.data_handler_fn = make_handler(self.writer, sensor_name)
         
-    def data_handler(self, ptr):
-        data = parse_value(ptr)
-        if self.file is None:
-            self.file = open(self.filename, 'w')
-            self.file.write("epoch,x,y,z\n")
-        self.file.write(f"{ptr.contents.epoch},{data.x},{data.y},{data.z}\n")
-        
-    def __del__(self):
-        if self.file is not None:
-            self.file.close()
+    def close(self):
+        try:
+            self.writer.close()
+        except OSError as err:
+            print(f"Could not write {self.filename}: {err}")
 
 try:
     print("Configuring device")
@@ -75,7 +75,6 @@ try:
     gyro_config = config.get('gyroscope', {})
     mag_config = config.get('magnetometer', {})
     
-    handlers = []
     loggers = []
     
     # Accelerometer configuration
@@ -86,7 +85,7 @@ try:
         libmetawear.mbl_mw_acc_write_acceleration_config(d.board)
         
         acc_signal = libmetawear.mbl_mw_acc_get_acceleration_data_signal(d.board)
-        acc_handler = DataHandler("accelerometer")
+        acc_handler = DataHandler("accelerometer", acc_config['odr'], acc_config['range'])
         handlers.append(acc_handler)
         acc_logger = create_voidp(lambda fn: libmetawear.mbl_mw_datasignal_log(acc_signal, None, fn))
         loggers.append((acc_logger, acc_handler))
@@ -116,7 +115,7 @@ try:
         libmetawear.mbl_mw_gyro_bmi270_write_config(d.board)
         
         gyro_signal = libmetawear.mbl_mw_gyro_bmi270_get_rotation_data_signal(d.board)
-        gyro_handler = DataHandler("gyroscope")
+        gyro_handler = DataHandler("gyroscope", gyro_config['odr'], gyro_config['range'])
         handlers.append(gyro_handler)
         gyro_logger = create_voidp(lambda fn: libmetawear.mbl_mw_datasignal_log(gyro_signal, None, fn))
         loggers.append((gyro_logger, gyro_handler))
@@ -127,7 +126,7 @@ try:
         libmetawear.mbl_mw_mag_bmm150_set_preset(d.board, MagBmm150Preset.REGULAR)
         
         mag_signal = libmetawear.mbl_mw_mag_bmm150_get_b_field_data_signal(d.board)
-        mag_handler = DataHandler("magnetometer")
+        mag_handler = DataHandler("magnetometer", mag_config.get('odr', 0.0))
         handlers.append(mag_handler)
         mag_logger = create_voidp(lambda fn: libmetawear.mbl_mw_datasignal_log(mag_signal, None, fn))
         loggers.append((mag_logger, mag_handler))
@@ -195,6 +194,11 @@ try:
 except RuntimeError as err:
     print(err)
 finally:
+    for handler in handlers:
+        handler.close()
+    if config.get('convert_to_csv', True):
+        for csv_path in convert_run_directory(run_directory, remove_binary=True):
+            print(f"Saved {csv_path}")
     print("Resetting device")
     e.clear()
     d.on_disconnect = lambda status: e.set()
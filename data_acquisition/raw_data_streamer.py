@@ -6,11 +6,13 @@ import sys
 import os
 sys.path.append("/hdd/side_projects/imu_project/MetaWear-SDK-Python")
 
-from mbientlab.metawear import MetaWear, libmetawear, parse_value
+from mbientlab.metawear import MetaWear, libmetawear
 from mbientlab.metawear.cbindings import *
 from time import sleep, strftime
 from threading import Event
 import yaml
+from sample_writer import SampleWriter, convert_run_directory
+from fast_handlers import make_handler
 
 # Load configuration from a YAML file
 def load_config(config_file):
@@ -18,24 +20,34 @@ def load_config(config_file):
         return yaml.safe_load(f)
 
 class State:
-    def __init__(self, device, run_directory):
+    def __init__(self, device, run_directory, config=None):
+        config = config or {}
         self.device = device
-        self.samples = 0
         self.run_directory = run_directory
-        self.acc_handler = self.create_data_handler("accelerometer")
-        self.gyro_handler = self.create_data_handler("gyroscope")
-        self.mag_handler = self.create_data_handler("magnetometer")
+        self.writers = []
+        acc_config = config.get('accelerometer', {})
+        gyro_config = config.get('gyroscope', {})
+        self.acc_handler = self.create_data_handler("accelerometer", acc_config.get('odr'), acc_config.get('range'))
+        self.gyro_handler = self.create_data_handler("gyroscope", gyro_config.get('odr'), gyro_config.get('range'))
+        self.mag_handler = self.create_data_handler("magnetometer", config.get('magnetometer', {}).get('odr'))
         
-    def create_data_handler(self, sensor_name):
-        filename = os.path.join(self.run_directory, f"{sensor_name}-{strftime('%Y%m%d-%H%M%S')}.csv")
-        file = open(filename, 'w')
-        file.write("epoch,x,y,z\n")
-        return FnVoid_VoidP_DataP(lambda ctx, ptr: self.data_handler(ptr, file))
+    def create_data_handler(self, sensor_name, odr=None, sample_range=None):
+        # binary records, buffered and flushed by a background thread; converted to CSV once streaming stops
+        filename = os.path.join(self.run_directory, f"{sensor_name}-{strftime('%Y%m%d-%H%M%S')}.bin")
+        writer = SampleWriter(filename, sensor_name, odr, sample_range)
+        self.writers.append(writer)
+        return make_handler(writer, sensor_name)
+
+    @property
+    def samples(self):
+        return sum(writer.samples for writer in self.writers)
     
-    def data_handler(self, ptr, file):
-        data = parse_value(ptr)
-        file.write(f"{ptr.contents.epoch},{data.x},{data.y},{data.z}\n")
-        self.samples += 1
+    def close(self):
+        for writer in self.writers:
+            try:
+                writer.close()
+            except OSError as err:
+                print(f"Could not write {writer.path}: {err}")
 
 def main():
     # Load configuration
@@ -56,7 +68,7 @@ def main():
     d.connect()
     print("Connected to " + d.address + " over " + ("USB" if d.usb.is_connected else "BLE"))
 
-    state = State(d, run_directory)
+    state = State(d, run_directory, config)
     e = Event()  # Reintroduce the Event object
 
     try:
@@ -153,6 +165,10 @@ def main():
     except RuntimeError as err:
         print(err)
     finally:
+        state.close()
+        if config.get('convert_to_csv', True):
+            for csv_path in convert_run_directory(run_directory, remove_binary=True):
+                print(f"Saved {csv_path}")
         print("Resetting device")
         d.on_disconnect = lambda status: e.set()
         libmetawear.mbl_mw_debug_reset(d.board)
@@ -0,0 +1,280 @@
+# usage: python3 sample_writer.py [run_directory or .bin files...]
+# Binary sample files written by the loggers, and their conversion to the usual CSVs.
+# Runs on the Pi's python 3.7 environment, so it only uses the standard library.
+import argparse
+import ctypes
+import os
+import queue
+import struct
+import threading
+import time
+
+MAGIC = b'FCIMU\x00\x00\x01'
+VERSION = 1
+# magic, version, record size, sensor name, ODR (Hz), range (g, dps, ... as configured), creation time (epoch ms)
+HEADER = struct.Struct('<8sHH16sffq')
+# one sample: board epoch (ms), x, y, z
+RECORD = struct.Struct('<qfff')
+CSV_HEADER = "epoch,x,y,z\n"
+
+# float32 values of every MetaWear signal, in the order of its C struct: the raw sensors
+# (CartesianFloat) and the sensor fusion outputs (SensorFusionData names, lowercase). The
+# corrected_* structs end in an accuracy byte, which is not kept.
+SIGNAL_COLUMNS = {
+    'accelerometer': ('x', 'y', 'z'),
+    'gyroscope': ('x', 'y', 'z'),
+    'magnetometer': ('x', 'y', 'z'),
+    'euler_angle': ('heading', 'pitch', 'roll', 'yaw'),
+    'quaternion': ('w', 'x', 'y', 'z'),
+    'linear_acc': ('x', 'y', 'z'),
+    'gravity_vector': ('x', 'y', 'z'),
+    'corrected_acc': ('x', 'y', 'z'),
+    'corrected_gyro': ('x', 'y', 'z'),
+    'corrected_mag': ('x', 'y', 'z'),
+}
+
+
+def record_struct(n_values):
+    """Record of a signal with n_values float32 values; RECORD for the 3-axis sensors"""
+    return struct.Struct('<q' + 'f' * n_values)
+
+
+# samples per block handed to the flush thread; 4096 samples is 80 kB, ~1.7 s of 800 Hz
+DEFAULT_BLOCK_SAMPLES = 4096
+
+
+class SampleWriter:
+    """
+    Append-only writer of fixed-width binary sample records, for the libmetawear
+    data callbacks.
+
+    append() packs the sample into a preallocated block with struct.pack_into and
+    bumps a counter: no string formatting, no file I/O and no allocation in the
+    callback thread. Full blocks are handed to a background thread that writes
+    them out and gives the emptied block back for reuse; if it falls behind, a
+    new block is allocated instead of making the callback wait.
+
+    The file starts with HEADER (sensor, ODR and range) followed by one record per
+    sample, RECORD for the 3-axis sensors and 4 floats for the euler_angle and
+    quaternion signals (see SIGNAL_COLUMNS); read_samples / convert_to_csv turn it
+    back into the epoch,x,y,z (epoch,<columns>) CSV.
+    The file is only created once the first block is written, so a sensor that
+    never delivers data leaves no file, like the CSV handlers did.
+
+    append() must be called from one thread at a time, which is how libmetawear
+    calls a signal's handler. Handlers that copy the sample bytes in themselves
+    (fast_handlers.make_handler) use reserve() and commit() instead.
+    """
+    def __init__(self, path, sensor, odr=0.0, sample_range=0.0, block_samples=DEFAULT_BLOCK_SAMPLES):
+        self.path = path
+        self.sensor = sensor
+        self.columns = SIGNAL_COLUMNS.get(sensor, ('x', 'y', 'z'))
+        self.samples = 0
+        record = record_struct(len(self.columns))
+        self._header = HEADER.pack(MAGIC, VERSION, record.size, sensor.encode()[:16], float(odr or 0.0),
+                                   float(sample_range or 0.0), int(time.time() * 1000))
+        self._block_bytes = block_samples * record.size
+        self._offset = 0
+        self._pack_into = record.pack_into
+        self._record_size = record.size
+        self._set_block(bytearray(self._block_bytes))
+        self._free = queue.Queue()
+        self._pending = queue.Queue()
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, name=f"flush-{sensor}", daemon=True)
+        self._thread.start()
+
+    def _set_block(self, block):
+        self._block = block
+        # address of the block for reserve(), taken once per block
+        self._address = ctypes.addressof((ctypes.c_char * len(block)).from_buffer(block))
+        self._offset = 0
+
+    def append(self, epoch, *values):
+        """Add one sample (epoch, then one value per column); O(1), called from the sensor callback"""
+        self._pack_into(self._block, self._offset, epoch, *values)
+        self.commit()
+
+    def reserve(self):
+        """Address of the next record, for a handler to copy a sample into; commit() once it is written"""
+        return self._address + self._offset
+
+    def commit(self):
+        """Count the reserved record as written, handing the block off once it is full"""
+        self._offset += self._record_size
+        self.samples += 1
+        if self._offset == self._block_bytes:
+            self._hand_off()
+
+    def _hand_off(self):
+        if self._error is not None:
+            # the file cannot be written, close() raises; refill the same block
+            self._offset = 0
+            return
+        self._pending.put((self._block, self._offset))
+        try:
+            block = self._free.get_nowait()
+        except queue.Empty:
+            block = bytearray(self._block_bytes)
+        self._set_block(block)
+
+    def _flush_loop(self):
+        file = None
+        try:
+            while True:
+                item = self._pending.get()
+                if item is None:
+                    break
+                block, size = item
+                if file is None:
+                    file = open(self.path, 'wb')
+                    file.write(self._header)
+                file.write(memoryview(block)[:size])
+                self._free.put(block)
+        except OSError as e:
+            # keep draining so append never blocks, the error is raised by close()
+            self._error = e
+            while True:
+                item = self._pending.get()
+                if item is None:
+                    break
+                self._free.put(item[0])
+        finally:
+            if file is not None:
+                file.close()
+
+    def close(self):
+        """Write what is buffered, stop the flush thread and close the file; safe to call twice"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._offset:
+            self._pending.put((self._block, self._offset))
+        self._pending.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_header(file):
+    """Header of an open sample file as a dict: sensor, columns, odr, range, created (epoch ms), record_size"""
+    raw = file.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError(f"{file.name} is too short for a sample file header")
+    magic, version, record_size, sensor, odr, sample_range, created = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError(f"{file.name} is not a sample file")
+    sensor = sensor.rstrip(b'\x00').decode()
+    columns = SIGNAL_COLUMNS.get(sensor, ('x', 'y', 'z'))
+    if version != VERSION or record_size != record_struct(len(columns)).size:
+        raise ValueError(f"{file.name} has an unsupported format (version {version}, {record_size} byte records)")
+    return {'sensor': sensor, 'columns': columns, 'odr': odr, 'range': sample_range, 'created': created,
+            'record_size': record_size}
+
+
+def read_samples(path, block_samples=65536):
+    """
+    Read a sample file.
+
+    A record cut short at the end (the logger was killed mid-write) is dropped.
+
+    Returns:
+        (header, samples): the header dict and a generator of (epoch, *values)
+        tuples, read in blocks of block_samples records
+    """
+    file = open(path, 'rb')
+    try:
+        header = read_header(file)
+    except ValueError:
+        file.close()
+        raise
+
+    record = record_struct(len(header['columns']))
+
+    def samples():
+        with file:
+            while True:
+                data = file.read(block_samples * record.size)
+                usable = len(data) - len(data) % record.size
+                if usable == 0:
+                    return
+                for record_values in record.iter_unpack(memoryview(data)[:usable]):
+                    yield record_values
+                if usable < len(data):
+                    return
+
+    return header, samples()
+
+
+def convert_to_csv(path, csv_path=None):
+    """
+    Write a sample file as the epoch,x,y,z CSV the handlers used to write directly
+    (epoch,<columns> for the sensor fusion signals).
+
+    float32 values read back as the same Python floats libmetawear handed to the
+    callback, so the CSV is identical to what the old handlers wrote.
+
+    Returns:
+        str: path of the CSV, next to the sample file by default
+    """
+    csv_path = csv_path or os.path.splitext(path)[0] + '.csv'
+    tmp_path = f"{csv_path}.part"
+    header, samples = read_samples(path)
+    with open(tmp_path, 'w') as f:
+        if header['columns'] == ('x', 'y', 'z'):
+            f.write(CSV_HEADER)
+            f.writelines(f"{epoch},{x},{y},{z}\n" for epoch, x, y, z in samples)
+        else:
+            f.write(','.join(('epoch',) + header['columns']) + '\n')
+            f.writelines(','.join(map(str, record)) + '\n' for record in samples)
+    os.replace(tmp_path, csv_path)
+    return csv_path
+
+
+def convert_run_directory(run_directory, remove_binary=False):
+    """Convert every .bin sample file of a run directory to CSV; returns the CSV paths"""
+    csv_paths = []
+    for name in sorted(os.listdir(run_directory)):
+        if not name.endswith('.bin'):
+            continue
+        path = os.path.join(run_directory, name)
+        try:
+            csv_paths.append(convert_to_csv(path))
+        except (OSError, ValueError) as e:
+            print(f"Could not convert {path}: {e}")
+            continue
+        if remove_binary:
+            os.remove(path)
+    return csv_paths
+
+
+def command_line_args():
+    parser = argparse.ArgumentParser(description='Convert binary IMU sample files to epoch,x,y,z CSVs')
+    parser.add_argument('paths', nargs='+', help='.bin files or run directories')
+    parser.add_argument('--remove-binary', action='store_true', help='Delete the .bin files once converted')
+    return parser.parse_args()
+
+
+def main():
+    args = command_line_args()
+    for path in args.paths:
+        if os.path.isdir(path):
+            csv_paths = convert_run_directory(path, args.remove_binary)
+        else:
+            csv_paths = [convert_to_csv(path)]
+            if args.remove_binary:
+                os.remove(path)
+        for csv_path in csv_paths:
+            print(f"Wrote {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
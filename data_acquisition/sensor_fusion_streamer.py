@@ -2,11 +2,13 @@ from __future__ import print_function
 import sys
 import os
 sys.path.append("/hdd/side_projects/imu_project/MetaWear-SDK-Python")
-from mbientlab.metawear import MetaWear, libmetawear, parse_value
+from mbientlab.metawear import MetaWear, libmetawear
 from mbientlab.metawear.cbindings import *
 from time import sleep, strftime
 from threading import Event
 import yaml
+from sample_writer import SampleWriter, convert_to_csv
+from fast_handlers import make_handler
 
 def load_config(config_file):
     with open(config_file, 'r') as f:
@@ -16,10 +18,11 @@ class SensorFusionStreamer:
     def __init__(self, device_mac, run_directory):
         self.device = MetaWear(device_mac)
         self.run_directory = run_directory
-        self.filename = os.path.join(run_directory, f"sensor_fusion_stream-{strftime('%Y%m%d-%H%M%S')}.csv")
-        self.file = None
-        self.callback = FnVoid_VoidP_DataP(self.data_handler)
-        self.samples = 0
+        # binary records, converted to an epoch,w,x,y,z or epoch,heading,pitch,roll,yaw CSV by close()
+        self.filename = os.path.join(run_directory, f"sensor_fusion_stream-{strftime('%Y%m%d-%H%M%S')}.bin")
+        self.writer = None
+        self.callback = None
+        self.data_signal = SensorFusionData.QUATERNION
 
     def connect(self):
         self.device.connect()
@@ -45,41 +48,40 @@ class SensorFusionStreamer:
         # Determine data type based on config
         data_type = config['sensor_fusion'].get('preset', 'Quaternion').upper()
         if data_type == 'EULER':
-            data_signal = SensorFusionData.EULER_ANGLE
+            self.data_signal, signal_name = SensorFusionData.EULER_ANGLE, 'euler_angle'
         else:
-            data_signal = SensorFusionData.QUATERNION
+            self.data_signal, signal_name = SensorFusionData.QUATERNION, 'quaternion'
+        self.writer = SampleWriter(self.filename, signal_name)
+        self.callback = make_handler(self.writer, signal_name)
         
-        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, data_signal)
+        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, self.data_signal)
         libmetawear.mbl_mw_datasignal_subscribe(signal, None, self.callback)
-        libmetawear.mbl_mw_sensor_fusion_enable_data(self.device.board, data_signal)
+        libmetawear.mbl_mw_sensor_fusion_enable_data(self.device.board, self.data_signal)
         libmetawear.mbl_mw_sensor_fusion_start(self.device.board)
 
-    def data_handler(self, ctx, data):
-        parsed_data = parse_value(data)
-        print (parsed_data)
-        if self.file is None:
-            self.file = open(self.filename, 'w')
-            
-            # TODO: for now checking hasattr. Need to find a better way to do this
-            if hasattr(parsed_data, 'w'):
-                self.file.write("epoch,w,x,y,z\n")
-                self.file.write(f"{data.contents.epoch},{parsed_data.w},{parsed_data.x},{parsed_data.y},{parsed_data.z}\n")
-            else:
-                self.file.write("epoch,heading,pitch,roll,yaw\n")
-                self.file.write(f"{data.contents.epoch},{parsed_data.heading},{parsed_data.pitch},{parsed_data.roll},{parsed_data.yaw}\n")
-        self.samples += 1
-
     def stop_streaming(self):
         libmetawear.mbl_mw_sensor_fusion_stop(self.device.board)
-        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, SensorFusionData.QUATERNION)
+        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, self.data_signal)
         libmetawear.mbl_mw_datasignal_unsubscribe(signal)
 
     def disconnect(self):
         libmetawear.mbl_mw_debug_disconnect(self.device.board)
 
-    def __del__(self):
-        if self.file is not None:
-            self.file.close()
+    @property
+    def samples(self):
+        return self.writer.samples if self.writer is not None else 0
+
+    def close(self):
+        """Write out the buffered samples and convert them to CSV"""
+        if self.writer is None:
+            return
+        try:
+            self.writer.close()
+            if os.path.exists(self.filename):
+                convert_to_csv(self.filename)
+                os.remove(self.filename)
+        except (OSError, ValueError) as err:
+            print(f"Could not write {self.filename}: {err}")
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -107,4 +109,5 @@ if __name__ == "__main__":
     finally:
         streamer.stop_streaming()
         streamer.disconnect()
+        streamer.close()
         print(f"Total Samples Streamed: {streamer.samples}")
@@ -8,19 +8,30 @@ import os
 import sys
 import os
 sys.path.append("/hdd/side_projects/imu_project/MetaWear-SDK-Python")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data_analysis"))
 
-from mbientlab.metawear import MetaWear, libmetawear, parse_value
+from mbientlab.metawear import MetaWear, libmetawear
 from mbientlab.metawear.cbindings import *
 import yaml
 from threading import Event, Thread
-from queue import Queue
 import numpy as np
 from time import sleep, strftime
 from datetime import datetime
 # from utils import convert_millis_to_datetime
-from imusensor.filters.kalman import Kalman
 from datetime import datetime
-from collections import deque
+from session_cache import SessionCache, folder_csv_files
+from frame_schema import compact_frame
+from chunked_processing import aligned_chunks, StreamingInterpolator, ChunkWriter, DEFAULT_CHUNK_ROWS
+from resampling import resample_sensors, DEFAULT_MAX_GAP_MS
+from orientation import StreamingKalman, kalman_roll_pitch, kalman_yaw, timestamps_to_dt
+from sample_writer import SampleWriter, convert_to_csv
+from fast_handlers import SampleRing, make_handler
+
+# bump the version whenever process_folder output changes, so cached sessions are rebuilt
+FOLDER_PROCESSING_PARAMS = {'step': 'process_folder', 'version': 4}
+
+# mag max gap relative to the acc/gyro one when resampling (mag preset ~25 Hz vs 100 Hz)
+MAG_GAP_FACTOR = 4
 
 # Define vertices and edges for the cube
 # vertices = (
@@ -112,11 +123,13 @@ def draw_cube():
     glLineWidth(1.0)  # Reset line width
 
 class IMUState:
-    def __init__(self, device):
+    def __init__(self, device, capacity=1024):
         self.device = device
-        self.acc_queue = Queue()
-        self.gyro_queue = Queue()
-        self.mag_queue = Queue()
+        # one fixed-size ring per sensor, filled by the handlers and drained by process_sensor_data;
+        # 1024 samples is over a second at 800 Hz
+        self.acc_ring = SampleRing("accelerometer", capacity)
+        self.gyro_ring = SampleRing("gyroscope", capacity)
+        self.mag_ring = SampleRing("magnetometer", capacity)
         self.should_stop = False
         
         # Current orientation state
@@ -124,27 +137,21 @@ class IMUState:
         self.curr_pitch = 0
         self.curr_yaw = 0
         
-        # Initialize Kalman filter
-        self.kalman_filter = Kalman()
-        self.last_update = datetime.now()
+        # Kalman filter fed one frame's batch at a time, dt from the board epochs
+        self.kalman_filter = StreamingKalman(unit='ms')
+        # drained samples whose acc / gyro partner has not been drained yet
+        self.pending_acc = self.acc_ring.drain()
+        self.pending_gyro = self.gyro_ring.drain()
         
         # Create handlers
-        self.acc_handler = self.create_handler("acc")
-        self.gyro_handler = self.create_handler("gyro")
-        self.mag_handler = self.create_handler("mag")
-        
-    def create_handler(self, sensor_type):
-        """Create a data handler for the specified sensor type"""
-        def data_handler(ctx, ptr):
-            data = parse_value(ptr)
-            timestamp = datetime.now()
-            if sensor_type == "acc":
-                self.acc_queue.put((sensor_type, timestamp, data.x, data.y, data.z))
-            elif sensor_type == "gyro":
-                self.gyro_queue.put((sensor_type, timestamp, data.x, data.y, data.z))
-            elif sensor_type == "mag":
-                self.mag_queue.put((sensor_type, timestamp, data.x, data.y, data.z))
-        return FnVoid_VoidP_DataP(data_handler)
+        self.acc_handler = make_handler(self.acc_ring, "accelerometer")
+        self.gyro_handler = make_handler(self.gyro_ring, "gyroscope")
+        self.mag_handler = make_handler(self.mag_ring, "magnetometer")
+
+    @property
+    def dropped(self):
+        """Samples overwritten before process_sensor_data got to them, per sensor"""
+        return {ring.signal: ring.dropped for ring in (self.acc_ring, self.gyro_ring, self.mag_ring)}
 
 def setup_sensors(device, state):
     """Configure and start the IMU sensors"""
@@ -214,6 +221,7 @@ def cleanup_sensors(device, state):
     libmetawear.mbl_mw_gyro_bmi270_disable_rotation_sampling(device.board)
     libmetawear.mbl_mw_mag_bmm150_stop(device.board)
     libmetawear.mbl_mw_mag_bmm150_disable_b_field_sampling(device.board)
+    print(f"Samples dropped by the viewer: {state.dropped}")
     
     # Reset device
     e = Event()
@@ -221,48 +229,54 @@ def cleanup_sensors(device, state):
     libmetawear.mbl_mw_debug_reset(device.board)
     e.wait()
 
+def pair_by_epoch(acc, gyro, max_pending):
+    """
+    Accelerometer and gyroscope samples with the same board epoch, the live
+    counterpart of merge_acc_gyro's inner join.
+
+    Samples newer than the last epoch both sensors have reached may still get a
+    partner in the next drain, so they are handed back as pending instead of
+    being dropped (at most max_pending of each, should one sensor stop).
+
+    Returns:
+        (acc_pairs, gyro_pairs, acc_pending, gyro_pending): the pairs in epoch order
+    """
+    if len(acc) == 0 or len(gyro) == 0:
+        return acc[:0], gyro[:0], acc[-max_pending:], gyro[-max_pending:]
+    cutoff = min(acc['epoch'][-1], gyro['epoch'][-1])
+    acc_done = np.searchsorted(acc['epoch'], cutoff, side='right')
+    gyro_done = np.searchsorted(gyro['epoch'], cutoff, side='right')
+    _, acc_index, gyro_index = np.intersect1d(acc['epoch'][:acc_done], gyro['epoch'][:gyro_done],
+                                              return_indices=True)
+    return acc[acc_index], gyro[gyro_index], acc[acc_done:][-max_pending:], gyro[gyro_done:][-max_pending:]
+
 def process_sensor_data(state):
-    """Process available sensor data and update orientation"""
-    acc_data = None
-    gyro_data = None
-    mag_data = None
-    # print("Processing sensor data")
-    
-    # Get latest data from each sensor
-    if not state.acc_queue.empty():
-        acc_data = state.acc_queue.get()
-    if not state.gyro_queue.empty():
-        gyro_data = state.gyro_queue.get()
-    if not state.mag_queue.empty():
-        mag_data = state.mag_queue.get()
-    # print("Sensor data retrieved")
-    # Update orientation if we have both accelerometer and gyroscope data
-    if acc_data and gyro_data:
-        current_time = datetime.now()
-        dt = (current_time - state.last_update).total_seconds()
-        state.last_update = current_time
-        
-        # Update Kalman filter with new data
-        state.kalman_filter.computeAndUpdateRollPitch(
-            acc_data[2],   # x_acc
-            acc_data[3],   # y_acc
-            acc_data[4],   # z_acc
-            gyro_data[2],  # x_gyro
-            gyro_data[3],  # y_gyro
-            dt
-        )
-        
-        # Get filtered orientation
-        state.curr_roll = state.kalman_filter.roll
-        state.curr_pitch = state.kalman_filter.pitch
-        print(f"Filtered orientation: {state.curr_roll}, {state.curr_pitch}")
-        
-        # Calculate yaw using magnetometer if available
-        if mag_data:
-            # Simple yaw calculation - could be improved with proper sensor fusion
-            state.curr_yaw = np.arctan2(mag_data[3], mag_data[2]) * 180.0 / np.pi
-            print(f"Yaw: {state.curr_yaw}")
-    # print("Orientation updated")
+    """
+    Drain every sample that arrived since the last frame and update the orientation.
+
+    Acc and gyro samples are paired by board epoch and the whole frame's batch goes
+    through the Kalman filter at once, with each step's dt taken from the epochs, so
+    the filter follows the sensor rate (100-800 Hz) whatever the frame rate is.
+    """
+    acc_samples = np.concatenate((state.pending_acc, state.acc_ring.drain()))
+    gyro_samples = np.concatenate((state.pending_gyro, state.gyro_ring.drain()))
+    mag_samples = state.mag_ring.drain()
+
+    acc_pairs, gyro_pairs, state.pending_acc, state.pending_gyro = pair_by_epoch(
+        acc_samples, gyro_samples, state.acc_ring.capacity)
+    if len(acc_pairs):
+        roll, pitch = state.kalman_filter.update(acc_pairs['x'], acc_pairs['y'], acc_pairs['z'],
+                                                 gyro_pairs['x'], gyro_pairs['y'], acc_pairs['epoch'])
+        state.curr_roll = roll[-1]
+        state.curr_pitch = pitch[-1]
+        print(f"Filtered orientation: {state.curr_roll}, {state.curr_pitch} ({len(acc_pairs)} samples)")
+
+    # Calculate yaw using magnetometer if available
+    if len(mag_samples):
+        # Simple yaw calculation - could be improved with proper sensor fusion
+        mag_data = mag_samples[-1]
+        state.curr_yaw = np.arctan2(mag_data['y'], mag_data['x']) * 180.0 / np.pi
+        print(f"Yaw: {state.curr_yaw}")
  
 
 
@@ -271,13 +285,15 @@ def process_sensor_data(state):
 class SensorFusionStreamer:
     def __init__(self, device_mac, run_directory=None, write_to_file=False):
         self.device = MetaWear(device_mac)
-        if not write_to_file:
-            self.run_directory = run_directory
-            self.filename = os.path.join(run_directory, f"sensor_fusion_stream-{strftime('%Y%m%d-%H%M%S')}.csv")
-            self.file = None
-        self.callback = FnVoid_VoidP_DataP(self.data_handler)
-        self.samples = 0
-        self.orientation = deque(maxlen=20)
+        self.run_directory = run_directory
+        self.filename = None
+        if write_to_file:
+            self.filename = os.path.join(run_directory, f"sensor_fusion_stream-{strftime('%Y%m%d-%H%M%S')}.bin")
+        # samples go to the .bin writer when writing to file, else to the ring get_orientation reads
+        self.writer = None
+        self.orientation = None
+        self.callback = None
+        self.data_signal = SensorFusionData.QUATERNION
         self.write_to_file = write_to_file
 
     def connect(self):
@@ -304,48 +320,51 @@ class SensorFusionStreamer:
         # Determine data type based on config
         data_type = config['sensor_fusion'].get('preset', 'Quaternion').upper()
         if data_type == 'EULER':
-            data_signal = SensorFusionData.EULER_ANGLE
+            self.data_signal, signal_name = SensorFusionData.EULER_ANGLE, 'euler_angle'
+        else:
+            self.data_signal, signal_name = SensorFusionData.QUATERNION, 'quaternion'
+        if self.write_to_file:
+            self.writer = SampleWriter(self.filename, signal_name)
+            self.callback = make_handler(self.writer, signal_name)
         else:
-            data_signal = SensorFusionData.QUATERNION
+            self.orientation = SampleRing(signal_name, capacity=20)
+            self.callback = make_handler(self.orientation, signal_name)
         
-        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, data_signal)
+        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, self.data_signal)
         libmetawear.mbl_mw_datasignal_subscribe(signal, None, self.callback)
-        libmetawear.mbl_mw_sensor_fusion_enable_data(self.device.board, data_signal)
+        libmetawear.mbl_mw_sensor_fusion_enable_data(self.device.board, self.data_signal)
         libmetawear.mbl_mw_sensor_fusion_start(self.device.board)
 
-    def data_handler(self, ctx, data):
-        parsed_data = parse_value(data)
-        print (parsed_data)
-        if self.write_to_file:
-            if self.file is None:
-                self.file = open(self.filename, 'w')
-                
-            # TODO: for now checking hasattr. Need to find a better way to do this
-            if hasattr(parsed_data, 'w'):
-                self.file.write("epoch,w,x,y,z\n")
-                self.file.write(f"{data.contents.epoch},{parsed_data.w},{parsed_data.x},{parsed_data.y},{parsed_data.z}\n")
-            else:
-                self.file.write("epoch,heading,pitch,roll,yaw\n")
-                self.file.write(f"{data.contents.epoch},{parsed_data.heading},{parsed_data.pitch},{parsed_data.roll},{parsed_data.yaw}\n")
-        else:
-            self.orientation.append((parsed_data.heading, parsed_data.roll, parsed_data.pitch, parsed_data.yaw))
-        self.samples += 1
+    @property
+    def samples(self):
+        if self.writer is not None:
+            return self.writer.samples
+        return self.orientation.count if self.orientation is not None else 0
 
     def stop_streaming(self):
         libmetawear.mbl_mw_sensor_fusion_stop(self.device.board)
-        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, SensorFusionData.QUATERNION)
+        signal = libmetawear.mbl_mw_sensor_fusion_get_data_signal(self.device.board, self.data_signal)
         libmetawear.mbl_mw_datasignal_unsubscribe(signal)
 
     def disconnect(self):
         libmetawear.mbl_mw_debug_disconnect(self.device.board)
 
-    def __del__(self):
-        if self.file is not None:
-            self.file.close()
+    def close(self):
+        """Write out the buffered samples and convert them to CSV, when writing to file"""
+        if self.writer is None:
+            return
+        try:
+            self.writer.close()
+            if os.path.exists(self.filename):
+                convert_to_csv(self.filename)
+                os.remove(self.filename)
+        except (OSError, ValueError) as err:
+            print(f"Could not write {self.filename}: {err}")
             
     def get_orientation(self):
-        _, roll, pitch, yaw = self.orientation[-1]
-        return roll, pitch, yaw
+        """roll, pitch, yaw of the latest euler_angle sample"""
+        sample = self.orientation.latest(1)[0]
+        return sample['roll'], sample['pitch'], sample['yaw']
 
 
 
@@ -397,36 +416,133 @@ def convert_millis_to_datetime(millis):
     formatted_time = dt.strftime('%Y-%m-%d %H:%M:%S')
     return formatted_time
 
-def get_kalman_orientation(row, kalman_filter):
-    kalman_filter.computeAndUpdateRollPitchYaw(row['x_acc'], row['y_acc'], row['z_acc'], 
-                                            row['x_gyro'], row['y_gyro'], row['z_gyro'],
-                                            row['x'], row['y'], row['z'],
-                                            10)
-    roll = kalman_filter.roll
-    pitch = kalman_filter.pitch
-    yaw = kalman_filter.yaw
-    return roll, pitch, yaw
-
-def process_folder(folder_path):
+def process_folder(folder_path, cache=None, resample_hz=None, max_gap_ms=DEFAULT_MAX_GAP_MS):
+    """
+    Orientation of a recorded acc/gyro/mag folder, through the cache if given.
+
+    The frame is always in the compact schema of frame_schema (float32 axes and
+    angles), whether it was computed, read from the cache or no cache is used.
+    """
+    source_files = folder_csv_files(folder_path)
+    params = FOLDER_PROCESSING_PARAMS
+    if resample_hz:
+        params = {**params, 'resample_hz': resample_hz, 'max_gap_ms': max_gap_ms, 'mag_gap_factor': MAG_GAP_FACTOR}
+    if cache is not None:
+        merged_df = cache.get(source_files, params)
+        if merged_df is not None:
+            return merged_df
+    
     csv_files = sorted([f for f in os.listdir(folder_path) if f.endswith('.csv') ])
     acc_df = pd.read_csv(os.path.join(folder_path, csv_files[0]))
     gyro_df = pd.read_csv(os.path.join(folder_path, csv_files[1]))
     mag_df = pd.read_csv(os.path.join(folder_path, csv_files[2]))
     # mag_df['timestamp'] = mag_df['epoch'].apply(convert_millis_to_datetime)
+    if resample_hz:
+        merged_df = compact_frame(resample_folder(acc_df, gyro_df, mag_df, resample_hz, max_gap_ms))
+        if cache is not None:
+            cache.put(source_files, merged_df, params)
+        return merged_df
     
-    merged_df = pd.merge(acc_df, gyro_df, on='epoch', how='inner', suffixes=('_acc', '_gyro'))
+    merged_df = pd.merge(acc_df, gyro_df, on='epoch', how='inner', suffixes=('_acc', '_gyro'), sort=True)
     merged_df = pd.merge(merged_df, mag_df, on='epoch', how='outer')
     merged_df.interpolate(method='linear', inplace=True)
-    merged_df.dropna(inplace=True)
     
     # mag df is low frequency, so we need to extraplolate it. 
     
-    Kalman_filter = Kalman()
-    merged_df['roll'], merged_df['pitch'], merged_df['yaw'] = zip(*merged_df.apply(lambda row: get_kalman_orientation(row, Kalman_filter), axis=1))
+    merged_df = compact_frame(_orientation_chunk(merged_df, StreamingKalman(unit='ms')))
+    if cache is not None:
+        cache.put(source_files, merged_df, FOLDER_PROCESSING_PARAMS)
+    return merged_df
+
+def resample_folder(acc_df, gyro_df, mag_df, resample_hz, max_gap_ms=DEFAULT_MAX_GAP_MS):
+    """
+    Orientation from acc, gyro and mag interpolated onto one uniform clock.
+
+    Replaces the exact-epoch join + whole-frame interpolation of process_folder:
+    every sensor is resampled on its own and grid points without data nearby are
+    flagged in 'gap' and get NaN angles instead of bridged values.
+    """
+    # the magnetometer runs at a fraction of the acc/gyro rate, allow it proportionally longer gaps
+    max_gaps = {'acc': max_gap_ms, 'gyro': max_gap_ms, 'mag': MAG_GAP_FACTOR * max_gap_ms}
+    merged_df = resample_sensors({'acc': acc_df, 'gyro': gyro_df, 'mag': mag_df}, resample_hz, max_gaps,
+                                 time_column='epoch', suffixes={'mag': ''})
+    merged_df['roll'] = np.nan
+    merged_df['pitch'] = np.nan
+    merged_df['yaw'] = np.nan
+    valid = ~merged_df['gap'].to_numpy()
+    if valid.any():
+        rows = merged_df[valid]
+        # dt in seconds from the grid epochs: 1 / resample_hz, and the real length across a gap
+        dt = timestamps_to_dt(rows['epoch'].to_numpy(), 'ms')
+        acc = (rows['x_acc'].to_numpy(), rows['y_acc'].to_numpy(), rows['z_acc'].to_numpy())
+        roll, pitch = kalman_roll_pitch(*acc, rows['x_gyro'].to_numpy(), rows['y_gyro'].to_numpy(), dt)
+        yaw = kalman_yaw(*acc, rows['z_gyro'].to_numpy(), rows['x'].to_numpy(), rows['y'].to_numpy(),
+                         rows['z'].to_numpy(), dt)
+        merged_df.loc[valid, ['roll', 'pitch', 'yaw']] = np.column_stack([roll, pitch, yaw])
+    merged_df['timestamp'] = pd.to_datetime(merged_df['epoch'].apply(convert_millis_to_datetime))
+    return merged_df
+
+def _orientation_chunk(merged_df, kalman_filter):
+    """Roll, pitch and yaw of the complete rows of merged_df, continuing kalman_filter (a StreamingKalman)"""
+    merged_df = merged_df.dropna()
+    if len(merged_df) == 0:
+        return merged_df
+    columns = {column: merged_df[column].to_numpy() for column in merged_df.columns}
+    merged_df['roll'], merged_df['pitch'], merged_df['yaw'] = kalman_filter.update(
+        columns['x_acc'], columns['y_acc'], columns['z_acc'], columns['x_gyro'], columns['y_gyro'], columns['epoch'],
+        gz=columns['z_gyro'], mag=(columns['x'], columns['y'], columns['z']))
     merged_df['timestamp'] = merged_df['epoch'].apply(convert_millis_to_datetime)
     merged_df['timestamp'] = pd.to_datetime(merged_df['timestamp'])
     return merged_df
 
+def iter_folder_chunks(folder_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Bounded-memory version of process_folder.
+
+    The acc, gyro and mag CSVs are read side by side in epoch-aligned chunks. The
+    mag interpolation and the Kalman filter carry their state across chunk
+    boundaries, so concatenating the yielded chunks gives the same rows as
+    process_folder while memory only depends on chunk_rows.
+    """
+    csv_files = folder_csv_files(folder_path)[:3]
+    interpolator = StreamingInterpolator()
+    kalman_filter = StreamingKalman(unit='ms')
+    empty = None
+    pending = None
+    for (acc_df, gyro_df, mag_df), done in aligned_chunks(csv_files, 'epoch', chunk_rows, with_done=True):
+        merged_df = pd.merge(acc_df, gyro_df, on='epoch', how='inner', suffixes=('_acc', '_gyro'), sort=True)
+        merged_df = pd.merge(merged_df, mag_df, on='epoch', how='outer')
+        empty = merged_df.iloc[0:0]
+        # once the mag file has ended, its columns are not waited on any more
+        mag_columns = [column for column in mag_df.columns if column != 'epoch'] if done[2] else []
+        ready = interpolator.push(merged_df, exhausted=mag_columns).dropna()
+        if pending is not None:
+            ready = pd.concat([pending, ready], ignore_index=True)
+            pending = None
+        if kalman_filter.last_timestamp is None and len(ready) < 2:
+            # the first dt of a session is taken from its second sample
+            pending = ready
+            continue
+        yield _orientation_chunk(ready, kalman_filter)
+    if empty is not None:
+        ready = interpolator.push(empty, final=True).dropna()
+        if pending is not None:
+            ready = pd.concat([pending, ready], ignore_index=True)
+        yield _orientation_chunk(ready, kalman_filter)
+
+def process_folder_chunked(folder_path, output_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Stream a folder through iter_folder_chunks into a .parquet or .csv file, returns the row count"""
+    writer = ChunkWriter(output_path)
+    n_rows = 0
+    try:
+        for chunk in iter_folder_chunks(folder_path, chunk_rows):
+            if len(chunk):
+                writer.write(chunk)
+                n_rows += len(chunk)
+    finally:
+        writer.close()
+    return n_rows
+
 def load_config(config_file):
     with open(config_file, 'r') as f:
         return yaml.safe_load(f)
@@ -557,6 +673,7 @@ def main():
     # merged_df = process_folder("data/test_18")
     streamer.stop_streaming()
     streamer.disconnect()
+    streamer.close()
     # process_sensor_data(state)
     
     # displayCube(merged_df)
@@ -572,14 +689,35 @@ def main():
 
 
 
-if __name__ == "__main__":
-    # parser = argparse.ArgumentParser(description='Display a rotating cube using roll and pitch from a CSV file.')
-    # parser.add_argument('--folder-path', type=str, help='Path to the folder containing acc, gyro, and mag csv files')
-    # args = parser.parse_args()
+def command_line_args():
+    parser = argparse.ArgumentParser(description='Display a rotating cube from the live sensor, or replay a recorded folder')
+    parser.add_argument('--folder-path', type=str, default=None, help='Replay the acc, gyro, and mag csv files in this folder instead of streaming')
+    parser.add_argument('--cache-folder', type=str, default=None, help='Folder for cached processed sessions')
+    parser.add_argument('--chunk-output', type=str, default=None, help='Stream the folder in chunks into this .parquet/.csv file instead of loading it whole')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Rows per chunk for --chunk-output')
+    parser.add_argument('--resample-hz', type=float, default=None, help='Resample acc/gyro/mag onto a uniform clock at this rate (not with --chunk-output)')
+    return parser.parse_args()
+
+
+def replay_folder(args):
+    """Process a recorded folder (through the cache if given) and display its orientation, or stream it to --chunk-output"""
+    if args.chunk_output:
+        if args.resample_hz:
+            print("--resample-hz is not supported with --chunk-output")
+            return
+        n_rows = process_folder_chunked(args.folder_path, args.chunk_output, args.chunk_rows)
+        print(f"Wrote {n_rows} rows to {args.chunk_output}")
+        return
+    cache = SessionCache(args.cache_folder) if args.cache_folder else None
+    merged_df = process_folder(args.folder_path, cache, resample_hz=args.resample_hz)
+    if cache is not None:
+        cache.close()
+    displayCube(merged_df)
 
-    # # Read the CSV file into a DataFrame
-    # merged_df = process_folder(args.folder_path)
 
-    # # Call the displayCube function with the DataFrame
-    # displayCube(merged_df) 
-    main()
\ No newline at end of file
+if __name__ == "__main__":
+    args = command_line_args()
+    if args.folder_path:
+        replay_folder(args)
+    else:
+        main()
@@ -0,0 +1,132 @@
+import pandas as pd
+from rolling_iqr import grouped_iqr
+from plot_rendering import reusable_figure, save_figure, decimate
+from instrumentation import instrumented
+
+
+@instrumented('plot')
+def plot_imu_garmin_comparison(imu_dfs, garmin_df, save_path= None):
+    """
+    Plot comparison between IMU and Garmin data for multiple IMU dataframes.
+    
+    Args:
+        imu_dfs (list): List of IMU dataframes, or summaries from summarize_s3_folder
+        garmin_df (pd.DataFrame): Garmin dataframe with power and cadence data
+        save_path (str, optional): Path to save the plot. If None, plot is only displayed
+    """
+    # Create figure with subplots; saved plots reuse one off-screen figure per process
+    n_plots = len(imu_dfs)
+    if save_path:
+        fig, axes = reusable_figure('imu_garmin_comparison', n_plots)
+    else:
+        # pyplot (and its GUI backend) is only loaded for interactive plots
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(n_plots, 1, figsize=(12, 6*n_plots))
+        # If there's only one plot, make axes a list for consistency
+        if n_plots == 1:
+            axes = [axes]
+    
+    for idx, imu_df in enumerate(imu_dfs):
+        if isinstance(imu_df, dict):
+            # summary from summarize_s3_folder, already aggregated
+            start_timestamp, end_timestamp = imu_df['start'], imu_df['end']
+            imu_df_grouped = imu_df['iqr']
+        else:
+            start_timestamp = imu_df['timestamp'].iloc[0]
+            end_timestamp = imu_df['timestamp'].iloc[-1]
+            columns = ['roll', 'pitch']
+            # IQR of the IMU data per 5-second interval
+            imu_df_grouped = grouped_iqr(imu_df, 'timestamp', columns, '5s')
+        # Filter Garmin data for this IMU dataframe's time range
+        garmin_df_filtered = garmin_df[(garmin_df['timestamp'] >= start_timestamp) & 
+                                     (garmin_df['timestamp'] <= end_timestamp)]
+        
+        # Get current axis
+        ax1 = axes[idx]
+        
+        garmin_df_filtered['speed_kmh'] = garmin_df_filtered['enhanced_speed'] * 3.6
+        
+        # 5 seconds aggregate for garmin data
+        garmin_df_filtered = garmin_df_filtered.groupby(pd.Grouper(key='timestamp', freq='5s'))[['speed_kmh', 'heart_rate']].mean()
+        
+        # Plot power and cadence on left y-axis
+        ax1.plot(*decimate(garmin_df_filtered.index, garmin_df_filtered['speed_kmh']), 'b-', label='Speed')
+        ax1.plot(*decimate(garmin_df_filtered.index, garmin_df_filtered['heart_rate']), 'g-', label='HR')
+        ax1.set_xlabel('Time')
+        ax1.set_ylabel('Speed (km/h) / HR (BPM)', color='b')
+        ax1.tick_params(axis='y', labelcolor='b')
+        
+        # Create second y-axis for roll and pitch
+        ax2 = ax1.twinx()
+        ax2.plot(*decimate(imu_df_grouped.index, imu_df_grouped['roll']), 'r-',
+                 label=f'Roll {imu_df_grouped["roll"].mean():.2f}')
+        ax2.plot(*decimate(imu_df_grouped.index, imu_df_grouped['pitch']), 'm-',
+                 label=f'Pitch {imu_df_grouped["pitch"].mean():.2f}')
+        ax2.set_ylabel('Roll/Pitch (degrees)', color='r')
+        ax2.tick_params(axis='y', labelcolor='r')
+        ax2.set_ylim(0, 30)  # Set y-axis limits for roll and pitch
+        
+        # Make grid lines more visible
+        ax1.grid(True, linestyle='--', alpha=0.7)
+        ax2.grid(True, linestyle='--', alpha=0.7)
+        
+        # Add legend
+        lines1, labels1 = ax1.get_legend_handles_labels()
+        lines2, labels2 = ax2.get_legend_handles_labels()
+        ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper right')
+        
+        # Format x-axis
+        ax1.tick_params(axis='x', labelrotation=45)
+        
+        # Add title for each subplot
+        ax1.set_title(f'IMU Data {idx+1} {start_timestamp}')
+    
+    # Adjust layout
+    fig.tight_layout()
+    
+    # Show plot
+    if save_path:
+        save_figure(fig, save_path)
+    else:
+        plt.show()
+        
+@instrumented('plot')
+def analyze_frame_rates(imu_dfs, save_path=None):
+    """
+    Analyze and plot frame rates for multiple IMU dataframes.
+    
+    Args:
+        imu_dfs (list): List of pandas DataFrames containing IMU data, or summaries from summarize_s3_folder
+        save_path (str, optional): Path to save the plot. If None, plot is only displayed
+    """
+    n_dfs = len(imu_dfs)
+    if save_path:
+        fig, axes = reusable_figure('frame_rates', n_dfs)
+    else:
+        import matplotlib.pyplot as plt
+        fig, axes = plt.subplots(n_dfs, 1, figsize=(12, 6*n_dfs))
+        if n_dfs == 1:
+            axes = [axes]
+    
+    for idx, (df, ax) in enumerate(zip(imu_dfs, axes)):
+        # Calculate frame rate
+        if isinstance(df, dict):
+            frame_rate, start_time = df['frame_rate'], df['start']
+        else:
+            frame_rate = df.groupby(pd.Grouper(key='timestamp', freq='1s')).size()
+            start_time = df['timestamp'].iloc[0]
+        
+        # Plot frame rate
+        ax.plot(*decimate(frame_rate.index, frame_rate.to_numpy()))
+        start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
+        ax.set_title(f'IMU Frame Rate Analysis - Start: {start_time}')
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Samples per Second')
+        ax.grid(True)
+    
+    fig.tight_layout()
+    
+    if save_path:
+        save_figure(fig, save_path)
+    else:
+        plt.show()
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import time
+import traceback
+from session_cache import file_sha1
+
+
+class ArtifactStore:
+    """
+    Manifest of the artifacts a pipeline built and what they were built from.
+
+    For every artifact (a task name) the manifest keeps a signature of its input
+    files and parameters and the list of files it wrote. An artifact is current
+    while its outputs exist and the signature of its inputs is unchanged. Input
+    files are fingerprinted by size, mtime and SHA1 like SessionCache does, and the
+    hash is only recomputed when size or mtime change, so checking an unchanged
+    archive costs one stat per file.
+    """
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.manifest = {'fingerprints': {}, 'artifacts': {}}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Artifact manifest unreadable, rebuilding everything: {e}")
+
+    def fingerprint(self, file_path):
+        """[size, mtime_ns, sha1] of a file, or None if it does not exist"""
+        file_path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        known = self.manifest['fingerprints'].get(file_path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known
+        fingerprint = [stat.st_size, stat.st_mtime_ns, file_sha1(file_path)]
+        self.manifest['fingerprints'][file_path] = fingerprint
+        return fingerprint
+
+    def signature(self, inputs, params=None):
+        """SHA1 over the content hashes of the input files and the parameters"""
+        parts = []
+        for path in sorted(inputs):
+            fingerprint = self.fingerprint(path)
+            parts.append([os.path.abspath(path), fingerprint[2] if fingerprint else None])
+        payload = json.dumps({'inputs': parts, 'params': params or {}}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def is_current(self, name, signature):
+        """True if `name` was built from inputs with this signature and all its outputs still exist"""
+        artifact = self.manifest['artifacts'].get(name)
+        if artifact is None or not all(os.path.exists(path) for path in artifact['outputs']):
+            return False
+        return artifact['signature'] == signature
+
+    def record(self, name, signature, outputs=()):
+        """Remember that `name` was built from inputs with this signature (taken before building)"""
+        self.manifest['artifacts'][name] = {'signature': signature,
+                                            'outputs': [os.path.abspath(path) for path in outputs],
+                                            'built': time.time()}
+
+    def forget(self, name):
+        self.manifest['artifacts'].pop(name, None)
+
+    def save(self):
+        if os.path.dirname(self.manifest_path):
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+
+class Task:
+    """
+    One step of a Pipeline.
+
+    Args:
+        name (str): unique task name, also the artifact name in the manifest
+        fn (callable): fn(*results of deps) does the work; its return value is
+            passed on to the tasks depending on this one
+        deps (list): names of the tasks that have to run first
+        inputs (list or callable): input files; a callable is evaluated once the
+            deps have run, for inputs that a dependency creates or lists
+        params (dict): parameters the outputs depend on
+        outputs (list): files the task writes
+        load (callable, optional): load() returns the result of a task that is
+            skipped because it is current, for tasks other tasks depend on
+        always (bool): run on every pipeline run, e.g. syncing with a remote
+    """
+    def __init__(self, name, fn, deps=(), inputs=(), params=None, outputs=(), load=None, always=False):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.inputs = inputs
+        self.params = params or {}
+        self.outputs = list(outputs)
+        self.load = load
+        self.always = always
+
+
+class Pipeline:
+    """
+    A small task graph that only runs the tasks whose inputs changed.
+
+    Tasks run in dependency order. A task is skipped when its artifact is current
+    in the store, and rerun when an input file or parameter changed, an output was
+    deleted, or force is set. A failed task blocks the tasks depending on it and
+    is not recorded, so it is retried next run.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.tasks = {}
+
+    def add(self, task):
+        self.tasks[task.name] = task
+        return task
+
+    def _order(self):
+        order, state = [], {}
+
+        def visit(name):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Task graph has a cycle through {name}")
+            state[name] = 'visiting'
+            for dep in self.tasks[name].deps:
+                visit(dep)
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name)
+        return order
+
+    def run(self, force=False):
+        """
+        Run the graph.
+
+        Returns:
+            dict: task name -> {'status': 'ran', 'skipped', 'failed' or 'blocked',
+            'seconds', 'error'}; the results of the tasks are in self.results
+        """
+        self.results = {}
+        report = {}
+        for name in self._order():
+            task = self.tasks[name]
+            start_time = time.time()
+            if any(report[dep]['status'] in ('failed', 'blocked') for dep in task.deps):
+                report[name] = {'status': 'blocked', 'seconds': 0.0, 'error': None}
+                continue
+            inputs = task.inputs() if callable(task.inputs) else task.inputs
+            signature = self.store.signature(inputs, task.params)
+            if not (force or task.always) and self.store.is_current(name, signature):
+                self.results[name] = task.load() if task.load else None
+                report[name] = {'status': 'skipped', 'seconds': round(time.time() - start_time, 3), 'error': None}
+                continue
+            try:
+                self.results[name] = task.fn(*[self.results[dep] for dep in task.deps])
+            except Exception:
+                self.store.forget(name)
+                report[name] = {'status': 'failed', 'seconds': round(time.time() - start_time, 3),
+                                'error': traceback.format_exc()}
+                print(f"Task {name} failed:\n{report[name]['error']}")
+                continue
+            if not task.always:
+                self.store.record(name, signature, task.outputs)
+            report[name] = {'status': 'ran', 'seconds': round(time.time() - start_time, 3), 'error': None}
+        self.store.save()
+        return report
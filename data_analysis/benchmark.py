@@ -0,0 +1,337 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # no rusage on Windows, peak RSS is reported as None there
+    resource = None
+
+# stages whose throughput may drop, or peak RSS grow, this much before a run counts as a regression
+DEFAULT_TOLERANCE = 0.15
+
+# entry points whose import time is measured; a cron run that finds nothing new spends most
+# of its time importing, so none of them may load a HEAVY_MODULES module at import time
+IMPORT_TARGETS = ['data_syncing', 'utils']
+HEAVY_MODULES = ['pandas', 'matplotlib', 'boto3', 'botocore', 'requests', 'fitparse', 'intervalsicu',
+                 'imusensor', 'pyarrow', 'scipy']
+# import times are a few tens of ms, below this growth a relative change is noise
+IMPORT_SLACK_S = 0.05
+
+# run in a fresh interpreter by measure_import
+_IMPORT_SNIPPET = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'seconds': seconds, 'heavy_modules': heavy}}))
+'''
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _archive_files(archive):
+    garmin_folder = archive['garmin_data_folder']
+    fit_files = sorted(os.path.join(garmin_folder, f) for f in os.listdir(garmin_folder) if f.endswith('.fit'))
+    return fit_files, sorted(archive['sessions'])
+
+
+def stage_fit_to_csv(archive, work_folder):
+    from utils import IntervalsAPI
+    intervals_api = IntervalsAPI('', '', '')
+    fit_files, _ = _archive_files(archive)
+    n_records = 0
+    for fit_path in fit_files:
+        csv_path = os.path.join(work_folder, os.path.basename(fit_path).replace(".fit", ".csv"))
+        intervals_api.fit_to_csv(fit_path, csv_path)
+        n_records += sum(1 for _ in open(csv_path)) - 1
+    return n_records
+
+
+def _acc_gyro_samples(archive):
+    """Input samples of the processing stages: accelerometer plus gyroscope rows"""
+    return sum(n['accelerometer'] + n['gyroscope'] for n in archive['session_samples'].values())
+
+
+def stage_process_s3_folder(archive, work_folder):
+    from utils import process_s3_folder
+    _, sessions = _archive_files(archive)
+    for session in sessions:
+        process_s3_folder(os.path.dirname(session), os.path.basename(session))
+    return _acc_gyro_samples(archive)
+
+
+def stage_summarize_s3_folder(archive, work_folder):
+    from utils import summarize_s3_folder
+    _, sessions = _archive_files(archive)
+    for session in sessions:
+        summarize_s3_folder(os.path.dirname(session), os.path.basename(session))
+    return _acc_gyro_samples(archive)
+
+
+def stage_match_data(archive, work_folder):
+    from data_syncing import match_data
+    config = {'garmin_data_folder': archive['garmin_data_folder'],
+              's3_data_folder': os.path.dirname(archive['imu_folder']),
+              'analysis_data_folder': work_folder}
+    match_data(config)
+    fit_files, sessions = _archive_files(archive)
+    return len(fit_files) + len(sessions)
+
+
+def stage_plot(archive, work_folder):
+    """Processing is not timed here, it is done before the stage clock starts (see _run_stage)"""
+    from utils import plot_imu_garmin_comparison, analyze_frame_rates
+    imu_dfs, garmin_df = archive['_plot_inputs']
+    plot_imu_garmin_comparison(imu_dfs, garmin_df, os.path.join(work_folder, "imu_garmin_comparison.png"))
+    analyze_frame_rates(imu_dfs, save_path=os.path.join(work_folder, "frame_rate_analysis.png"))
+    return _acc_gyro_samples(archive)
+
+
+def _plot_inputs(archive):
+    import pandas as pd
+    from plot_rendering import use_headless_backend
+    from utils import process_s3_folder, summarize_imu_df, utc_strings_to_datetime
+    use_headless_backend()
+    _, sessions = _archive_files(archive)
+    imu_dfs = [summarize_imu_df(process_s3_folder(os.path.dirname(session), os.path.basename(session)))
+               for session in sessions]
+    garmin_folder = archive['garmin_data_folder']
+    garmin_df = pd.concat([pd.read_csv(os.path.join(garmin_folder, f))
+                           for f in sorted(os.listdir(garmin_folder)) if f.endswith('.csv')])
+    garmin_df['timestamp'] = utc_strings_to_datetime(garmin_df['timestamp'])
+    return imu_dfs, garmin_df
+
+
+# stage name -> (function, unit of the samples it returns)
+STAGES = {
+    'fit_to_csv': (stage_fit_to_csv, 'records'),
+    'process_s3_folder': (stage_process_s3_folder, 'samples'),
+    'summarize_s3_folder': (stage_summarize_s3_folder, 'samples'),
+    'match_data': (stage_match_data, 'files'),
+    'plot': (stage_plot, 'samples'),
+}
+
+
+def _run_stage(name, archive, work_folder, queue):
+    """Child process: run one stage and report its timings, so peak RSS is the stage's own"""
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        # import time is not part of any stage, it is measured on its own by measure_import
+        from plot_rendering import use_headless_backend
+        use_headless_backend()
+        import data_syncing, fit_decoder, intervals_api, imu_processing, timestamps, session_health, \
+            analysis_plots, matplotlib.figure  # noqa: F401
+        if name == 'plot':
+            archive = {**archive, '_plot_inputs': _plot_inputs(archive)}
+        rss_before = _peak_rss_mb()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        samples = STAGES[name][0](archive, work_folder)
+        wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        queue.put({'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4), 'samples': samples,
+                   'samples_per_s': round(samples / wall, 1) if wall > 0 else None,
+                   'peak_rss_mb': _peak_rss_mb(), 'rss_before_mb': rss_before, 'error': None})
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+
+def run_stage(name, archive, work_folder, repeat=1):
+    """Run a stage `repeat` times in fresh processes and keep the fastest run"""
+    context = multiprocessing.get_context('spawn')
+    best = None
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(target=_run_stage, args=(name, archive, work_folder, queue))
+        process.start()
+        result = None
+        while result is None:
+            try:
+                result = queue.get(timeout=1)
+            except queue_module.Empty:
+                if not process.is_alive():
+                    # killed (e.g. out of memory) before it could report
+                    result = {'error': f"stage process exited with code {process.exitcode}"}
+        process.join()
+        if result['error'] is not None:
+            return result
+        if best is None or result['wall_s'] < best['wall_s']:
+            best = result
+    best['unit'] = STAGES[name][1]
+    return best
+
+
+def measure_import(module, repeat=5):
+    """
+    Import time of a module in fresh interpreters, the fastest of `repeat` runs.
+
+    Returns:
+        dict: 'wall_s' and 'heavy_modules', the HEAVY_MODULES the import loaded
+        ('error' instead if the import failed)
+    """
+    best = None
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-c', _IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES)],
+                                 capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if process.returncode != 0:
+            return {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'import failed'}
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['wall_s']:
+            best = {'wall_s': round(result['seconds'], 4), 'heavy_modules': result['heavy_modules'], 'error': None}
+    return best
+
+
+def import_regressions(results, baseline=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Import-time regressions: entry points loading heavy modules at import, and with a
+    baseline, imports that got slower by more than tolerance (and IMPORT_SLACK_S)
+    """
+    regressions = []
+    for module, result in results.get('imports', {}).items():
+        if result.get('error'):
+            regressions.append(f"import {module}: {result['error']}")
+            continue
+        if result['heavy_modules']:
+            regressions.append(f"import {module} loads {', '.join(result['heavy_modules'])}")
+        reference = (baseline or {}).get('imports', {}).get(module)
+        if reference and not reference.get('error') and \
+                result['wall_s'] > max(reference['wall_s'] * (1 + tolerance), reference['wall_s'] + IMPORT_SLACK_S):
+            regressions.append(f"import {module}: {result['wall_s']:.3f} s, baseline {reference['wall_s']:.3f} s")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(archive_params, stages=None, repeat=1, archive_folder=None):
+    """
+    Generate a synthetic archive (see synthetic_data.write_archive) and benchmark the stages on it,
+    and measure the import time of the IMPORT_TARGETS.
+
+    Args:
+        archive_params (dict): write_archive keyword arguments
+        stages (list, optional): stage names, all of STAGES by default
+        repeat (int): runs per stage, the fastest is reported
+        archive_folder (str, optional): where to write the archive, a temporary folder by default
+
+    Returns:
+        dict: 'meta' (revision, python, platform, archive parameters), 'imports'
+        (module -> wall_s, heavy_modules) and 'stages' (name -> wall_s, cpu_s,
+        samples, samples_per_s, peak_rss_mb, unit)
+    """
+    from synthetic_data import write_archive
+    imports = run_import_benchmarks(max(repeat, 5))
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        archive_folder = archive_folder or os.path.join(tmp_folder, 'archive')
+        archive = write_archive(archive_folder, **archive_params)
+        results = {'meta': {'revision': git_revision(), 'python': platform.python_version(),
+                            'platform': platform.platform(), 'archive': archive_params,
+                            'imu_samples': archive['imu_samples'], 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                   'imports': imports, 'stages': {}}
+        for name in stages or STAGES:
+            work_folder = os.path.join(tmp_folder, name)
+            os.makedirs(work_folder, exist_ok=True)
+            results['stages'][name] = run_stage(name, archive, work_folder, repeat)
+            print(f"{name}: {results['stages'][name]}")
+    return results
+
+
+def run_import_benchmarks(repeat=5):
+    """Import time of every IMPORT_TARGETS module, see measure_import"""
+    imports = {}
+    for module in IMPORT_TARGETS:
+        imports[module] = measure_import(module, repeat)
+        print(f"import {module}: {imports[module]}")
+    return imports
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Regressions of results against a baseline run.
+
+    Returns:
+        list: one message per stage whose throughput dropped or peak RSS grew by
+        more than tolerance (a fraction)
+    """
+    regressions = []
+    for name, stage in results['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if reference is None or stage.get('error') or reference.get('error'):
+            continue
+        if reference['samples_per_s'] and stage['samples_per_s'] < reference['samples_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: {stage['samples_per_s']:.0f} {stage['unit']}/s, "
+                               f"baseline {reference['samples_per_s']:.0f}")
+        if reference['peak_rss_mb'] and stage['peak_rss_mb'] and \
+                stage['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {stage['peak_rss_mb']} MB, baseline {reference['peak_rss_mb']} MB")
+    return regressions
+
+
+def command_line_args():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline on synthetic data')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='Where to save the results')
+    parser.add_argument('--baseline', type=str, default=None, help='Results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed throughput drop / RSS growth before failing, as a fraction')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=None, help='Stages to run')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per stage, the fastest is kept')
+    parser.add_argument('--imports-only', action='store_true',
+                        help='Only measure the import time of the entry points, no synthetic archive')
+    parser.add_argument('--rides', type=int, default=2, help='Rides in the synthetic archive')
+    parser.add_argument('--duration', type=float, default=3600, help='Ride length in seconds')
+    parser.add_argument('--odr', type=float, default=100, help='Accelerometer / gyroscope rate (Hz)')
+    parser.add_argument('--dropouts', type=int, default=2, help='BLE dropouts per session')
+    return parser.parse_args()
+
+
+def main():
+    args = command_line_args()
+    archive_params = {'n_rides': args.rides, 'duration_s': args.duration, 'odr': args.odr,
+                      'n_dropouts': args.dropouts, 'layout': 'app'}
+    if args.imports_only:
+        results = {'meta': {'revision': git_revision(), 'python': platform.python_version(),
+                            'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                   'imports': run_import_benchmarks(max(args.repeat, 5)), 'stages': {}}
+    else:
+        results = run_benchmarks(archive_params, args.stages, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    # heavy imports fail the run even without a baseline
+    regressions = import_regressions(results, baseline, args.tolerance)
+    if baseline is not None:
+        regressions += compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    if baseline is not None:
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
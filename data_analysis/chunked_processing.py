@@ -0,0 +1,239 @@
+import os
+import numpy as np
+import pandas as pd
+from rolling_iqr import grouped_iqr
+
+# rows read per CSV chunk; peak memory scales with this, not with the session length
+DEFAULT_CHUNK_ROWS = 200_000
+
+
+def iter_sorted_chunks(file_path, key, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None):
+    """
+    Read a sensor CSV in chunks of chunk_rows rows, with read_csv dtypes `dtype`.
+
+    Streaming joins need every file sorted by its key, which the loggers write in
+    order. A file that is not is reported with a ValueError instead of silently
+    giving a different join than the in-memory path.
+    """
+    last_key = None
+    for chunk in pd.read_csv(file_path, chunksize=chunk_rows, dtype=dtype):
+        keys = chunk[key].to_numpy()
+        if len(keys) == 0:
+            continue
+        if (last_key is not None and keys[0] < last_key) or np.any(np.diff(keys) < 0):
+            raise ValueError(f"{file_path} is not sorted by '{key}', process it in memory instead")
+        last_key = keys[-1]
+        yield chunk
+
+
+def aligned_chunks(file_paths, key, chunk_rows=DEFAULT_CHUNK_ROWS, dtype=None, with_done=False):
+    """
+    Read several sensor CSVs side by side in key-aligned pieces.
+
+    Each step refills the files whose buffered rows end earliest, then hands out the
+    rows of every file with a key below the smallest buffered end key (the
+    watermark). All rows sharing a key therefore end up in the same piece, so an
+    equi-join of the pieces gives the same rows as joining the whole files, and
+    only about two chunks per file are held at any time.
+
+    Yields:
+        list of dataframes, one per file, all keys < watermark (everything at the end);
+        with with_done, (pieces, done) where done[i] is True once file i has no
+        rows left after its piece
+    """
+    readers = [iter_sorted_chunks(path, key, chunk_rows, dtype) for path in file_paths]
+    buffers = [None] * len(readers)
+    exhausted = [False] * len(readers)
+
+    def buffer_end(idx):
+        if buffers[idx] is None or len(buffers[idx]) == 0:
+            return None
+        return buffers[idx][key].iloc[-1]
+
+    while not all(exhausted):
+        ends = [buffer_end(idx) for idx in range(len(readers))]
+        known_ends = [end for idx, end in enumerate(ends) if end is not None and not exhausted[idx]]
+        lowest = min(known_ends) if known_ends else None
+        for idx, reader in enumerate(readers):
+            if exhausted[idx] or (ends[idx] is not None and ends[idx] != lowest):
+                continue
+            chunk = next(reader, None)
+            if chunk is None:
+                exhausted[idx] = True
+                if buffers[idx] is None:
+                    # empty file: keep its columns so joins still see them
+                    buffers[idx] = pd.read_csv(file_paths[idx], nrows=0, dtype=dtype)
+            elif buffers[idx] is None:
+                buffers[idx] = chunk
+            else:
+                buffers[idx] = pd.concat([buffers[idx], chunk], ignore_index=True)
+
+        live_ends = [buffer_end(idx) for idx in range(len(readers)) if not exhausted[idx]]
+        if any(end is None for end in live_ends):
+            # a live file has nothing buffered yet, read before handing anything out
+            continue
+        if not live_ends:
+            break
+        watermark = min(live_ends)
+        pieces = []
+        for idx, buffer in enumerate(buffers):
+            below = buffer[key].to_numpy() < watermark
+            pieces.append(buffer[below])
+            buffers[idx] = buffer[~below].reset_index(drop=True)
+        if any(len(piece) for piece in pieces):
+            if with_done:
+                yield pieces, [exhausted[idx] and len(buffers[idx]) == 0 for idx in range(len(readers))]
+            else:
+                yield pieces
+
+    if any(len(buffer) for buffer in buffers):
+        yield (buffers, [True] * len(buffers)) if with_done else buffers
+
+
+class StreamingInterpolator:
+    """
+    DataFrame.interpolate(method='linear') over a stream of chunks.
+
+    Linear interpolation of a missing value needs the next valid value of its column,
+    which may only arrive in a later chunk. Rows whose gaps cannot be closed yet are
+    held back, together with the last valid row of every column as context, and
+    released once the next valid values are known. Interpolation is by position,
+    like pandas does, so the released rows are identical to interpolating the
+    concatenated chunks.
+
+    A column whose source has ended (e.g. the magnetometer stopped before acc and
+    gyro) gets no next valid value, so push() has to be told (exhausted) or every
+    later row would wait for it until final. Such a column is no longer waited on:
+    its rows past the last sample are released with that sample's value carried
+    forward, which is what interpolating the whole frame gives them.
+    """
+    def __init__(self):
+        self.pending = None
+        # leading rows of pending that were already released, kept only as context
+        self.n_context = 0
+        # last value of every exhausted column
+        self.carry = {}
+
+    def push(self, df, final=False, exhausted=()):
+        """
+        Add the next chunk; returns the rows that are complete now (all of them if final).
+
+        exhausted lists the columns whose source has no rows after this chunk.
+        """
+        buffer = df if self.pending is None else pd.concat([self.pending, df], ignore_index=True)
+        filled = buffer.interpolate(method='linear')
+        for column in set(exhausted) | set(self.carry):
+            last = buffer[column].last_valid_index()
+            if last is not None:
+                # rows after it are already forward filled by interpolate
+                self.carry[column] = buffer[column].loc[last]
+            elif column in self.carry:
+                filled[column] = filled[column].fillna(self.carry[column])
+        if final:
+            self.pending, self.n_context = None, 0
+            return filled.iloc[self.n_context:]
+
+        valid = buffer.notna().to_numpy()
+        seen = valid.any(axis=0) & ~buffer.columns.isin(list(self.carry))
+        if not seen.any():
+            cut = len(buffer)
+        else:
+            # position of the last valid value of every column that has one
+            last_valid = len(buffer) - 1 - np.argmax(valid[::-1], axis=0)
+            cut = int(last_valid[seen].min())
+        ready = filled.iloc[self.n_context:cut]
+
+        # keep from the last valid value at or before the cut of every column as context
+        context_start = cut
+        for column in np.flatnonzero(seen):
+            before = np.flatnonzero(valid[:cut + 1, column])
+            if len(before):
+                context_start = min(context_start, int(before[-1]))
+        self.pending = buffer.iloc[context_start:]
+        self.n_context = max(cut, self.n_context) - context_start
+        return ready
+
+
+class BucketAggregator:
+    """
+    Time-bucket aggregates (groupby(pd.Grouper(key, freq)).agg(...)) over a stream of chunks.
+
+    The last, possibly incomplete, bucket of every chunk is held back until a later
+    chunk starts a newer bucket, so every bucket is aggregated over all of its rows.
+    result() fills the empty buckets between the first and the last one, as the
+    Grouper does on a whole dataframe. agg='iqr' uses the vectorized grouped_iqr.
+    """
+    def __init__(self, key, freq, columns=None, agg='size', fill_value=np.nan):
+        self.key = key
+        self.freq = freq
+        self.columns = columns
+        self.agg = agg
+        self.fill_value = fill_value
+        self.pending = None
+        self.results = []
+
+    def _aggregate(self, df):
+        if self.agg == 'iqr':
+            return grouped_iqr(df, self.key, self.columns, self.freq)
+        grouped = df.groupby(pd.Grouper(key=self.key, freq=self.freq))
+        if self.columns is not None:
+            grouped = grouped[self.columns]
+        return grouped.agg(self.agg) if self.agg != 'size' else grouped.size()
+
+    def push(self, df):
+        buffer = df if self.pending is None else pd.concat([self.pending, df])
+        if len(buffer) == 0:
+            return
+        timestamps = buffer[self.key]
+        if timestamps.dt.tz is not None:
+            # floor in UTC, local wall times are ambiguous around DST changes
+            timestamps = timestamps.dt.tz_convert('UTC')
+        buckets = timestamps.dt.floor(self.freq)
+        last_bucket = buckets.iloc[-1]
+        complete = (buckets < last_bucket).to_numpy()
+        if complete.any():
+            self.results.append(self._aggregate(buffer[complete]))
+        self.pending = buffer[~complete]
+
+    def result(self):
+        if self.pending is not None and len(self.pending):
+            self.results.append(self._aggregate(self.pending))
+            self.pending = None
+        if not self.results:
+            return None
+        result = pd.concat(self.results)
+        self.results = [result]
+        full_range = pd.date_range(result.index[0], result.index[-1], freq=self.freq, name=result.index.name)
+        return result.reindex(full_range, fill_value=self.fill_value)
+
+
+class ChunkWriter:
+    """Append processed chunks to one Parquet (needs pyarrow) or CSV file"""
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.tmp_path = f"{output_path}.part"
+        self.format = 'parquet' if output_path.endswith('.parquet') else 'csv'
+        self.writer = None
+        self.header_written = False
+        if os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    def write(self, df):
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.tmp_path, table.schema)
+            self.writer.write_table(table)
+        else:
+            df.to_csv(self.tmp_path, mode='a' if self.header_written else 'w',
+                      header=not self.header_written, index=False)
+            self.header_written = True
+
+    def close(self):
+        """Finish the file and move it into place"""
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.output_path)
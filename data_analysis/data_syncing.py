@@ -1,26 +1,25 @@
-import pprint
-from datetime import date
+import argparse
 import json
-from intervalsicu import Intervals
-import pandas as pd
-import requests
-from requests.auth import HTTPBasicAuth
-from datetime import datetime, timedelta
-import csv
-from fitparse import FitFile
 import os
-import matplotlib.pyplot as plt
-from imusensor.filters.kalman import Kalman
-# import datetime
-import pytz
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime
+from functools import partial
+import numpy as np
 import yaml
-import boto3
-from utils import IntervalsAPI, \
-    get_s3_folder_timestamps, get_garmin_file_timestamps, \
-        change_timestamp_to_belgian_time, process_s3_folder, \
-            plot_imu_garmin_comparison, analyze_frame_rates
-
-import argparse
+# the modules imported here are cheap; the Intervals.icu client, S3 sync, FIT conversion,
+# processing and plotting (requests, boto3, pandas, matplotlib) are imported where they are
+# used, so a cron run that finds nothing new does not pay for them
+from utils import DEFAULT_TIMEZONE, S3_PROCESSING_PARAMS
+from session_cache import SessionCache, folder_csv_files
+from session_index import SessionIndex
+from interval_matching import overlap_join
+from resampling import DEFAULT_MAX_GAP_MS
+from plot_rendering import use_headless_backend
+from artifact_pipeline import ArtifactStore, Pipeline, Task
+from instrumentation import instruments, instrumented
 
 def load_config(config_file):
     with open(config_file, 'r') as f:
@@ -30,28 +29,48 @@ def load_config(config_file):
 def command_line_args():
     parser = argparse.ArgumentParser(description='Data syncing and analysis')
     parser.add_argument('--config', type=str, default='config.yaml', help='Path to the configuration file')
+    parser.add_argument('--clear-cache', action='store_true', help='Drop all cached processed sessions before running')
+    parser.add_argument('--invalidate', type=str, action='append', default=[], metavar='PATH',
+                        help='Drop the cached sessions built from this file or session folder before running (repeatable)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for the analysis')
+    parser.add_argument('--parallel-folders', action='store_true', help='Also spread individual IMU folders over the workers')
+    parser.add_argument('--worker-memory-gb', type=float, default=None, help='Memory limit per worker process')
+    parser.add_argument('--plots-only', action='store_true',
+                        help='Skip downloading and only regenerate the analysis plots of all matched activities')
+    parser.add_argument('--force', action='store_true', help='Rebuild every artifact, not only the changed ones')
+    parser.add_argument('--run-report', action='store_true',
+                        help='Time every stage and write run_report.json to the analysis folder')
+    parser.add_argument('--trace-memory', action='store_true', help='Also record tracemalloc peaks (slower)')
+    parser.add_argument('--profile-stage', type=str, default=None,
+                        help='cProfile this stage (e.g. kalman, plot) into profile_<stage>.prof')
     return parser.parse_args()
 
 # goal of the file
 
-# pull the data from garmin/ intervals ICU
-def download_garmin_data(config):
+def make_intervals_api(config):
+    from intervals_api import IntervalsAPI
     intervals_api_file = config['garmin_env_file']
     with open(intervals_api_file, 'r') as f:
         intervals_api_data = json.load(f)
     
-    intervals_api = IntervalsAPI(config['intervals_icu_base_url'], 
-                                 intervals_api_data['intervals_icu']['athlete_id'], 
-                                 intervals_api_data['intervals_icu']['api_key'])
-    activities = intervals_api.get_recent_activities(days=30)
-    
-    bike_event_ids = []
-    new_data_downloaded = False
-
-    for act in activities:
-        if "ride" in act['type'].lower():
-            bike_event_ids.append(act['id'])
+    return IntervalsAPI(config['intervals_icu_base_url'], 
+                        intervals_api_data['intervals_icu']['athlete_id'], 
+                        intervals_api_data['intervals_icu']['api_key'],
+                        max_connections=config.get('intervals_download_workers', 4))
 
+# pull the data from garmin/ intervals ICU
+@instrumented('sync_garmin')
+def download_garmin_data(config, store=None):
+    """
+    Download new ride FIT files, converting each to CSV as soon as it is in while
+    the other downloads are still running. With a store, the conversions are
+    recorded there so convert_fit_files does not redo them.
+    """
+    workers = config.get('intervals_download_workers', 4)
+    intervals_api = make_intervals_api(config)
+    activities = intervals_api.get_recent_activities(days=config.get('intervals_days', 30))
+    
+    downloads = []
     for idx, act in enumerate(activities):
         if "ride" in act['type'].lower():
             event_id = act['id']
@@ -62,122 +81,351 @@ def download_garmin_data(config):
             timestamp = timestamp.strftime('%Y_%m_%d_%H%M')
             file_name = f"{config['garmin_data_folder']}/{type}_{timestamp}_{event_id}.fit"
             
-            if not os.path.exists(file_name):
-                intervals_api.download_fit_file(event_id, file_name)
-                intervals_api.fit_to_csv(file_name, file_name.replace(".fit", ".csv") )
-                
+            # also retry the conversion of FIT files whose CSV is missing
+            if not os.path.exists(file_name) or not os.path.exists(file_name.replace(".fit", ".csv")):
+                downloads.append((event_id, file_name))
+    
+    os.makedirs(config['garmin_data_folder'], exist_ok=True)
+    converted = intervals_api.download_fit_files(downloads, workers=workers)
+    if store is not None:
+        params = fit_conversion_params()
+        for csv_path in converted:
+            fit_path = os.path.splitext(csv_path)[0] + ".fit"
+            store.record(f"convert:{os.path.basename(fit_path)}", store.signature([fit_path], params), [csv_path])
+    new_data_downloaded = len(converted) > 0
     return new_data_downloaded
+
+def fit_conversion_params():
+    """Parameters a FIT -> CSV conversion is recorded with in the artifact store"""
+    from fit_conversion import RECORDS_TO_STORE
+    return {'step': 'fit_to_csv', 'fields': RECORDS_TO_STORE}
+
+@instrumented('convert', rows=len)
+def convert_fit_files(config, store):
+    """
+    Convert every FIT file in garmin_data_folder whose CSV is missing or older than its
+    FIT content or conversion settings. The sync converts what it downloads, so this
+    only picks up what it left: files it did not download or converted with other
+    settings.
+    
+    Returns:
+        list: CSV paths that were written
+    """
+    from fit_conversion import fit_to_csv
+    garmin_data_folder = config['garmin_data_folder']
+    params = fit_conversion_params()
+    converted = []
+    fit_files = sorted(f for f in os.listdir(garmin_data_folder) if f.endswith('.fit')) \
+        if os.path.isdir(garmin_data_folder) else []
+    for fit_file in fit_files:
+        fit_path = os.path.join(garmin_data_folder, fit_file)
+        csv_path = fit_path.replace(".fit", ".csv")
+        name = f"convert:{fit_file}"
+        signature = store.signature([fit_path], params)
+        if store.is_current(name, signature):
+            continue
+        if fit_to_csv(fit_path, csv_path):
+            store.record(name, signature, [csv_path])
+            converted.append(csv_path)
+    return converted
         
+@instrumented('sync_s3')
 def download_s3_data(config):
+    from s3_sync import S3Sync, make_s3_client
     env_file = config['s3_env_file']
     with open(env_file, 'r') as f:
         env_data = json.load(f)
         
-    new_data_downloaded = False
-        
     aws_access_key = env_data['accessKey']
     aws_secret_key = env_data['secretKey']
     aws_bucket_name = env_data['bucketName']
     aws_region = env_data['region']
 
-    # get a list of folders in the bucket
-    s3 = boto3.client('s3', aws_access_key_id=aws_access_key, aws_secret_access_key=aws_secret_key, region_name=aws_region)
-
-    # print the list of folders
-    response = s3.list_objects_v2(Bucket=aws_bucket_name)
-    for obj in response['Contents']:
-        print(obj['Key'])
-
+    # one connection-pooled client shared by all download threads
+    workers = config.get('s3_sync_workers', 8)
+    s3 = make_s3_client(aws_access_key, aws_secret_key, aws_region,
+                        endpoint_url=config.get('s3_endpoint_url'), max_pool_connections=workers)
 
     local_data_folder = config['s3_data_folder']
-    os.makedirs(local_data_folder, exist_ok=True)   
-    # check if the s3 files are present in the local data folder
-    for obj in response['Contents']:
-        if obj['Key'] not in os.listdir(local_data_folder):
-            local_file_path = os.path.join(local_data_folder, obj['Key'])
-            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-            s3.download_file(aws_bucket_name, obj['Key'], local_file_path)
-            new_data_downloaded = True
+    # only new or changed objects are downloaded, compared against a local manifest
+    s3_sync = S3Sync(s3, aws_bucket_name, local_data_folder, workers=workers)
+    downloaded, failed = s3_sync.sync()
+    for key in downloaded:
+        print(key)
+    if failed:
+        print(f"{len(failed)} S3 objects failed to download")
+    new_data_downloaded = len(downloaded) > 0
 
     return new_data_downloaded
 
 
+def get_session_index(config):
+    index_file = config.get('session_index_file',
+                            os.path.join(config['analysis_data_folder'], "session_index.sqlite"))
+    return SessionIndex(index_file)
+
+@instrumented('match')
 def match_data(config):
+    from timestamps import get_s3_folder_timestamps, get_garmin_file_timestamps
     # get the list of files in the garmin data folder
     garmin_data_folder = config['garmin_data_folder']
     s3_data_folder = os.path.join(config['s3_data_folder'], "data")
     
     s3_folders = [f for f in os.listdir(s3_data_folder) if os.path.isdir(os.path.join(s3_data_folder, f))]
-    s3_timestamps = {}
-
-    for folder in s3_folders:
-        folder_path = os.path.join(s3_data_folder, folder)
-        first_ts, last_ts = get_s3_folder_timestamps(folder_path)
-        if first_ts and last_ts:
-            s3_timestamps[folder] = {
-                'first_timestamp': first_ts,
-                'last_timestamp': last_ts
-            }
-
-    # Process Garmin files
     garmin_files = [f for f in os.listdir(garmin_data_folder) if f.endswith('.csv')]
-    garmin_timestamps = {}
-
-    for file in garmin_files:
-        file_path = os.path.join(garmin_data_folder, file)
-        first_ts, last_ts = get_garmin_file_timestamps(file_path)
-        if first_ts and last_ts:
-            # Convert to Belgian time
-            first_ts = change_timestamp_to_belgian_time(first_ts)
-            last_ts = change_timestamp_to_belgian_time(last_ts)
-            garmin_timestamps[file] = {
-                'first_timestamp': first_ts,
-                'last_timestamp': last_ts
-            }
-
-    print (s3_timestamps)
-    print (garmin_timestamps)
-    # Match S3 folders to Garmin files
-    matches = {}
-    for garmin_file, garmin_ts in garmin_timestamps.items():
-        matching_folders = []
-        for s3_folder, s3_ts in s3_timestamps.items():
-            # Check if S3 data overlaps with Garmin data
-            if (s3_ts['first_timestamp'] <= garmin_ts['last_timestamp'] and 
-                s3_ts['last_timestamp'] >= garmin_ts['first_timestamp']):
-                matching_folders.append(s3_folder)
-        matches[garmin_file] = matching_folders# get the list of files in the s3 data folder
+    
+    # only new or changed recordings are read, the rest comes from the index
+    with closing(get_session_index(config)) as session_index:
+        n_imu = session_index.update('imu', {folder: os.path.join(s3_data_folder, folder, "accelerometer.csv")
+                                             for folder in s3_folders},
+                                     lambda path: get_s3_folder_timestamps(os.path.dirname(path)))
+        n_garmin = session_index.update('garmin', {file: os.path.join(garmin_data_folder, file)
+                                                   for file in garmin_files},
+                                        get_garmin_file_timestamps)
+        print(f"Session index updated: {n_imu} IMU folders, {n_garmin} Garmin files read")
+
+        garmin_intervals = session_index.intervals('garmin')
+        # indexed query per activity: only the IMU sessions overlapping some activity go to the sweep
+        s3_intervals = {}
+        for first_ts, last_ts in garmin_intervals.values():
+            s3_intervals.update(session_index.overlapping('imu', first_ts, last_ts))
+        s3_intervals = dict(sorted(s3_intervals.items(), key=lambda item: item[1]))
+
+    # cheap dropout / sample-rate check of every session before the expensive analysis
+    health = check_session_health(config, s3_data_folder, s3_folders)
+    if config.get('skip_unhealthy_sessions', False):
+        s3_intervals = {folder: bounds for folder, bounds in s3_intervals.items()
+                        if health.get(folder, {}).get('ok', True)}
+
+    # Match S3 folders to Garmin files: every pair whose time ranges overlap
+    garmin_files = list(garmin_intervals)
+    s3_folders = list(s3_intervals)
+    garmin_bounds = np.array(list(garmin_intervals.values()), dtype=np.int64).reshape(-1, 2)
+    s3_bounds = np.array(list(s3_intervals.values()), dtype=np.int64).reshape(-1, 2)
+    overlaps = overlap_join(garmin_bounds[:, 0], garmin_bounds[:, 1], s3_bounds[:, 0], s3_bounds[:, 1])
+
+    # optionally drop IMU recordings that only graze the activity
+    min_overlap_fraction = config.get('min_overlap_fraction', 0.0)
+    matches = {garmin_file: [] for garmin_file in garmin_files}
+    for garmin_idx, s3_idx, s3_fraction in zip(overlaps['a'], overlaps['b'], overlaps['b_fraction']):
+        if s3_fraction >= min_overlap_fraction:
+            matches[garmin_files[garmin_idx]].append(s3_folders[s3_idx])
     return matches
 
-def process_garmin_imu_data(config, garmin_file_name, s3_folders):
-    # get the list of files in the garmin data folder
+def check_session_health(config, s3_data_folder, s3_folders):
+    """
+    Health record of every S3 session (see session_health), written to
+    session_health.json/.parquet in analysis_data_folder. Unchanged sessions are
+    taken from the previous report.
+    """
+    from session_health import scan_sessions, DEFAULT_HEALTH_LIMITS
+    limits = {key: config[f"health_{key}"] for key in DEFAULT_HEALTH_LIMITS if f"health_{key}" in config}
+    report_path = os.path.join(config['analysis_data_folder'], "session_health.json")
+    health = scan_sessions([os.path.join(s3_data_folder, folder) for folder in s3_folders], report_path,
+                           workers=config.get('s3_sync_workers', 4), limits=limits)
+    for folder, record in sorted(health.items()):
+        if not record['ok']:
+            print(f"Unhealthy session {folder}: {'; '.join(record['flags'])}")
+    return health
+
+def match_inputs(config):
+    """Files match_data reads: the Garmin CSVs and the CSVs of every S3 session folder"""
     garmin_data_folder = config['garmin_data_folder']
     s3_data_folder = os.path.join(config['s3_data_folder'], "data")
-    analysis_data_folder = config['analysis_data_folder']
+    inputs = [os.path.join(garmin_data_folder, f) for f in os.listdir(garmin_data_folder) if f.endswith('.csv')]
+    for folder in os.listdir(s3_data_folder):
+        if os.path.isdir(os.path.join(s3_data_folder, folder)):
+            inputs.extend(folder_csv_files(os.path.join(s3_data_folder, folder)))
+    return inputs
+
+def match_params(config):
+    """Config values the matches depend on"""
+    return {key: value for key, value in config.items()
+            if key in ('min_overlap_fraction', 'skip_unhealthy_sessions') or key.startswith('health_')}
+
+def activity_artifact(config, garmin_file, s3_folders):
+    """
+    Inputs, parameters and outputs of one activity's analysis, for the artifact store.
     
-    imu_dfs = []
+    Returns:
+        (name, inputs, params, outputs)
+    """
+    s3_data_folder = os.path.join(config['s3_data_folder'], "data")
+    activity_folder = os.path.join(config['analysis_data_folder'], garmin_file.replace(".csv", ""))
+    inputs = [os.path.join(config['garmin_data_folder'], garmin_file)]
     for s3_folder in s3_folders:
-        imu_data = process_s3_folder(s3_data_folder, s3_folder)
-        imu_dfs.append(imu_data)
+        inputs.extend(folder_csv_files(os.path.join(s3_data_folder, s3_folder)))
+    params = {**S3_PROCESSING_PARAMS, 'timezone': config.get('timezone', DEFAULT_TIMEZONE),
+              'chunk_rows': config.get('chunk_rows'), 'folders': sorted(s3_folders), **get_resample_params(config)}
+    outputs = [os.path.join(activity_folder, "imu_garmin_comparison.png"),
+               os.path.join(activity_folder, "frame_rate_analysis.png")]
+    return f"activity:{garmin_file}", inputs, params, outputs
 
-    # process the garmin file
-    garmin_df = pd.read_csv(os.path.join(garmin_data_folder, garmin_file_name))
-    garmin_df['timestamp'] = garmin_df['timestamp'].apply(change_timestamp_to_belgian_time)
-    garmin_df['timestamp'] = pd.to_datetime(garmin_df['timestamp'])
+def get_session_cache(config):
+    """Processed-session cache from the config, or None if no cache_folder is set"""
+    if not config.get('cache_folder'):
+        return None
+    return SessionCache(config['cache_folder'], config.get('cache_max_size_gb', 5.0))
+
+@contextmanager
+def open_session_cache(config):
+    """get_session_cache, closed at the end of the block so the access times of its hits are saved"""
+    session_cache = get_session_cache(config)
+    try:
+        yield session_cache
+    finally:
+        if session_cache is not None:
+            session_cache.close()
+
+def get_resample_params(config):
+    """Resampling settings for process_s3_folders; resample_hz None keeps the exact-timestamp join"""
+    return {'resample_hz': config.get('resample_hz'),
+            'max_gap_ms': config.get('resample_max_gap_ms', DEFAULT_MAX_GAP_MS)}
+
+def process_garmin_imu_data(config, garmin_file_name, s3_folders):
+    """Process the matched IMU sessions of one activity and write its plots"""
+    import pandas as pd
+    from imu_processing import process_s3_folders, summarize_s3_folder, summarize_imu_df
+    from timestamps import utc_strings_to_datetime
+    from analysis_plots import plot_imu_garmin_comparison, analyze_frame_rates
+    with instruments.stage('activity', activity=garmin_file_name):
+        # get the list of files in the garmin data folder
+        garmin_data_folder = config['garmin_data_folder']
+        s3_data_folder = os.path.join(config['s3_data_folder'], "data")
+        analysis_data_folder = config['analysis_data_folder']
+    
+        timezone = config.get('timezone', DEFAULT_TIMEZONE)
+        activity_folder = os.path.join(analysis_data_folder, garmin_file_name.replace(".csv", ""))
+        with instruments.stage('process_imu'):
+            if config.get('chunk_rows'):
+                # bounded memory: stream every session, writing the processed rows next to the plots
+                imu_dfs = [summarize_s3_folder(s3_data_folder, s3_folder, timezone, config['chunk_rows'],
+                                               output_path=os.path.join(activity_folder, f"{s3_folder}_orientation.parquet"))
+                           for s3_folder in s3_folders]
+            else:
+                with open_session_cache(config) as session_cache:
+                    imu_dfs = process_s3_folders(s3_data_folder, s3_folders, cache=session_cache, tz=timezone,
+                                                 **get_resample_params(config))
+                if instruments.enabled:
+                    from frame_schema import memory_report
+                    print(f"Memory of the processed sessions of {garmin_file_name}:")
+                    memory_report(dict(zip(s3_folders, imu_dfs)))
+                # the plots only need the aggregates, keep the full-rate frames out of memory while drawing
+                imu_dfs = [summarize_imu_df(imu_df) for imu_df in imu_dfs]
+            instruments.add_rows(sum(summary['rows'] for summary in imu_dfs))
+
+        # process the garmin file
+        with instruments.stage('load_garmin'):
+            garmin_df = pd.read_csv(os.path.join(garmin_data_folder, garmin_file_name))
+            garmin_df['timestamp'] = utc_strings_to_datetime(garmin_df['timestamp'], timezone)
+            instruments.add_rows(len(garmin_df))
+    
     
     
+        save_path = os.path.join(analysis_data_folder, garmin_file_name.replace(".csv", ""), "imu_garmin_comparison.png")
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        plot_imu_garmin_comparison(imu_dfs, garmin_df, save_path)
     
-    save_path = os.path.join(analysis_data_folder, garmin_file_name.replace(".csv", ""), "imu_garmin_comparison.png")
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    plot_imu_garmin_comparison(imu_dfs, garmin_df, save_path)
+        # also the plot of frame rate dropping
+        frame_rate_plot_path = os.path.join(analysis_data_folder, garmin_file_name.replace(".csv", ""), "frame_rate_analysis.png")
+        os.makedirs(os.path.dirname(frame_rate_plot_path), exist_ok=True)
+        analyze_frame_rates(imu_dfs, save_path=frame_rate_plot_path)
     
-    # also the plot of frame rate dropping
-    frame_rate_plot_path = os.path.join(analysis_data_folder, garmin_file_name.replace(".csv", ""), "frame_rate_analysis.png")
-    os.makedirs(os.path.dirname(frame_rate_plot_path), exist_ok=True)
-    analyze_frame_rates(imu_dfs, save_path=frame_rate_plot_path)
+
+def _init_worker(memory_limit_gb=None, instrument_settings=None):
+    """Process-pool initializer: headless plotting, the parent's instrumentation and an optional address-space cap"""
+    use_headless_backend()
+    if instrument_settings:
+        instruments.configure(**instrument_settings)
+    if memory_limit_gb:
+        import resource
+        limit = int(memory_limit_gb * 1024 ** 3)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _run_task(fn, *args):
+    """
+    Run fn(*args) and return (error traceback or None, seconds, instrumentation
+    collected), so one failure does not stop the others
+    """
+    start_time = time.time()
+    try:
+        fn(*args)
+        return None, time.time() - start_time, instruments.collect()
+    except Exception:
+        return traceback.format_exc(), time.time() - start_time, instruments.collect()
+
+def _process_folder_task(config, s3_folder):
+    """Worker task: process one S3 folder into the session cache"""
+    from imu_processing import process_s3_folders
+    s3_data_folder = os.path.join(config['s3_data_folder'], "data")
+    with open_session_cache(config) as session_cache:
+        return _run_task(partial(process_s3_folders, **get_resample_params(config)), s3_data_folder, [s3_folder],
+                         session_cache, config.get('timezone', DEFAULT_TIMEZONE))
+
+def _process_activity_task(config, garmin_file, matching_folders):
+    """Worker task: process and plot one Garmin activity"""
+    return _run_task(process_garmin_imu_data, config, garmin_file, matching_folders)
+
+def _run_tasks(task_fn, task_args, workers, memory_limit_gb):
+    """
+    Run task_fn over task_args, serially or on a process pool.
     
+    Returns:
+        list: (error, seconds) per task, in task_args order; the tasks' instrumentation
+        records are merged into this process
+    """
+    if workers <= 1:
+        results = [task_fn(*args) for args in task_args]
+    else:
+        results = _run_pool(task_fn, task_args, workers, memory_limit_gb)
+    for _, _, collected in results:
+        instruments.merge(collected)
+    return [(error, seconds) for error, seconds, _ in results]
 
-def perform_analysis(config, matches):
+def _run_pool(task_fn, task_args, workers, memory_limit_gb):
+    instrument_settings = {'enabled': instruments.enabled, 'trace_memory': instruments.trace_memory,
+                           'profile_stage': instruments.profile_stage}
+    pool_kwargs = {'max_workers': workers, 'initializer': _init_worker,
+                   'initargs': (memory_limit_gb, instrument_settings)}
+    try:
+        # a fresh process per task gives the memory of big activities back to the OS
+        executor = ProcessPoolExecutor(max_tasks_per_child=1, **pool_kwargs)
+    except TypeError:
+        # max_tasks_per_child needs python 3.11
+        executor = ProcessPoolExecutor(**pool_kwargs)
+    with executor:
+        futures = [executor.submit(task_fn, *args) for args in task_args]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # the worker itself died, e.g. killed for going over the memory limit
+                results.append((f"Worker failed: {e!r}", 0.0, {'records': [], 'profiles': []}))
+        return results
+
+def perform_analysis(config, matches, workers=1, parallel_folders=False, memory_limit_gb=None, store=None,
+                     force=False):
+    """
+    Process and plot every matched Garmin activity.
+    
+    Args:
+        config (dict): configuration
+        matches (dict): garmin file -> list of matching S3 folders, from match_data
+        workers (int): number of worker processes, 1 runs everything in this process
+        parallel_folders (bool): first process the S3 folders one per task into the
+            session cache, so an activity with many folders is spread over the pool too.
+            Needs cache_folder in the config. Otherwise, with a cache_folder, the
+            folders of all activities are filtered together first (process_season).
+        memory_limit_gb (float, optional): address-space limit per worker
+        store (ArtifactStore, optional): skip activities whose plots were built from
+            the same files and parameters, and record the ones built now
+        force (bool): with a store, rebuild every activity anyway
+    
+    Writes analysis_report.json in analysis_data_folder with the status, duration
+    and error (if any) of every task.
+    """
+    report = {'folders': {}, 'activities': {}}
     
     for garmin_file, matching_folders in matches.items():
         print(f"\nGarmin file: {garmin_file}")
@@ -185,9 +433,70 @@ def perform_analysis(config, matches):
         if len(matching_folders) != 0:
             for folder in matching_folders:
                 print(f"- {folder}")
-            process_garmin_imu_data(config, garmin_file, matching_folders)  
         else:
             print("No matching S3 folders found")
+    activities = [(garmin_file, folders) for garmin_file, folders in matches.items() if len(folders) != 0]
+    signatures = {}
+    if store is not None:
+        pending = []
+        for garmin_file, folders in activities:
+            name, inputs, params, _ = activity_artifact(config, garmin_file, folders)
+            signatures[garmin_file] = store.signature(inputs, params)
+            if force or not store.is_current(name, signatures[garmin_file]):
+                pending.append((garmin_file, folders))
+            else:
+                report['activities'][garmin_file] = {'status': 'skipped', 'folders': folders, 'seconds': 0.0,
+                                                     'error': None}
+        print(f"{len(activities) - len(pending)} activities unchanged, {len(pending)} to process")
+        activities = pending
+    
+    if parallel_folders and workers > 1:
+        if get_session_cache(config) is None:
+            print("parallel_folders needs cache_folder in the config, processing folders per activity")
+        else:
+            s3_folders = sorted({folder for _, folders in activities for folder in folders})
+            results = _run_tasks(_process_folder_task, [(config, folder) for folder in s3_folders],
+                                 workers, memory_limit_gb)
+            for s3_folder, (error, seconds) in zip(s3_folders, results):
+                report['folders'][s3_folder] = {'status': 'failed' if error else 'ok',
+                                                'seconds': round(seconds, 3), 'error': error}
+    elif activities and get_session_cache(config) is not None and not config.get('chunk_rows'):
+        # one batched filter run over the folders of all activities instead of a few per activity
+        from imu_processing import process_season, SEASON_BATCH_SESSIONS
+        s3_folders = sorted({folder for _, folders in activities for folder in folders})
+        batch_sessions = config.get('season_batch_sessions', SEASON_BATCH_SESSIONS)
+        with open_session_cache(config) as session_cache:
+            error, seconds, collected = _run_task(partial(process_season, batch_sessions=batch_sessions,
+                                                          **get_resample_params(config)),
+                                                  os.path.join(config['s3_data_folder'], "data"), s3_folders,
+                                                  session_cache, config.get('timezone', DEFAULT_TIMEZONE))
+        instruments.merge(collected)
+        report['season_batch'] = {'status': 'failed' if error else 'ok', 'folders': len(s3_folders),
+                                  'seconds': round(seconds, 3), 'error': error}
+        if error:
+            # the activities process their folders themselves then
+            print(f"\nBatch processing of the S3 folders failed:\n{error}")
+    
+    results = _run_tasks(_process_activity_task, [(config, garmin_file, folders) for garmin_file, folders in activities],
+                         workers, memory_limit_gb)
+    for (garmin_file, folders), (error, seconds) in zip(activities, results):
+        report['activities'][garmin_file] = {'status': 'failed' if error else 'ok', 'folders': folders,
+                                             'seconds': round(seconds, 3), 'error': error}
+        if error:
+            print(f"\nFailed to process {garmin_file}:\n{error}")
+        elif store is not None:
+            name, _, _, outputs = activity_artifact(config, garmin_file, folders)
+            store.record(name, signatures[garmin_file], outputs)
+    if store is not None:
+        store.save()
+    
+    report_path = os.path.join(config['analysis_data_folder'], "analysis_report.json")
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    n_failed = sum(task['status'] == 'failed' for task in report['activities'].values())
+    print(f"\nProcessed {len(activities)} activities, {n_failed} failed. Report: {report_path}")
+    return report
 
 
 def main():
@@ -196,14 +505,75 @@ def main():
         raise FileNotFoundError(f"Config file {args.config} not found")
         
     config = load_config(args.config)
+    
+    if args.clear_cache or args.invalidate:
+        with open_session_cache(config) as session_cache:
+            if session_cache is None:
+                print("No cache_folder in the config, nothing to drop")
+            elif args.clear_cache:
+                session_cache.clear()
+                print("Cleared the processed session cache")
+            else:
+                for path in args.invalidate:
+                    print(f"Dropped {session_cache.invalidate(path)} cached sessions built from {path}")
         
-    new_garmin_data = download_garmin_data(config)
-    new_s3_data = download_s3_data(config)
-    if new_garmin_data or new_s3_data or config['perform_analysis']:
+    # plots are only written to files
+    use_headless_backend()
+    instruments.configure(enabled=args.run_report or bool(args.profile_stage), trace_memory=args.trace_memory,
+                          profile_stage=args.profile_stage)
+    store = ArtifactStore(config.get('artifact_manifest',
+                                     os.path.join(config['analysis_data_folder'], "artifacts.json")))
+    pipeline = build_pipeline(config, args, store)
+    report = pipeline.run(force=args.force)
+    for name, task in report.items():
+        print(f"{name}: {task['status']} ({task['seconds']} s)")
+    if instruments.enabled:
+        run_report_path = os.path.join(config['analysis_data_folder'], "run_report.json")
+        instruments.write_report(run_report_path)
+        for stage, total in instruments.summary().items():
+            print(f"{stage}: {total['calls']} calls, {total['wall_s']:.2f} s wall, {total['cpu_s']:.2f} s CPU, "
+                  f"{total['rows']} rows")
+        print(f"Run report: {run_report_path}")
+
+def build_pipeline(config, args, store):
+    """
+    sync -> convert -> match -> analysis as a task graph.
+    
+    Syncing always runs (the remote decides what is new). FIT conversion and the
+    analysis keep one artifact per FIT file and per activity, and matching is
+    skipped while no Garmin CSV or S3 session file changed, so a run after one new
+    ride only converts, processes and plots that ride.
+    """
+    matches_path = os.path.join(config['analysis_data_folder'], "matches.json")
+    
+    def match():
         matches = match_data(config)
-        perform_analysis(config, matches)
-    else:
-        print("No new data to download")
+        os.makedirs(os.path.dirname(matches_path), exist_ok=True)
+        with open(matches_path, 'w') as f:
+            json.dump(matches, f, indent=2)
+        return matches
+    
+    def load_matches():
+        with open(matches_path, 'r') as f:
+            return json.load(f)
+    
+    # perform_analysis: 1 keeps its old meaning of redoing the whole analysis on every run
+    force_analysis = args.force or args.plots_only or bool(config.get('perform_analysis'))
+    pipeline = Pipeline(store)
+    sync_tasks = []
+    if not args.plots_only:
+        pipeline.add(Task('sync_garmin', lambda: download_garmin_data(config, store), always=True))
+        pipeline.add(Task('sync_s3', lambda: download_s3_data(config), always=True))
+        sync_tasks = ['sync_garmin', 'sync_s3']
+    pipeline.add(Task('convert', lambda *_: convert_fit_files(config, store), deps=sync_tasks[:1], always=True))
+    pipeline.add(Task('match', lambda *_: match(), deps=['convert', *sync_tasks[1:]],
+                      inputs=lambda: match_inputs(config), params=match_params(config),
+                      outputs=[matches_path], load=load_matches))
+    pipeline.add(Task('analysis', lambda matches: perform_analysis(
+                          config, matches, workers=args.workers, parallel_folders=args.parallel_folders,
+                          memory_limit_gb=args.worker_memory_gb, store=store, force=force_analysis),
+                      deps=['match'], always=True))
+    return pipeline
     
 if __name__ == "__main__":
     main()
@@ -23,6 +23,7 @@ from imusensor.filters.kalman import Kalman
 from datetime import datetime
 from collections import deque
 import pandas as pd
+from rolling_iqr import rolling_iqr
 
 
 vertices = (
@@ -169,10 +170,9 @@ class CubeVisualizer:
         glPopMatrix()
         glMatrixMode(GL_MODELVIEW)
 
-def calculate_iqr(df, index, column='roll', window=100):
-    start_idx = max(0, index - window)
-    window_data = df[column].iloc[start_idx:index + 1]
-    return window_data.quantile(0.75) - window_data.quantile(0.25)
+def calculate_iqr(df, column='roll', window=100):
+    """IQR of `column` over each row and the `window` rows before it, for the whole replay at once"""
+    return rolling_iqr(df[column].to_numpy(), window + 1)
 
 
 def main():
@@ -195,6 +195,10 @@ def main():
     common_yaw = 0
     common_roll = 0
     common_pitch = 0
+    
+    iqr_high_values = calculate_iqr(df_high, 'roll')
+    iqr_low_values = calculate_iqr(df_low, 'roll')
+    iqr_medium_values = calculate_iqr(df_medium, 'roll')
     for index, row in df_high.iterrows():
         if index < 100:
             continue
@@ -214,9 +218,9 @@ def main():
         yaw_medium = df_medium.iloc[index]['roll']
         
         
-        iqr_high = calculate_iqr(df_high, index, 'roll')
-        iqr_low = calculate_iqr(df_low, index, 'roll')
-        iqr_medium = calculate_iqr(df_medium, index, 'roll')
+        iqr_high = iqr_high_values[index]
+        iqr_low = iqr_low_values[index]
+        iqr_medium = iqr_medium_values[index]
         
 
         cube1.update_orientation(roll_low, pitch_low, yaw_low)
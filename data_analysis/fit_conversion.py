@@ -0,0 +1,56 @@
+import csv
+import os
+from instrumentation import instruments, instrumented
+
+# Garmin record fields written to the activity CSVs, in column order
+RECORDS_TO_STORE = [
+    'enhanced_speed', 'enhanced_altitude', 'cadence', 'power',
+    'heart_rate', 'timestamp', 'position_lat', 'position_long'
+]
+
+
+@instrumented('fit_to_csv')
+def fit_to_csv(fit_file_path, csv_file_path, fields=RECORDS_TO_STORE):
+    """
+    Converts a FIT file to a CSV file.
+
+    The record messages are decoded straight into columns by fit_decoder, with
+    fitparse as a fallback for files the fast decoder cannot read. The header is
+    always `fields`, and fields a record does not have are left empty, so every
+    row lines up with the header.
+
+    Parameters:
+    - fit_file_path: str, path to the input FIT file.
+    - csv_file_path: str, path to the output CSV file.
+    - fields: list, record fields to store, RECORDS_TO_STORE by default.
+    """
+    # the decoder pulls in pandas, only load it when there is something to convert
+    from fit_decoder import decode_fit_records, write_records, FitDecodeError
+    tmp_path = f"{csv_file_path}.part"
+    try:
+        try:
+            records = decode_fit_records(fit_file_path, fields=fields)
+            instruments.add_rows(len(records))
+            write_records(records, tmp_path, fmt='csv')
+        except FitDecodeError as e:
+            print(f"Fast FIT decoder failed on {fit_file_path} ({e}), falling back to fitparse")
+            _fit_to_csv_fitparse(fit_file_path, tmp_path, fields)
+        os.replace(tmp_path, csv_file_path)
+        print(f"Conversion complete. CSV file saved as '{csv_file_path}'")
+        return True
+    except Exception as e:
+        print(f"An error occurred during FIT to CSV conversion: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def _fit_to_csv_fitparse(fit_file_path, csv_file_path, fields=RECORDS_TO_STORE):
+    from fitparse import FitFile
+    fitfile = FitFile(fit_file_path)
+    with open(csv_file_path, mode='w', newline='') as csv_file:
+        csv_writer = csv.DictWriter(csv_file, fieldnames=fields)
+        csv_writer.writeheader()
+        for record in fitfile.get_messages('record'):
+            csv_writer.writerow({data.name: data.value for data in record
+                                 if data.name in fields})
@@ -0,0 +1,259 @@
+import os
+import struct
+import numpy as np
+import pandas as pd
+
+# seconds between the unix epoch and the FIT epoch (1989-12-31 00:00:00 UTC)
+FIT_EPOCH_OFFSET = 631065600
+
+RECORD_MESG_NUM = 20
+TIMESTAMP_FIELD = 253
+
+# record message fields we decode: field number -> (name, scale, offset, integer valued)
+RECORD_FIELDS = {
+    253: ('timestamp', 1, 0, True),
+    0: ('position_lat', 1, 0, True),
+    1: ('position_long', 1, 0, True),
+    2: ('altitude', 5, 500, False),
+    3: ('heart_rate', 1, 0, True),
+    4: ('cadence', 1, 0, True),
+    6: ('speed', 1000, 0, False),
+    7: ('power', 1, 0, True),
+    73: ('enhanced_speed', 1000, 0, False),
+    78: ('enhanced_altitude', 5, 500, False),
+}
+
+# speed / altitude are the 16 bit versions of the enhanced fields; fitparse expands them
+# into enhanced_* when a device only writes the short ones, so do we
+ENHANCED_FALLBACKS = {'enhanced_speed': 'speed', 'enhanced_altitude': 'altitude'}
+
+# FIT base type -> (numpy type char, invalid value)
+BASE_TYPES = {
+    0x00: ('u1', 0xFF), 0x01: ('i1', 0x7F), 0x02: ('u1', 0xFF),
+    0x83: ('i2', 0x7FFF), 0x84: ('u2', 0xFFFF), 0x85: ('i4', 0x7FFFFFFF),
+    0x86: ('u4', 0xFFFFFFFF), 0x88: ('f4', None), 0x89: ('f8', None),
+    0x0A: ('u1', 0x00), 0x8B: ('u2', 0x0000), 0x8C: ('u4', 0x00000000),
+    0x8E: ('i8', 0x7FFFFFFFFFFFFFFF), 0x8F: ('u8', 0xFFFFFFFFFFFFFFFF), 0x90: ('u8', 0x0000000000000000),
+}
+
+
+class FitDecodeError(Exception):
+    pass
+
+
+class _Definition:
+    """Layout of one local message type, as given by its definition message"""
+    def __init__(self, mesg_num, big_endian, fields, size):
+        self.mesg_num = mesg_num
+        self.big_endian = big_endian
+        # (field number, byte offset, size, base type)
+        self.fields = fields
+        self.size = size
+        self.timestamp_format = None
+        self.timestamp_offset = None
+        for field_num, offset, field_size, base_type in fields:
+            if field_num == TIMESTAMP_FIELD and field_size == 4:
+                self.timestamp_format = ('>' if big_endian else '<') + 'I'
+                self.timestamp_offset = offset
+        # record messages decoded in bulk: global message index and absolute byte offset
+        self.positions = []
+        self.offsets = []
+
+
+def _walk(data):
+    """
+    Walk the message headers of a (possibly chained) FIT file.
+
+    Only the headers are parsed here; the bytes of each record data message are
+    remembered by offset and decoded in bulk afterwards. Timestamps of messages with
+    a compressed timestamp header are resolved on the way, since they depend on the
+    last full timestamp seen.
+
+    Returns:
+        (definitions, compressed, n_records): every record definition used (each
+        holding the record indices and byte offsets of its messages), a dict of
+        record index -> timestamp for compressed-header records, and the number of
+        record messages in the file
+    """
+    definitions = []
+    compressed = {}
+    n_records = 0
+    pos = 0
+    while pos + 12 <= len(data):
+        header_size = data[pos]
+        if data[pos + 8:pos + 12] != b'.FIT':
+            raise FitDecodeError(f"Invalid FIT header at byte {pos}")
+        data_size = struct.unpack_from('<I', data, pos + 4)[0]
+        pos += header_size
+        end = pos + data_size
+        if end > len(data):
+            raise FitDecodeError("FIT file is truncated")
+
+        local_defs = {}
+        last_timestamp = 0
+        while pos < end:
+            header = data[pos]
+            pos += 1
+            if header & 0x80:
+                # compressed timestamp header, always a data message
+                local_num = (header >> 5) & 0x03
+                time_offset = header & 0x1F
+                definition = local_defs.get(local_num)
+                if definition is None:
+                    raise FitDecodeError(f"Data message for undefined local type {local_num}")
+                timestamp = time_offset + (last_timestamp & ~0x1F)
+                if time_offset < (last_timestamp & 0x1F):
+                    timestamp += 0x20
+                last_timestamp = timestamp
+                if definition.mesg_num == RECORD_MESG_NUM:
+                    compressed[n_records] = timestamp
+                    definition.positions.append(n_records)
+                    definition.offsets.append(pos)
+                    n_records += 1
+                pos += definition.size
+            elif header & 0x40:
+                # definition message
+                big_endian = data[pos + 1] == 1
+                mesg_num = struct.unpack_from('>H' if big_endian else '<H', data, pos + 2)[0]
+                n_fields = data[pos + 4]
+                pos += 5
+                fields = []
+                offset = 0
+                for idx in range(n_fields):
+                    field_num, field_size, base_type = data[pos], data[pos + 1], data[pos + 2]
+                    fields.append((field_num, offset, field_size, base_type))
+                    offset += field_size
+                    pos += 3
+                if header & 0x20:
+                    # developer fields: only their size matters to us
+                    n_dev_fields = data[pos]
+                    pos += 1
+                    for idx in range(n_dev_fields):
+                        offset += data[pos + 1]
+                        pos += 3
+                definition = _Definition(mesg_num, big_endian, fields, offset)
+                local_defs[header & 0x0F] = definition
+                if mesg_num == RECORD_MESG_NUM:
+                    definitions.append(definition)
+            else:
+                definition = local_defs.get(header & 0x0F)
+                if definition is None:
+                    raise FitDecodeError(f"Data message for undefined local type {header & 0x0F}")
+                if definition.timestamp_format is not None:
+                    timestamp = struct.unpack_from(definition.timestamp_format, data,
+                                                   pos + definition.timestamp_offset)[0]
+                    if timestamp != 0xFFFFFFFF:
+                        last_timestamp = timestamp
+                if definition.mesg_num == RECORD_MESG_NUM:
+                    definition.positions.append(n_records)
+                    definition.offsets.append(pos)
+                    n_records += 1
+                pos += definition.size
+        # skip the file CRC, another FIT file may be chained after it
+        pos = end + 2
+    return definitions, compressed, n_records
+
+
+def decode_fit_records(fit_file_path, fields=None):
+    """
+    Decode the record messages of a FIT file into a NumPy structured array.
+
+    Args:
+        fit_file_path (str): path to the FIT file
+        fields (list, optional): field names to keep, defaults to every field in RECORD_FIELDS
+
+    Returns:
+        np.ndarray: structured array with one row per record message. 'timestamp' is
+        datetime64[s] (UTC), everything else float64, scaled like fitparse does.
+        Fields that are missing from a message or hold the FIT invalid value are NaN
+        (NaT for timestamps).
+    """
+    with open(fit_file_path, 'rb') as f:
+        data = f.read()
+    definitions, compressed, n_records = _walk(data)
+    raw = np.frombuffer(data, dtype=np.uint8)
+
+    names = {num: spec[0] for num, spec in RECORD_FIELDS.items()}
+    columns = {name: np.full(n_records, np.nan) for name in names.values()}
+    for definition in definitions:
+        if not definition.positions:
+            continue
+        # gather the bytes of every message of this layout into an (n, size) block
+        offsets = np.asarray(definition.offsets, dtype=np.int64)
+        block = raw[offsets[:, None] + np.arange(definition.size)]
+        positions = np.asarray(definition.positions, dtype=np.int64)
+        byte_order = '>' if definition.big_endian else '<'
+        for field_num, offset, field_size, base_type in definition.fields:
+            if field_num not in RECORD_FIELDS or base_type not in BASE_TYPES:
+                continue
+            type_char, invalid = BASE_TYPES[base_type]
+            dtype = np.dtype(byte_order + type_char)
+            if field_size != dtype.itemsize:
+                # arrays of values are not used by any record field we keep
+                continue
+            values = np.ascontiguousarray(block[:, offset:offset + field_size]).view(dtype)[:, 0]
+            name, scale, value_offset, _ = RECORD_FIELDS[field_num]
+            decoded = values.astype(np.float64)
+            if invalid is not None:
+                decoded[values == invalid] = np.nan
+            else:
+                decoded[~np.isfinite(decoded)] = np.nan
+            if scale != 1:
+                decoded = decoded / scale
+            if value_offset:
+                decoded = decoded - value_offset
+            columns[name][positions] = decoded
+
+    if compressed:
+        compressed_positions = np.fromiter(compressed.keys(), dtype=np.int64, count=len(compressed))
+        columns['timestamp'][compressed_positions] = np.fromiter(compressed.values(), dtype=np.float64,
+                                                                 count=len(compressed))
+
+    for enhanced, short in ENHANCED_FALLBACKS.items():
+        missing = np.isnan(columns[enhanced])
+        columns[enhanced][missing] = columns[short][missing]
+
+    keep = fields if fields is not None else list(names.values())
+    dtype = [(name, 'datetime64[s]' if name == 'timestamp' else 'f8') for name in keep]
+    records = np.empty(n_records, dtype=dtype)
+    for name in keep:
+        if name == 'timestamp':
+            timestamps = columns['timestamp']
+            valid = ~np.isnan(timestamps)
+            out = np.full(n_records, np.datetime64('NaT'), dtype='datetime64[s]')
+            out[valid] = (timestamps[valid].astype(np.int64) + FIT_EPOCH_OFFSET).astype('datetime64[s]')
+            records['timestamp'] = out
+        else:
+            records[name] = columns[name]
+    return records
+
+
+def records_to_dataframe(records):
+    """Structured record array -> DataFrame, integer fields as nullable Int64 so nulls stay explicit"""
+    df = pd.DataFrame({name: records[name] for name in records.dtype.names})
+    for num, (name, scale, offset, integer) in RECORD_FIELDS.items():
+        if integer and name in df.columns and name != 'timestamp':
+            df[name] = df[name].astype('Int64')
+    return df
+
+
+def write_records(records, output_path, fmt=None):
+    """
+    Write decoded records as 'parquet', 'arrow' (Arrow IPC / feather), 'npz' or 'csv'.
+    The format follows the file extension unless fmt is given.
+    """
+    extension = '.' + fmt if fmt else os.path.splitext(output_path)[1].lower()
+    if extension == '.npz':
+        # np.savez appends .npz to names without it, write through a file object instead
+        with open(output_path, 'wb') as f:
+            np.savez(f, **{name: records[name] for name in records.dtype.names})
+        return
+    df = records_to_dataframe(records)
+    if extension == '.parquet':
+        df.to_parquet(output_path, index=False)
+    elif extension in ('.arrow', '.feather'):
+        df.to_feather(output_path)
+    elif extension == '.csv':
+        df.to_csv(output_path, index=False)
+    else:
+        raise ValueError(f"Unknown output format: {output_path}")
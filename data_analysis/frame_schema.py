@@ -0,0 +1,110 @@
+import numpy as np
+
+# Compact schema of the IMU frames, raw and processed:
+#   timestamp / epoch   int64 epoch ms (datetime64[ns, tz] once converted, also int64 underneath)
+#   sensor axes         float32, the sensors give far fewer significant digits than float32 holds
+#   orientation         float32 degrees; the filter itself runs in float64
+#   session / device    category, one small code per row instead of a string
+# acc + gyro with orientation is about 41 bytes per row instead of 72 with float64, so a
+# month of rides (~20M rows) fits in about 1 GB.
+TIME_COLUMNS = ['timestamp', 'epoch']
+SENSOR_COLUMNS = ['x', 'y', 'z']
+AXIS_COLUMNS = [f"{axis}_{sensor}" for sensor in ('acc', 'gyro', 'mag') for axis in SENSOR_COLUMNS]
+ORIENTATION_COLUMNS = ['roll', 'pitch', 'yaw']
+CATEGORY_COLUMNS = ['session', 'device']
+
+# read_csv dtypes of the sensor CSVs (phone app: timestamp, loggers: epoch), so raw
+# values are parsed straight into the compact types; absent columns are ignored
+SENSOR_CSV_DTYPES = {'timestamp': np.int64, 'epoch': np.int64, **{column: np.float32 for column in SENSOR_COLUMNS}}
+
+
+def constant_category(value, n_rows):
+    """Categorical column holding one value in every row, as int8 codes"""
+    import pandas as pd
+    return pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8), categories=[value])
+
+
+def compact_frame(df, session=None, device=None):
+    """
+    Cast an IMU frame to the compact schema, in place.
+
+    Columns the schema does not know are left alone, so the same call works on
+    raw sensor frames, merged acc/gyro frames and processed frames.
+
+    Args:
+        df (pd.DataFrame): frame to cast
+        session (str, optional): adds a 'session' category column with this value
+        device (str, optional): adds a 'device' category column with this value
+
+    Returns:
+        pd.DataFrame: df, for chaining
+    """
+    for column in df.columns:
+        dtype = df[column].dtype
+        if column in TIME_COLUMNS:
+            if dtype.kind in 'iu' and dtype != np.int64:
+                df[column] = df[column].astype(np.int64)
+        elif column in SENSOR_COLUMNS or column in AXIS_COLUMNS or column in ORIENTATION_COLUMNS:
+            if dtype.kind in 'fiu' and dtype != np.float32:
+                df[column] = df[column].astype(np.float32)
+        elif column in CATEGORY_COLUMNS and dtype != 'category':
+            df[column] = df[column].astype('category')
+    if session is not None:
+        df['session'] = constant_category(session, len(df))
+    if device is not None:
+        df['device'] = constant_category(device, len(df))
+    return df
+
+
+def concat_frames(frames):
+    """
+    Concatenate compact frames, e.g. several rides for a cross-ride analysis.
+
+    pd.concat turns category columns whose categories differ into plain object
+    strings; here the categories are unioned first, so they stay categories.
+    """
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+    frames = [df for df in frames if len(df.columns)]
+    if not frames:
+        return pd.DataFrame()
+    frames = [df.copy(deep=False) for df in frames]
+    for column in CATEGORY_COLUMNS:
+        if all(column in df and df[column].dtype == 'category' for df in frames):
+            categories = union_categoricals([df[column] for df in frames]).categories
+            for df in frames:
+                df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def frame_memory(df):
+    """Bytes held by a frame, its index and its string / category values included"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def memory_report(frames, print_report=True):
+    """
+    Memory footprint of processed frames, one row per session.
+
+    Args:
+        frames (dict): session name -> dataframe
+        print_report (bool): also print the table and the total
+
+    Returns:
+        pd.DataFrame: session, rows, mb, bytes_per_row and the dtypes that do not
+        follow the compact schema ('loose_columns')
+    """
+    import pandas as pd
+    rows = []
+    for session, df in frames.items():
+        size = frame_memory(df)
+        loose = [column for column in df.columns
+                 if (column in AXIS_COLUMNS or column in ORIENTATION_COLUMNS) and df[column].dtype != np.float32]
+        rows.append({'session': session, 'rows': len(df), 'mb': round(size / 1024 ** 2, 2),
+                     'bytes_per_row': round(size / len(df), 1) if len(df) else None,
+                     'loose_columns': ', '.join(loose)})
+    report = pd.DataFrame(rows, columns=['session', 'rows', 'mb', 'bytes_per_row', 'loose_columns'])
+    if print_report and len(report):
+        print(report.to_string(index=False))
+        print(f"Total: {report['rows'].sum()} rows, {report['mb'].sum():.2f} MB")
+    return report
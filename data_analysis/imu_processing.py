@@ -0,0 +1,241 @@
+import os
+import numpy as np
+import pandas as pd
+from orientation import timestamps_to_dt, batch_kalman_roll_pitch, stack_sessions, unstack_sessions, StreamingKalman
+from chunked_processing import aligned_chunks, BucketAggregator, ChunkWriter, DEFAULT_CHUNK_ROWS
+from session_cache import folder_csv_files
+from resampling import resample_sensors, DEFAULT_MAX_GAP_MS
+from rolling_iqr import grouped_iqr
+from instrumentation import instruments, instrumented
+from timestamps import epoch_ms_to_datetime
+from frame_schema import compact_frame, SENSOR_CSV_DTYPES
+from utils import DEFAULT_TIMEZONE, S3_PROCESSING_PARAMS
+
+# folders per process_season batch: above MIN_BATCH_SESSIONS so the vectorised filter is
+# used, ~2 GB of padded float64 arrays for one-hour 100 Hz rides
+SEASON_BATCH_SESSIONS = 64
+
+
+def load_s3_folder(s3_data_folder, s3_folder, resample_hz=None, max_gap_ms=DEFAULT_MAX_GAP_MS):
+    """
+    Read the accelerometer and gyroscope CSVs of an S3 folder and join them on timestamp.
+    
+    With resample_hz, both sensors are interpolated onto a common uniform clock
+    instead of keeping only the samples whose timestamps match exactly; grid points
+    without data are flagged in the 'gap' columns (see resampling.resample_sensors).
+    Epochs are read as int64 and the axes as float32 (see frame_schema).
+    """
+    # imu_data = []
+    csv_files = sorted([f for f in os.listdir(os.path.join(s3_data_folder, s3_folder)) if f.endswith('.csv') ])
+    with instruments.stage('read_csv'):
+        acc_df = pd.read_csv(os.path.join(os.path.join(s3_data_folder, s3_folder), csv_files[0]), dtype=SENSOR_CSV_DTYPES)
+        gyro_df = pd.read_csv(os.path.join(os.path.join(s3_data_folder, s3_folder), csv_files[1]), dtype=SENSOR_CSV_DTYPES)
+        instruments.add_rows(len(acc_df) + len(gyro_df))
+    # mag_df = pd.read_csv(os.path.join(os.path.join(s3_data_folder, s3_folder), csv_files[2]))
+    if resample_hz:
+        return compact_frame(resample_sensors({'acc': acc_df, 'gyro': gyro_df}, resample_hz, max_gap_ms))
+    return merge_acc_gyro(acc_df, gyro_df)
+
+def merge_acc_gyro(acc_df, gyro_df):
+    """
+    Inner join of accelerometer and gyroscope samples on timestamp.
+
+    sort=True keeps the result in timestamp order; without it pandas may group
+    duplicated timestamps out of order, which breaks the filter's dt and makes
+    the row order depend on how much of the files is joined at once.
+    """
+    return pd.merge(acc_df, gyro_df, on='timestamp', how='inner', suffixes=('_acc', '_gyro'), sort=True)
+
+def process_s3_folder(s3_data_folder, s3_folder, tz=DEFAULT_TIMEZONE, resample_hz=None, max_gap_ms=DEFAULT_MAX_GAP_MS):
+    merged_df = load_s3_folder(s3_data_folder, s3_folder, resample_hz, max_gap_ms)
+    return _process_merged_dfs([merged_df], tz, [s3_folder])[0]
+
+def iter_s3_folder_chunks(s3_data_folder, s3_folder, tz=DEFAULT_TIMEZONE, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Bounded-memory version of process_s3_folder.
+
+    The accelerometer and gyroscope CSVs are read side by side in timestamp-aligned
+    chunks and the Kalman filter state is carried from chunk to chunk, so memory
+    depends on chunk_rows and not on the length of the session. Concatenating the
+    yielded chunks gives the same dataframe as process_s3_folder.
+
+    Yields:
+        pd.DataFrame: processed rows, in timestamp order
+    """
+    folder_path = os.path.join(s3_data_folder, s3_folder)
+    csv_files = folder_csv_files(folder_path)[:2]
+    kalman = StreamingKalman()
+    pending = None
+    for acc_df, gyro_df in aligned_chunks(csv_files, 'timestamp', chunk_rows, dtype=SENSOR_CSV_DTYPES):
+        merged_df = merge_acc_gyro(acc_df, gyro_df)
+        if pending is not None:
+            merged_df = pd.concat([pending, merged_df], ignore_index=True)
+            pending = None
+        if kalman.last_timestamp is None and len(merged_df) < 2:
+            # the first dt of a session is taken from its second sample
+            pending = merged_df
+            continue
+        yield _process_merged_chunk(merged_df, kalman, tz, s3_folder)
+    if pending is not None and len(pending):
+        yield _process_merged_chunk(pending, kalman, tz, s3_folder)
+
+def _process_merged_chunk(merged_df, kalman, tz, session=None):
+    merged_df['roll'], merged_df['pitch'] = kalman.update(
+        merged_df['x_acc'].to_numpy(), merged_df['y_acc'].to_numpy(), merged_df['z_acc'].to_numpy(),
+        merged_df['x_gyro'].to_numpy(), merged_df['y_gyro'].to_numpy(), merged_df['timestamp'].to_numpy())
+    merged_df['timestamp'] = epoch_ms_to_datetime(merged_df['timestamp'], tz)
+    return compact_frame(merged_df, session)
+
+@instrumented('process_chunked', rows=lambda summary: summary['rows'])
+def summarize_s3_folder(s3_data_folder, s3_folder, tz=DEFAULT_TIMEZONE, chunk_rows=DEFAULT_CHUNK_ROWS,
+                        output_path=None):
+    """
+    Stream one S3 folder through iter_s3_folder_chunks, keeping only what the plots need.
+
+    Args:
+        output_path (str, optional): .parquet or .csv file the processed rows are
+            appended to as they are produced
+
+    Returns:
+        dict with the first and last timestamp, the row count, the 5 s roll/pitch IQR
+        ('iqr', as plotted by plot_imu_garmin_comparison) and the samples per second
+        ('frame_rate', as plotted by analyze_frame_rates)
+    """
+    iqr = BucketAggregator('timestamp', '5s', ['roll', 'pitch'], agg='iqr')
+    frame_rate = BucketAggregator('timestamp', '1s', fill_value=0)
+    writer = ChunkWriter(output_path) if output_path else None
+    summary = {'start': None, 'end': None, 'rows': 0}
+    try:
+        for chunk in iter_s3_folder_chunks(s3_data_folder, s3_folder, tz, chunk_rows):
+            if len(chunk) == 0:
+                continue
+            if summary['start'] is None:
+                summary['start'] = chunk['timestamp'].iloc[0]
+            summary['end'] = chunk['timestamp'].iloc[-1]
+            summary['rows'] += len(chunk)
+            iqr.push(chunk)
+            frame_rate.push(chunk)
+            if writer is not None:
+                writer.write(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    summary['iqr'] = iqr.result()
+    summary['frame_rate'] = frame_rate.result()
+    return summary
+
+def summarize_imu_df(imu_df):
+    """
+    The plot summary of summarize_s3_folder for an already processed IMU dataframe.
+
+    Plotting many activities only needs these few thousand aggregated rows, so the
+    full-rate frames can be released before any figure is drawn.
+    """
+    if len(imu_df) == 0:
+        return {'start': None, 'end': None, 'rows': 0,
+                'iqr': grouped_iqr(imu_df, 'timestamp', ['roll', 'pitch'], '5s'), 'frame_rate': pd.Series(dtype=np.int64)}
+    return {'start': imu_df['timestamp'].iloc[0], 'end': imu_df['timestamp'].iloc[-1], 'rows': len(imu_df),
+            'iqr': grouped_iqr(imu_df, 'timestamp', ['roll', 'pitch'], '5s'),
+            'frame_rate': imu_df.groupby(pd.Grouper(key='timestamp', freq='1s')).size()}
+
+def process_s3_folders(s3_data_folder, s3_folders, cache=None, tz=DEFAULT_TIMEZONE, resample_hz=None,
+                       max_gap_ms=DEFAULT_MAX_GAP_MS):
+    """
+    Process several S3 folders at once, filtering all sessions in one batched Kalman run.
+    
+    Args:
+        s3_data_folder (str): folder holding the S3 session folders
+        s3_folders (list): session folder names
+        cache (SessionCache, optional): if given, folders already in the cache are
+            loaded from it and newly processed ones are stored in it
+        tz (str): timezone of the returned timestamps
+        resample_hz (float, optional): put acc and gyro on a uniform clock at this rate
+        max_gap_ms (float): longest sample spacing bridged by the resampling
+    
+    Returns:
+        list: one processed dataframe per folder, same as process_s3_folder, in the
+        compact schema of frame_schema with the folder name as 'session'
+    """
+    params = _processing_params(tz, resample_hz, max_gap_ms)
+    imu_dfs = [None] * len(s3_folders)
+    to_process = []
+    for idx, s3_folder in enumerate(s3_folders):
+        if cache is not None:
+            source_files = folder_csv_files(os.path.join(s3_data_folder, s3_folder))
+            imu_dfs[idx] = cache.get(source_files, params)
+        if imu_dfs[idx] is None:
+            to_process.append(idx)
+    
+    processed_dfs = _process_merged_dfs([load_s3_folder(s3_data_folder, s3_folders[idx], resample_hz, max_gap_ms)
+                                         for idx in to_process], tz, [s3_folders[idx] for idx in to_process])
+    for idx, imu_df in zip(to_process, processed_dfs):
+        imu_dfs[idx] = imu_df
+        if cache is not None:
+            source_files = folder_csv_files(os.path.join(s3_data_folder, s3_folders[idx]))
+            cache.put(source_files, imu_df, params)
+    return imu_dfs
+
+def _processing_params(tz, resample_hz, max_gap_ms):
+    """Cache parameters of process_s3_folders"""
+    params = {**S3_PROCESSING_PARAMS, 'tz': tz}
+    if resample_hz:
+        params.update({'resample_hz': resample_hz, 'max_gap_ms': max_gap_ms})
+    return params
+
+@instrumented('season_batch')
+def process_season(s3_data_folder, s3_folders, cache, tz=DEFAULT_TIMEZONE, resample_hz=None,
+                   max_gap_ms=DEFAULT_MAX_GAP_MS, batch_sessions=SEASON_BATCH_SESSIONS):
+    """
+    Fill the session cache for many folders at once, e.g. every folder of a season's activities.
+
+    An activity only has a handful of folders, too few for batch_kalman_roll_pitch to
+    beat the per-session loop. Here the uncached folders of all activities are filtered
+    together, batch_sessions at a time to bound memory (the batch is padded to its
+    longest session), so the activities afterwards only read the cache.
+
+    Returns:
+        list: the folders that were processed (the others were cached already)
+    """
+    params = _processing_params(tz, resample_hz, max_gap_ms)
+    to_process = [s3_folder for s3_folder in s3_folders
+                  if not cache.contains(folder_csv_files(os.path.join(s3_data_folder, s3_folder)), params)]
+    for start in range(0, len(to_process), batch_sessions):
+        # frames go to the cache, dropping them here keeps one batch in memory at a time
+        process_s3_folders(s3_data_folder, to_process[start:start + batch_sessions], cache, tz, resample_hz,
+                           max_gap_ms)
+    return to_process
+
+def _process_merged_dfs(merged_dfs, tz=DEFAULT_TIMEZONE, sessions=None):
+    """
+    Batched orientation + timestamp conversion for a list of merged acc/gyro dataframes.
+    
+    Rows flagged as resampling gaps are skipped by the filter, the dt of the next
+    row spans the gap, and their roll/pitch are NaN. The filter runs in float64,
+    the frames are returned in the compact schema, with sessions (one name per
+    frame) as their 'session' column.
+    """
+    if len(merged_dfs) == 0:
+        return []
+    
+    valid_dfs = [df[~df['gap'].to_numpy()] if 'gap' in df else df for df in merged_dfs]
+    columns = ['x_acc', 'y_acc', 'z_acc', 'x_gyro', 'y_gyro']
+    stacked = [stack_sessions([df[col].to_numpy() for df in valid_dfs])[0] for col in columns]
+    dt, mask = stack_sessions([timestamps_to_dt(df['timestamp'].to_numpy()) for df in valid_dfs])
+    with instruments.stage('kalman', rows=int(mask.sum())):
+        roll, pitch = batch_kalman_roll_pitch(*stacked, dt, mask=mask)
+    
+    sessions = sessions or [None] * len(merged_dfs)
+    for merged_df, df_roll, df_pitch, session in zip(merged_dfs, unstack_sessions(roll, mask),
+                                                     unstack_sessions(pitch, mask), sessions):
+        if 'gap' in merged_df:
+            valid = ~merged_df['gap'].to_numpy()
+            for column, values in (('roll', df_roll), ('pitch', df_pitch)):
+                full = np.full(len(merged_df), np.nan, dtype=np.float32)
+                full[valid] = values
+                merged_df[column] = full
+        else:
+            merged_df['roll'] = df_roll.astype(np.float32)
+            merged_df['pitch'] = df_pitch.astype(np.float32)
+        merged_df['timestamp'] = epoch_ms_to_datetime(merged_df['timestamp'], tz)
+        compact_frame(merged_df, session)
+    return merged_dfs
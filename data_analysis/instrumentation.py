@@ -0,0 +1,203 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+class _ProfileStats:
+    """Picklable cProfile results of one stage run, in the form pstats.Stats() loads"""
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class _NullStage:
+    """What stage() returns while instrumentation is off: enters and exits without doing anything"""
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, instruments, name, activity, rows):
+        self.instruments = instruments
+        self.record = {'stage': name, 'activity': activity, 'rows': rows}
+
+    def __enter__(self):
+        instruments = self.instruments
+        parent = instruments._stack[-1] if instruments._stack else None
+        record = self.record
+        if record['activity'] is None:
+            record['activity'] = parent.record['activity'] if parent else None
+        record['parent'] = parent.record['stage'] if parent else None
+        record['pid'] = os.getpid()
+        record['start'] = time.time()
+        self.child_peak = 0
+        if instruments.trace_memory:
+            if parent is not None:
+                # resetting the peak below loses the parent's peak so far, keep it on the parent
+                parent.child_peak = max(parent.child_peak, tracemalloc.get_traced_memory()[1])
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.profiler = None
+        if instruments.profile_stage == record['stage']:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        instruments._stack.append(self)
+        self.wall_start, self.cpu_start = time.perf_counter(), time.process_time()
+        return record
+
+    def __exit__(self, exc_type, exc, tb):
+        wall, cpu = time.perf_counter() - self.wall_start, time.process_time() - self.cpu_start
+        instruments = self.instruments
+        instruments._stack.pop()
+        record = self.record
+        record['wall_s'] = round(wall, 6)
+        record['cpu_s'] = round(cpu, 6)
+        record['rows_per_s'] = round(record['rows'] / wall, 1) if record['rows'] and wall > 0 else None
+        record['error'] = exc_type.__name__ if exc_type else None
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.create_stats()
+            instruments._profiles.append(_ProfileStats(self.profiler.stats))
+        if instruments.trace_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            record['tracemalloc_peak_mb'] = round((peak - self.memory_start) / 1024 ** 2, 3)
+            if instruments._stack:
+                parent = instruments._stack[-1]
+                parent.child_peak = max(parent.child_peak, peak)
+        instruments.records.append(record)
+        return False
+
+
+class Instrumentation:
+    """
+    Per-stage wall time, CPU time, row counts and (optionally) tracemalloc peaks.
+
+    Stages are marked with `with instruments.stage('name'):` or the @instrumented
+    decorator and may nest; every finished stage adds one record. While disabled,
+    stage() returns a shared no-op context manager, so instrumented code pays one
+    attribute check per stage.
+
+    tracemalloc slows Python allocations down noticeably, so memory tracing is a
+    separate switch. Its peak is process-wide, so stages running at the same time in
+    other threads count towards each other's peaks. With profile_stage, every run of that stage is also profiled
+    with cProfile and the combined stats are written by write_report.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.profile_stage = None
+        self.records = []
+        self._profiles = []
+        # running stages, per thread so stages in worker threads nest on their own
+        self._local = threading.local()
+
+    @property
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def configure(self, enabled=True, trace_memory=False, profile_stage=None):
+        """Switch instrumentation on or off, dropping what was collected (e.g. inherited by a forked worker)"""
+        self.records, self._profiles = [], []
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.profile_stage = profile_stage if enabled else None
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name, activity=None, rows=None):
+        """
+        Context manager timing one stage. It yields the stage's record, set
+        record['rows'] inside the block when the row count is only known there
+        (the record is None while disabled, see add_rows).
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, activity, rows)
+
+    def add_rows(self, rows):
+        """Add to the row count of the innermost running stage"""
+        if self.enabled and self._stack:
+            record = self._stack[-1].record
+            record['rows'] = (record['rows'] or 0) + rows
+
+    def collect(self):
+        """Records and profiles collected so far, taken out of this instance to send them back from a worker"""
+        collected = {'records': self.records, 'profiles': self._profiles}
+        self.records, self._profiles = [], []
+        return collected
+
+    def merge(self, collected):
+        """Add what collect() returned in another process"""
+        self.records.extend(collected['records'])
+        self._profiles.extend(collected['profiles'])
+
+    def summary(self):
+        """Totals per stage: calls, wall and CPU seconds, rows and the largest tracemalloc peak"""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0,
+                                                        'tracemalloc_peak_mb': None})
+            total['calls'] += 1
+            total['wall_s'] = round(total['wall_s'] + record['wall_s'], 6)
+            total['cpu_s'] = round(total['cpu_s'] + record['cpu_s'], 6)
+            total['rows'] += record['rows'] or 0
+            if record.get('tracemalloc_peak_mb') is not None:
+                total['tracemalloc_peak_mb'] = max(total['tracemalloc_peak_mb'] or 0, record['tracemalloc_peak_mb'])
+        return totals
+
+    def write_report(self, report_path):
+        """Write the records and the per-stage summary as JSON, and the cProfile stats next to it"""
+        if os.path.dirname(report_path):
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        report = {'trace_memory': self.trace_memory, 'profile_stage': self.profile_stage,
+                  'summary': self.summary(), 'records': self.records}
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        if self._profiles:
+            import pstats
+            stats = pstats.Stats(self._profiles[0])
+            for profiler in self._profiles[1:]:
+                stats.add(profiler)
+            stats.dump_stats(os.path.join(os.path.dirname(report_path), f"profile_{self.profile_stage}.prof"))
+        return report
+
+
+# one instance per process, configured by the entry point (and by pool workers)
+instruments = Instrumentation()
+
+
+def instrumented(name, rows=None):
+    """
+    Decorator running the function as a stage.
+
+    Args:
+        name (str): stage name
+        rows (callable, optional): rows(result) gives the row count of a call
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not instruments.enabled:
+                return fn(*args, **kwargs)
+            with instruments.stage(name) as record:
+                result = fn(*args, **kwargs)
+                if rows is not None:
+                    record['rows'] = rows(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def _as_int64(values):
+    """Interval bounds as int64; datetimes become nanoseconds since the epoch"""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64)
+    return values.astype(np.int64)
+
+
+def _ordered(start, end):
+    """(start, end) with the bounds of reversed intervals swapped"""
+    return np.minimum(start, end), np.maximum(start, end)
+
+
+def overlap_join(a_start, a_end, b_start, b_end):
+    """
+    Find every overlapping pair between two sets of closed intervals.
+
+    Sweep-line join: all start/end points are sorted once, then swept in order while
+    keeping the set of currently open intervals of each side. When an interval opens
+    it is paired with every open interval of the other side, so the cost is
+    O((A + B) log(A + B) + k) for k overlapping pairs instead of A * B comparisons.
+
+    Args:
+        a_start, a_end: bounds of the first set (ints, floats or datetime64)
+        b_start, b_end: bounds of the second set, same units as the first. An
+            interval given with start > end (e.g. a recording whose last sample has
+            an earlier timestamp than its first) is swapped round; left as is, its
+            end would be swept before its start and it would never close.
+
+    Returns:
+        dict of equal-length arrays, one entry per overlapping pair, sorted by (a, b):
+            'a', 'b': indices into the two input sets
+            'overlap': overlap duration, in the input units (ns for datetimes)
+            'a_fraction', 'b_fraction': overlap as a fraction of each interval's length
+    """
+    a_start, a_end = _ordered(_as_int64(a_start), _as_int64(a_end))
+    b_start, b_end = _ordered(_as_int64(b_start), _as_int64(b_end))
+    n_a, n_b = len(a_start), len(b_start)
+
+    times = np.concatenate([a_start, b_start, a_end, b_end])
+    # 0 = start, 1 = end: at equal times starts go first, so touching intervals overlap
+    is_end = np.repeat([0, 0, 1, 1], [n_a, n_b, n_a, n_b])
+    side = np.repeat([0, 1, 0, 1], [n_a, n_b, n_a, n_b])
+    ids = np.concatenate([np.arange(n_a), np.arange(n_b), np.arange(n_a), np.arange(n_b)])
+    order = np.lexsort((is_end, times))
+
+    active = (set(), set())
+    pairs_a, pairs_b = [], []
+    for event_end, event_side, event_id in zip(is_end[order].tolist(), side[order].tolist(), ids[order].tolist()):
+        if event_end:
+            active[event_side].discard(event_id)
+            continue
+        other = active[1 - event_side]
+        if other:
+            if event_side == 0:
+                pairs_a.extend([event_id] * len(other))
+                pairs_b.extend(other)
+            else:
+                pairs_a.extend(other)
+                pairs_b.extend([event_id] * len(other))
+        active[event_side].add(event_id)
+
+    a_idx = np.asarray(pairs_a, dtype=np.int64)
+    b_idx = np.asarray(pairs_b, dtype=np.int64)
+    sort = np.lexsort((b_idx, a_idx))
+    a_idx, b_idx = a_idx[sort], b_idx[sort]
+
+    overlap = np.minimum(a_end[a_idx], b_end[b_idx]) - np.maximum(a_start[a_idx], b_start[b_idx])
+    a_length = a_end[a_idx] - a_start[a_idx]
+    b_length = b_end[b_idx] - b_start[b_idx]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # a zero-length interval that overlaps at all is fully covered
+        a_fraction = np.where(a_length > 0, overlap / a_length, 1.0)
+        b_fraction = np.where(b_length > 0, overlap / b_length, 1.0)
+
+    return {
+        'a': a_idx,
+        'b': b_idx,
+        'overlap': overlap,
+        'a_fraction': a_fraction,
+        'b_fraction': b_fraction,
+    }
@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import requests
+from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from fit_conversion import fit_to_csv, RECORDS_TO_STORE
+
+
+class IntervalsAPI:
+    def __init__(self, base_url, athlete_id, api_key, max_connections=4, max_retries=5):
+        self.base_url = base_url
+        self.athlete_id = athlete_id
+        self.api_key = api_key
+        self.auth = HTTPBasicAuth('API_KEY', api_key)
+        self.records_to_store = list(RECORDS_TO_STORE)
+        
+        # one keep-alive session for every request; 429/5xx are retried with backoff,
+        # waiting as long as the server's Retry-After header asks for
+        retry = Retry(total=max_retries, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET'], respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=retry)
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _make_request(self, url, **kwargs):
+        """Helper method to make HTTP requests with error handling"""
+        try:
+            response = self.session.get(url, **kwargs)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred: {e}")
+            return None
+
+    def get_all_activities(self):
+        """Get all activities from Intervals.icu"""
+        events_url = f"{self.base_url}/athlete/{self.athlete_id}/events.csv"
+        return self._make_request(events_url)
+
+    def get_recent_activities(self, days=30):
+        """
+        Fetches activities from the current day up to 'days' days prior.
+        
+        Parameters:
+        - days (int): Number of days to look back from today. Default is 30.
+        
+        Returns:
+        - list: A list of activity dictionaries within the specified date range.
+        """
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days)
+        
+        start_date_str = start_date.isoformat()
+        end_date_str = end_date.isoformat()
+        
+        activities_url = f"{self.base_url}/athlete/{self.athlete_id}/activities?oldest={start_date_str}&newest={end_date_str}"
+        
+        response = self._make_request(activities_url)
+        return response.json() if response else []
+
+    def download_fit_file(self, activity_id, save_path):
+        """
+        Downloads the FIT file for a given activity ID from Intervals.icu.
+        
+        The file is streamed into '<save_path>.part' and renamed once complete. If a
+        '.part' file is left over from an interrupted run, the download resumes from
+        its size with a Range request. The ETag / Last-Modified of the first response
+        is kept next to it and sent as If-Range, so a file that changed on the server
+        is downloaded whole instead of appended to the old prefix; a server ignoring
+        the range also sends the whole file. A ranged request that fails (e.g. 416
+        for a '.part' already complete or longer than the file) discards the '.part'
+        and starts over once from the beginning.
+        
+        Parameters:
+        - activity_id (str): The ID of the activity whose FIT file is to be downloaded.
+        - save_path (str): The file path where the FIT file will be saved.
+        """
+        fit_file_url = f"{self.base_url}/activity/{activity_id}/fit-file"
+        part_path = f"{save_path}.part"
+        
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        downloaded = self._download_part(fit_file_url, part_path, offset)
+        if downloaded is None and offset:
+            print(f"Could not resume activity {activity_id}, downloading it again")
+            self._discard_part(part_path)
+            downloaded = self._download_part(fit_file_url, part_path, 0)
+        if not downloaded:
+            return False
+        os.replace(part_path, save_path)
+        self._discard_part(part_path)
+        print(f"FIT file successfully downloaded and saved to {save_path}")
+        return True
+
+    def _download_part(self, url, part_path, offset):
+        """
+        Stream url into part_path from offset on.
+        
+        Returns:
+        - True once complete, False if the transfer broke off (the '.part' is kept to
+          resume from), None if the request itself failed
+        """
+        validator_path = f"{part_path}.validator"
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if os.path.exists(validator_path):
+                with open(validator_path) as f:
+                    headers['If-Range'] = f.read()
+        response = self._make_request(url, headers=headers, stream=True)
+        if response is None:
+            return None
+        
+        # 206 means the server honoured the range, anything else is the whole file
+        resumed = offset and response.status_code == 206
+        if not resumed:
+            # weak ETags cannot be used in If-Range
+            etag = response.headers.get('ETag', '')
+            validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+            if validator:
+                with open(validator_path, 'w') as f:
+                    f.write(validator)
+            elif os.path.exists(validator_path):
+                os.remove(validator_path)
+        try:
+            with response, open(part_path, 'ab' if resumed else 'wb') as fit_file:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    fit_file.write(chunk)
+        except (requests.exceptions.RequestException, OSError) as e:
+            # keep the .part file, the next run resumes from it
+            print(f"Download of {url} interrupted: {e}")
+            return False
+        return True
+
+    @staticmethod
+    def _discard_part(part_path):
+        """Remove a '.part' file and its validator, where they exist"""
+        for path in (part_path, f"{part_path}.validator"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def download_fit_files(self, downloads, workers=4):
+        """
+        Download and convert several FIT files concurrently.
+        
+        Downloads run on a pool of `workers` threads sharing the pooled session; each
+        finished download is handed to a separate conversion thread right away, so FIT
+        to CSV conversion overlaps with the downloads still in flight.
+        
+        Parameters:
+        - downloads (list): (activity_id, fit_path) tuples. FIT files that already
+          exist are not downloaded again, only converted if their CSV is missing.
+        - workers (int): number of concurrent downloads
+        
+        Returns:
+        - list: CSV paths that were written
+        """
+        converted = []
+        
+        def download(activity_id, fit_path):
+            if os.path.exists(fit_path) or self.download_fit_file(activity_id, fit_path):
+                return fit_path
+            return None
+        
+        def convert(fit_path):
+            csv_path = fit_path.replace(".fit", ".csv")
+            if self.fit_to_csv(fit_path, csv_path):
+                converted.append(csv_path)
+        
+        with ThreadPoolExecutor(max_workers=1) as converter, \
+                ThreadPoolExecutor(max_workers=workers) as downloader:
+            futures = [downloader.submit(download, activity_id, fit_path) for activity_id, fit_path in downloads]
+            conversions = []
+            for future in as_completed(futures):
+                fit_path = future.result()
+                if fit_path is not None:
+                    conversions.append(converter.submit(convert, fit_path))
+            for conversion in conversions:
+                conversion.result()
+        return sorted(converted)
+
+    def fit_to_csv(self, fit_file_path, csv_file_path):
+        """Converts a FIT file to a CSV file with the records_to_store columns, see fit_conversion.fit_to_csv"""
+        return fit_to_csv(fit_file_path, csv_file_path, fields=self.records_to_store)
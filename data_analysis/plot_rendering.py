@@ -0,0 +1,97 @@
+import os
+import sys
+import numpy as np
+
+# points per line after decimation; a 12 inch figure at 100 dpi is 1200 pixels wide,
+# so more points than this only add drawing time
+DEFAULT_MAX_POINTS = 4000
+
+# one figure per name and process, cleared and resized for every plot
+_figures = {}
+
+
+def use_headless_backend():
+    """Switch matplotlib to the Agg backend, for plots that are only written to files"""
+    if 'matplotlib' not in sys.modules:
+        # picked up when matplotlib is first imported, so entry points do not have to import it up front
+        os.environ['MPLBACKEND'] = 'Agg'
+        return
+    import matplotlib
+    if matplotlib.get_backend().lower() != 'agg':
+        matplotlib.use('Agg', force=True)
+
+
+def reusable_figure(name, n_rows, width=12, row_height=6):
+    """
+    A figure with n_rows stacked axes, reused across calls with the same name.
+
+    The figure is a plain matplotlib Figure, not registered with pyplot, so it is
+    never kept alive by pyplot's figure manager and repeated plots do not pile
+    up figures. Clearing and resizing an existing figure is also cheaper than
+    building a new one.
+
+    Returns:
+        (Figure, list): the figure and its axes, top to bottom
+    """
+    from matplotlib.figure import Figure
+    fig = _figures.get(name)
+    if fig is None:
+        fig = _figures[name] = Figure()
+    else:
+        fig.clear()
+    fig.set_size_inches(width, row_height * n_rows)
+    axes = fig.subplots(n_rows, 1, squeeze=False)[:, 0]
+    return fig, list(axes)
+
+
+def save_figure(fig, save_path):
+    """Save a figure, writing to a temporary file first so an interrupted run leaves no half-written PNG"""
+    if os.path.dirname(save_path):
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    root, ext = os.path.splitext(save_path)
+    tmp_path = f"{root}.part{ext}"
+    fig.savefig(tmp_path)
+    os.replace(tmp_path, save_path)
+
+
+def decimate(x, y, max_points=DEFAULT_MAX_POINTS):
+    """
+    Reduce a series to at most max_points points that draw the same line.
+
+    The series is cut into max_points / 2 buckets and the minimum and maximum of
+    every bucket are kept in time order, so spikes and dropouts stay visible,
+    unlike taking every n-th sample.
+
+    Args:
+        x: x values (e.g. a DatetimeIndex), same length as y
+        y: y values, NaNs are kept as line breaks
+        max_points (int): point budget
+
+    Returns:
+        (x, y): the decimated series, of the input types
+    """
+    import pandas as pd
+    n = len(y)
+    if n <= max_points:
+        return x, y
+    values = np.asarray(y, dtype=np.float64)
+    bucket_size = int(np.ceil(n / (max_points // 2)))
+    n_full = (n // bucket_size) * bucket_size
+    buckets = values[:n_full].reshape(-1, bucket_size)
+    starts = np.arange(0, n_full, bucket_size)
+    keep = [starts + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1),
+            starts + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)]
+    if n_full < n:
+        tail = values[n_full:]
+        keep.append(np.array([n_full + np.argmin(np.where(np.isnan(tail), np.inf, tail)),
+                              n_full + np.argmax(np.where(np.isnan(tail), -np.inf, tail))]))
+    keep = np.unique(np.concatenate(keep))
+    if isinstance(y, pd.Series):
+        y = y.iloc[keep]
+    else:
+        y = np.asarray(y)[keep]
+    if isinstance(x, (pd.Index, pd.Series)):
+        x = x[keep] if isinstance(x, pd.Index) else x.iloc[keep]
+    else:
+        x = np.asarray(x)[keep]
+    return x, y
@@ -0,0 +1,127 @@
+import numpy as np
+
+# grid points further than this from a real sample pair are gaps, not interpolated values
+DEFAULT_MAX_GAP_MS = 50
+
+
+def _clean_samples(timestamps, values):
+    """
+    Sort samples by time and average samples sharing a timestamp.
+
+    Sorting is skipped for files that are already in order, which is the normal
+    case, so this stays linear in the number of samples.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+    if len(timestamps) > 1 and np.any(timestamps[1:] == timestamps[:-1]):
+        starts = np.flatnonzero(np.concatenate([[True], timestamps[1:] != timestamps[:-1]]))
+        counts = np.diff(np.append(starts, len(timestamps)))
+        values = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+        timestamps = timestamps[starts]
+    return timestamps, values
+
+
+def uniform_grid(start, end, rate_hz):
+    """
+    Timestamps (ms) of a uniform grid at rate_hz covering [start, end].
+
+    The grid is aligned to multiples of the step, so sessions resampled at the same
+    rate share grid points. Integer steps give an int64 grid, others float64.
+    """
+    step = 1000.0 / rate_hz
+    first = np.ceil(start / step) * step
+    n = int(np.floor((end - first) / step)) + 1 if end >= first else 0
+    grid = first + np.arange(n) * step
+    if step.is_integer():
+        grid = np.round(grid).astype(np.int64)
+    return grid
+
+
+def resample_to_grid(timestamps, values, grid, max_gap=DEFAULT_MAX_GAP_MS):
+    """
+    Linearly interpolate one sensor onto grid timestamps.
+
+    Args:
+        timestamps: sample timestamps (ms), in any order, duplicates are averaged
+        values: (n,) or (n, k) sample values
+        grid: grid timestamps (ms), sorted
+        max_gap: grid points between two samples further apart than this (ms) are
+            gaps; their values are NaN instead of being bridged
+
+    Returns:
+        (resampled, valid): (len(grid), k) values and a boolean mask of the grid
+        points that have data
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    timestamps, values = _clean_samples(timestamps, values)
+    grid = np.asarray(grid, dtype=np.float64)
+    out = np.full((len(grid), values.shape[1]), np.nan)
+    if len(timestamps) == 0:
+        return out, np.zeros(len(grid), dtype=bool)
+
+    right = np.searchsorted(timestamps, grid, side='left')
+    left = np.clip(right - 1, 0, len(timestamps) - 1)
+    right_clipped = np.clip(right, 0, len(timestamps) - 1)
+    exact = timestamps[right_clipped] == grid
+    inside = (right > 0) & (right < len(timestamps))
+    valid = exact | (inside & (timestamps[right_clipped] - timestamps[left] <= max_gap))
+
+    for column in range(values.shape[1]):
+        out[:, column] = np.interp(grid, timestamps, values[:, column])
+    out[~valid] = np.nan
+    return out, valid
+
+
+def resample_sensors(sensors, rate_hz, max_gap=DEFAULT_MAX_GAP_MS, time_column='timestamp',
+                     columns=('x', 'y', 'z'), suffixes=None):
+    """
+    Put several sensors onto one uniform clock.
+
+    The grid spans the time all sensors were recording. Every sensor is
+    interpolated onto it independently, so samples no longer have to share exact
+    timestamps to be used together.
+
+    Args:
+        sensors (dict): sensor name -> dataframe, e.g. {'acc': acc_df, 'gyro': gyro_df}
+        rate_hz (float): grid rate
+        max_gap (float or dict): see resample_to_grid; a dict gives a value per sensor
+            name, for sensors sampled much slower than the others (e.g. the magnetometer)
+        time_column (str): timestamp column (ms) of the sensor dataframes
+        columns (tuple): value columns to resample
+        suffixes (dict, optional): sensor name -> column suffix, defaults to '_<name>'
+
+    Returns:
+        pd.DataFrame: time_column with the grid, '<column><suffix>' for every sensor,
+        'gap_<name>' flags per sensor and 'gap', True where any sensor has no data
+    """
+    # the sensors are dataframes, so pandas is loaded by now; importing it here keeps
+    # the module (and DEFAULT_MAX_GAP_MS) cheap to import for the CLI
+    import pandas as pd
+    suffixes = suffixes or {}
+    starts = [df[time_column].min() for df in sensors.values()]
+    ends = [df[time_column].max() for df in sensors.values()]
+    if len(sensors) == 0 or any(pd.isna(starts)):
+        grid = np.empty(0, dtype=np.int64)
+    else:
+        grid = uniform_grid(max(starts), min(ends), rate_hz)
+
+    resampled = {time_column: grid}
+    gap_flags = {}
+    gap = np.zeros(len(grid), dtype=bool)
+    for name, df in sensors.items():
+        suffix = suffixes.get(name, f"_{name}")
+        sensor_max_gap = max_gap.get(name, DEFAULT_MAX_GAP_MS) if isinstance(max_gap, dict) else max_gap
+        values, valid = resample_to_grid(df[time_column].to_numpy(), df[list(columns)].to_numpy(), grid,
+                                         sensor_max_gap)
+        for idx, column in enumerate(columns):
+            resampled[f"{column}{suffix}"] = values[:, idx]
+        gap_flags[f"gap_{name}"] = ~valid
+        gap |= ~valid
+    resampled.update(gap_flags)
+    resampled['gap'] = gap
+    return pd.DataFrame(resampled)
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+
+def rolling_iqr(values, window):
+    """
+    IQR of every trailing window of `window` values (shorter at the start) for a whole array.
+
+    Uses pandas' rolling quantile, which keeps a sorted skiplist of the window, so a
+    full season of samples costs O(n log window) instead of a sort per sample.
+    """
+    series = pd.Series(np.asarray(values, dtype=np.float64))
+    rolling = series.rolling(window, min_periods=1)
+    return (rolling.quantile(0.75) - rolling.quantile(0.25)).to_numpy()
+
+
+def _group_quantile(sorted_values, starts, counts, q):
+    """Quantile of every group of a flat array holding each group's values sorted, from starts[i] on"""
+    position = q * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    fraction = position - lower
+    low_values = sorted_values[starts + lower]
+    return low_values + (sorted_values[starts + upper] - low_values) * fraction
+
+
+def _sort_groups(group_idx, values, n_groups):
+    """
+    Values sorted within each group, as one flat array group after group.
+
+    group_idx runs over 0..n_groups-1 with every group occupied. Sorting many
+    short rows of a 2-D array padded with +inf is much faster than one lexsort
+    over (group, value) for the whole column, but when a few groups are far
+    bigger than the rest the padding would waste memory, and the flat lexsort is
+    used instead.
+
+    Returns:
+        (sorted_values, starts, counts): starts and counts of every group in sorted_values
+    """
+    counts = np.bincount(group_idx, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    width = max(int(counts.max()), 1) if n_groups else 1
+    if n_groups * width > 4 * len(values) + 1024:
+        order = np.lexsort((values, group_idx))
+        return values[order], starts, counts
+    if len(group_idx) > 1 and np.any(np.diff(group_idx) < 0):
+        order = np.argsort(group_idx, kind='stable')
+        group_idx, values = group_idx[order], values[order]
+    groups = np.full((n_groups, width), np.inf)
+    groups[group_idx, np.arange(len(values)) - starts[group_idx]] = values
+    groups.sort(axis=1)
+    return groups[np.arange(width) < counts[:, None]], starts, counts
+
+
+def grouped_iqr(df, key, columns, freq):
+    """
+    Vectorized equivalent of df.groupby(pd.Grouper(key=key, freq=freq))[columns].agg(IQR).
+
+    Every column is sorted within its occupied buckets at once and the quartiles
+    of every bucket are read with index arithmetic, with no Python call per
+    bucket. Empty buckets between the first and last one are NaN, like the
+    Grouper gives.
+
+    Args:
+        df (pd.DataFrame): data with a datetime column `key`
+        key (str): datetime column to bucket on
+        columns (list): value columns
+        freq (str): bucket size, e.g. '5s'
+
+    Returns:
+        pd.DataFrame: one row per bucket, indexed by bucket start
+    """
+    timestamps = df[key]
+    tz = timestamps.dt.tz
+    step = pd.Timedelta(freq).value
+    if tz is not None:
+        ns = timestamps.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy().astype('datetime64[ns]').astype(np.int64)
+    else:
+        ns = timestamps.to_numpy().astype('datetime64[ns]').astype(np.int64)
+    if len(ns) == 0:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], tz=tz, name=key), dtype=np.float64)
+
+    buckets = ns // step
+    first_bucket = buckets.min()
+    n_buckets = int(buckets.max() - first_bucket) + 1
+    bucket_idx = buckets - first_bucket
+
+    result = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        finite = ~np.isnan(values)
+        # only buckets holding data are sorted, sessions days apart leave most of them empty
+        occupied, group_idx = np.unique(bucket_idx[finite], return_inverse=True)
+        sorted_values, starts, counts = _sort_groups(group_idx, values[finite], len(occupied))
+        iqr = np.full(n_buckets, np.nan)
+        iqr[occupied] = (_group_quantile(sorted_values, starts, counts, 0.75)
+                         - _group_quantile(sorted_values, starts, counts, 0.25))
+        result[column] = iqr
+
+    index = pd.to_datetime((first_bucket + np.arange(n_buckets)) * step, unit='ns', utc=tz is not None)
+    if tz is not None:
+        index = index.tz_convert(tz)
+    index = pd.DatetimeIndex(index, name=key).as_unit(timestamps.dt.unit)
+    return pd.DataFrame(result, index=index)
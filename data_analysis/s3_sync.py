@@ -0,0 +1,165 @@
+# usage: python3 s3_sync.py local_folder --bucket BUCKET [--endpoint-url http://localhost:5000]
+import argparse
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from instrumentation import instruments
+
+MANIFEST_FILE = '.s3_manifest.json'
+
+
+def make_s3_client(access_key, secret_key, region, endpoint_url=None, max_pool_connections=10, max_attempts=5):
+    """
+    S3 client shared by all download threads.
+
+    This is the only retry layer of the sync: botocore retries throttling, 5xx and
+    connection errors of every request (listing and downloads) up to max_attempts
+    times with exponential backoff and jitter.
+
+    endpoint_url points the client at an S3-compatible server (MinIO, moto server, ...)
+    instead of AWS, which is how the sync is tested locally (see main).
+    """
+    config = Config(max_pool_connections=max_pool_connections,
+                    retries={'max_attempts': max_attempts, 'mode': 'standard'})
+    return boto3.client('s3', aws_access_key_id=access_key, aws_secret_access_key=secret_key,
+                        region_name=region, endpoint_url=endpoint_url, config=config)
+
+
+def list_objects(s3, bucket, prefix=''):
+    """Every object in the bucket under prefix, following pagination past the 1000-key page limit"""
+    paginator = s3.get_paginator('list_objects_v2')
+    objects = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        objects.extend(page.get('Contents', []))
+    return objects
+
+
+class S3Sync:
+    """
+    Incremental one-way sync of an S3 bucket into a local folder.
+
+    A manifest in the local folder records the size and ETag of every downloaded
+    key. An object is only downloaded when it is not in the manifest, its size or
+    ETag changed, or the local copy is missing. Downloads run on a bounded thread
+    pool sharing one connection-pooled client (whose retry settings apply, see
+    make_s3_client) and land in a temp file that is renamed into place once
+    complete, so an interrupted run never leaves a half-written file under the
+    real name. An object that still fails is reported and tried again next sync.
+    """
+    def __init__(self, s3, bucket, local_folder, workers=8):
+        self.s3 = s3
+        self.bucket = bucket
+        self.local_folder = local_folder
+        self.workers = workers
+        # s3transfer would retry a broken download 5 times on top of the client's retries
+        self.transfer_config = TransferConfig(num_download_attempts=1)
+        self.manifest_path = os.path.join(local_folder, MANIFEST_FILE)
+        self.manifest_lock = threading.Lock()
+        os.makedirs(local_folder, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"S3 manifest unreadable, checking every object again: {e}")
+        return {}
+
+    def _save_manifest(self):
+        with self.manifest_lock:
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.manifest, f, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+
+    def local_path(self, key):
+        return os.path.join(self.local_folder, *key.split('/'))
+
+    def needs_download(self, obj):
+        known = self.manifest.get(obj['Key'])
+        local_path = self.local_path(obj['Key'])
+        if known is None or not os.path.exists(local_path):
+            return True
+        return (known['size'] != obj['Size'] or known['etag'] != obj['ETag']
+                or os.path.getsize(local_path) != obj['Size'])
+
+    def download(self, obj):
+        """Download one object atomically"""
+        key = obj['Key']
+        local_path = self.local_path(key)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        tmp_path = f"{local_path}.{uuid.uuid4().hex}.part"
+        try:
+            self.s3.download_file(self.bucket, key, tmp_path, Config=self.transfer_config)
+            os.replace(tmp_path, local_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self.manifest_lock:
+            self.manifest[key] = {'size': obj['Size'], 'etag': obj['ETag']}
+        return key
+
+    def sync(self, prefix=''):
+        """
+        Download every new or changed object under prefix.
+
+        Returns:
+            (downloaded, failed): list of downloaded keys and dict of key -> error
+        """
+        with instruments.stage('s3_list'):
+            objects = [obj for obj in list_objects(self.s3, self.bucket, prefix)
+                       if not obj['Key'].endswith('/')]
+            to_download = [obj for obj in objects if self.needs_download(obj)]
+            instruments.add_rows(len(objects))
+        print(f"S3: {len(objects)} objects, {len(to_download)} to download")
+
+        downloaded, failed = [], {}
+        try:
+            with instruments.stage('s3_download'), ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self.download, obj): obj['Key'] for obj in to_download}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        downloaded.append(future.result())
+                        instruments.add_rows(1)
+                    except Exception as e:
+                        failed[key] = str(e)
+                        print(f"Failed to download {key}: {e}")
+        finally:
+            # keep the progress of a partial run
+            self._save_manifest()
+        return sorted(downloaded), failed
+
+
+def command_line_args():
+    parser = argparse.ArgumentParser(description='Sync an S3 bucket (or a local S3-compatible server) into a folder')
+    parser.add_argument('local_folder', type=str, help='Folder to sync into')
+    parser.add_argument('--bucket', type=str, required=True)
+    parser.add_argument('--prefix', type=str, default='')
+    parser.add_argument('--endpoint-url', type=str, default=None,
+                        help='S3-compatible server, e.g. http://localhost:5000 for `moto_server`')
+    parser.add_argument('--region', type=str, default='us-east-1')
+    parser.add_argument('--workers', type=int, default=8)
+    return parser.parse_args()
+
+
+def main():
+    """Credentials come from the usual boto3 sources (environment, ~/.aws)"""
+    args = command_line_args()
+    s3 = make_s3_client(None, None, args.region, endpoint_url=args.endpoint_url,
+                        max_pool_connections=args.workers)
+    downloaded, failed = S3Sync(s3, args.bucket, args.local_folder, workers=args.workers).sync(args.prefix)
+    print(f"Downloaded {len(downloaded)} objects, {len(failed)} failed")
+
+
+if __name__ == "__main__":
+    main()
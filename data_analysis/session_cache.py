@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from importlib.util import find_spec
+from frame_schema import compact_frame
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks on Windows, concurrent runs there may drop index updates
+    fcntl = None
+
+# no pyarrow, fall back to pickles so the cache still works; find_spec checks
+# without importing it, pyarrow and pandas are only loaded when an entry is read or written
+CACHE_FORMAT = 'parquet' if find_spec('pyarrow') is not None else 'pickle'
+
+
+def file_sha1(file_path, chunk_size=1 << 20):
+    """SHA1 of a file's content, read in 1 MB chunks"""
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def folder_csv_files(folder_path):
+    """Sorted list of the CSV files in a session folder, as full paths"""
+    return [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f.endswith('.csv')]
+
+
+class SessionCache:
+    """
+    On-disk cache of processed IMU sessions.
+
+    Each entry is a processed dataframe stored as Parquet (pickle if pyarrow is
+    missing). The key is built from the size, mtime and SHA1 of every source file
+    plus the processing parameters, so editing a CSV or changing the filter
+    parameters gives a new key. Content hashes are remembered per (path, size, mtime)
+    so unchanged files are not re-read on every lookup.
+
+    When the cache grows over max_size_gb, the least recently used entries are
+    evicted. Lookups only update the access times in memory; they are written with
+    the next put / eviction, or by close() once the caller is done. Several processes can share one cache folder: index writes are done
+    under a file lock and merged with what other processes wrote in the meantime,
+    and the size limit is enforced on that merged index, entries of other
+    processes included.
+    """
+    def __init__(self, cache_folder, max_size_gb=5.0):
+        self.cache_folder = cache_folder
+        self.max_size_bytes = int(max_size_gb * 1024 ** 3)
+        self.index_file = os.path.join(cache_folder, 'index.json')
+        self.lock_file = os.path.join(cache_folder, 'index.lock')
+        os.makedirs(cache_folder, exist_ok=True)
+        self.index = self._load_index()
+        # keys (and fingerprinted paths) this instance touched or removed since its last save
+        self._dirty = set()
+        self._removed = set()
+        self._removed_fingerprints = set()
+        self._cleared = False
+
+    def _load_index(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Cache index unreadable, starting empty: {e}")
+        return {'fingerprints': {}, 'entries': {}}
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_file, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _save_index(self):
+        with self._locked():
+            # merge our changes into whatever other processes saved since we loaded
+            merged = {'fingerprints': {}, 'entries': {}} if self._cleared else self._load_index()
+            merged['fingerprints'].update(self.index['fingerprints'])
+            for path in self._removed_fingerprints:
+                merged['fingerprints'].pop(path, None)
+            for key in self._removed:
+                merged['entries'].pop(key, None)
+            for key in self._dirty:
+                if key in self.index['entries']:
+                    merged['entries'][key] = self.index['entries'][key]
+            self.index = merged
+            # evicting here, under the lock, counts what every process has put
+            self._evict()
+            self._dirty, self._removed, self._removed_fingerprints, self._cleared = set(), set(), set(), False
+
+            tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_file, self.index_file)
+
+    def fingerprint(self, file_path):
+        """(size, mtime_ns, sha1) of a file; the hash is only recomputed when size or mtime change"""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        known = self.index['fingerprints'].get(file_path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return tuple(known)
+        fingerprint = (stat.st_size, stat.st_mtime_ns, file_sha1(file_path))
+        self.index['fingerprints'][file_path] = list(fingerprint)
+        return fingerprint
+
+    def key(self, source_files, params=None):
+        """Cache key for a set of source files and processing parameters"""
+        parts = [[os.path.basename(f), *self.fingerprint(f)] for f in sorted(source_files)]
+        payload = json.dumps({'sources': parts, 'params': params or {}}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _entry_path(self, key):
+        extension = 'parquet' if CACHE_FORMAT == 'parquet' else 'pkl'
+        return os.path.join(self.cache_folder, f"{key}.{extension}")
+
+    def contains(self, source_files, params=None):
+        """Whether get would hit, without reading the entry"""
+        entry = self.index['entries'].get(self.key(source_files, params))
+        return entry is not None and os.path.exists(entry['file'])
+
+    def get(self, source_files, params=None):
+        """Cached dataframe for these sources/params, in the compact schema of frame_schema, or None on a miss"""
+        key = self.key(source_files, params)
+        entry = self.index['entries'].get(key)
+        if entry is None or not os.path.exists(entry['file']):
+            if entry is not None:
+                self.index['entries'].pop(key, None)
+                self._removed.add(key)
+            return None
+        import pandas as pd
+        try:
+            if entry['file'].endswith('.parquet'):
+                df = pd.read_parquet(entry['file'])
+            else:
+                df = pd.read_pickle(entry['file'])
+        except Exception as e:
+            print(f"Could not read cache entry {entry['file']}: {e}")
+            self._remove(key)
+            self._save_index()
+            return None
+        # written with the next save, see close()
+        entry['last_access'] = time.time()
+        self._dirty.add(key)
+        # a no-op for entries written by put, casts entries from before the schema existed
+        return compact_frame(df)
+
+    def put(self, source_files, df, params=None):
+        """
+        Store a processed dataframe and evict old entries if over the size limit.
+        A copy of the frame is cast to the compact schema, so the entry matches what
+        get returns; the caller's frame is left as it is.
+        """
+        df = compact_frame(df.copy(deep=False))
+        key = self.key(source_files, params)
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        if CACHE_FORMAT == 'parquet':
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, entry_path)
+
+        self.index['entries'][key] = {
+            'file': entry_path,
+            'size': os.path.getsize(entry_path),
+            'last_access': time.time(),
+            'sources': [os.path.abspath(f) for f in source_files],
+        }
+        self._dirty.add(key)
+        self._save_index()
+
+    def _remove(self, key):
+        self._removed.add(key)
+        self._dirty.discard(key)
+        entry = self.index['entries'].pop(key, None)
+        if entry and os.path.exists(entry['file']):
+            os.remove(entry['file'])
+
+    def _evict(self):
+        entries = self.index['entries']
+        total_size = sum(entry['size'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_access']):
+            if total_size <= self.max_size_bytes:
+                break
+            total_size -= entries[key]['size']
+            self._remove(key)
+
+    def invalidate(self, path):
+        """Drop every entry built from a source file at or under `path` (a file or a session folder)"""
+        path = os.path.abspath(path)
+        # pick up the entries other processes added, they may be built from path too
+        self._save_index()
+        stale = [key for key, entry in self.index['entries'].items()
+                 if any(src == path or src.startswith(path + os.sep) for src in entry['sources'])]
+        for key in stale:
+            self._remove(key)
+        stale_fingerprints = [f for f in self.index['fingerprints'] if f == path or f.startswith(path + os.sep)]
+        for f in stale_fingerprints:
+            del self.index['fingerprints'][f]
+        self._removed_fingerprints.update(stale_fingerprints)
+        self._save_index()
+        return len(stale)
+
+    def clear(self):
+        """Remove every cached entry"""
+        self._save_index()
+        for key in list(self.index['entries']):
+            self._remove(key)
+        self.index = {'fingerprints': {}, 'entries': {}}
+        self._cleared = True
+        self._save_index()
+
+    def close(self):
+        """Write the access times and file hashes of the lookups since the last save to the index"""
+        self._save_index()
+
+    def size_bytes(self):
+        return sum(entry['size'] for entry in self.index['entries'].values())
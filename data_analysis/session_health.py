@@ -0,0 +1,260 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from session_cache import folder_csv_files
+
+# an interval longer than this many nominal sample periods counts as a dropout
+DEFAULT_GAP_FACTOR = 2.0
+
+# default limits for flagging a session as unhealthy
+DEFAULT_HEALTH_LIMITS = {
+    'max_gap_ms': 1000,
+    'min_coverage': 0.9,
+    'max_drift_ms': 100,
+}
+
+
+def read_epochs(file_path):
+    """Only the time column ('timestamp' or 'epoch', in ms) of a sensor CSV, as int64"""
+    header = pd.read_csv(file_path, nrows=0).columns
+    time_column = 'timestamp' if 'timestamp' in header else 'epoch'
+    return pd.read_csv(file_path, usecols=[time_column], dtype={time_column: np.int64})[time_column].to_numpy()
+
+
+def sensor_health(epochs, gap_factor=DEFAULT_GAP_FACTOR):
+    """
+    Sampling diagnostics for one sensor, from its raw epoch array (ms), in file order.
+
+    The nominal period is the median of the positive sample intervals, so a few
+    dropouts or bursts do not skew it. Every interval longer than gap_factor nominal
+    periods is a gap.
+
+    Returns:
+        dict: sample count, duration, nominal and effective ODR (Hz), coverage
+        (effective / nominal ODR), gap count, longest gap and estimated missing
+        samples, duplicate and out-of-order sample counts
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    n = len(epochs)
+    health = {'samples': n, 'first_ms': int(epochs[0]) if n else None, 'last_ms': int(epochs[-1]) if n else None,
+              'duration_s': 0.0, 'nominal_odr_hz': None, 'effective_odr_hz': None, 'coverage': None,
+              'gaps': 0, 'longest_gap_ms': 0, 'missing_samples': 0, 'duplicates': 0, 'out_of_order': 0}
+    if n < 2:
+        return health
+
+    intervals = np.diff(epochs)
+    health['duplicates'] = int(np.count_nonzero(intervals == 0))
+    health['out_of_order'] = int(np.count_nonzero(intervals < 0))
+    duration_ms = int(epochs.max() - epochs.min())
+    health['duration_s'] = duration_ms / 1000
+    positive = intervals[intervals > 0]
+    if len(positive) == 0 or duration_ms == 0:
+        return health
+
+    period = float(np.median(positive))
+    health['nominal_odr_hz'] = 1000.0 / period
+    health['effective_odr_hz'] = (n - 1) * 1000.0 / duration_ms
+    health['coverage'] = health['effective_odr_hz'] / health['nominal_odr_hz']
+    gaps = positive[positive > gap_factor * period]
+    health['gaps'] = int(len(gaps))
+    health['longest_gap_ms'] = int(positive.max()) if len(gaps) else 0
+    health['missing_samples'] = int(np.sum(np.round(gaps / period) - 1))
+    return health
+
+
+def _span_rate(epochs, start, end, gap_factor=DEFAULT_GAP_FACTOR):
+    """
+    Effective / nominal sample rate of the samples between start and end (ms).
+
+    The effective period is the least-squares slope of time against sample
+    number within each stretch between gaps (intervals over gap_factor nominal
+    periods), so dropouts do not read as a slow clock and the timestamp jitter
+    of burst-stamped samples averages out. Samples sharing a timestamp count once.
+    """
+    epochs = np.unique(epochs[(epochs >= start) & (epochs <= end)])
+    if len(epochs) < 3:
+        return None
+    intervals = np.diff(epochs)
+    period = float(np.median(intervals))
+    stretch = np.concatenate([[0], np.cumsum(intervals > gap_factor * period)])
+    counts = np.bincount(stretch)
+    number = np.arange(len(epochs)) - np.concatenate([[0], np.cumsum(counts)[:-1]])[stretch]
+    times = epochs - np.bincount(stretch, epochs)[stretch] / counts[stretch]
+    number = number - np.bincount(stretch, number)[stretch] / counts[stretch]
+    spread = np.sum(number * number)
+    if spread == 0:
+        return None
+    return period * spread / np.sum(times * number)
+
+
+def clock_drift(reference_epochs, epochs, gap_factor=DEFAULT_GAP_FACTOR):
+    """
+    How far two sensors' clocks run apart, from their sample rates over the span both cover.
+
+    Each sensor's effective rate relative to its nominal one is measured on the
+    overlapping span only, so a sensor that starts late or stops early is not
+    taken for drift. drift_ppm is the difference of the two relative rates and
+    drift_ms what it adds up to over the overlap; sensors on one clock stay near 0.
+    """
+    reference_epochs = np.asarray(reference_epochs, dtype=np.int64)
+    epochs = np.asarray(epochs, dtype=np.int64)
+    drift = {'start_offset_ms': None, 'overlap_s': None, 'drift_ms': None, 'drift_ppm': None}
+    if len(reference_epochs) < 2 or len(epochs) < 2:
+        return drift
+    drift['start_offset_ms'] = int(epochs.min() - reference_epochs.min())
+    start = max(reference_epochs.min(), epochs.min())
+    end = min(reference_epochs.max(), epochs.max())
+    if end <= start:
+        return drift
+    drift['overlap_s'] = (end - start) / 1000
+    reference_rate = _span_rate(reference_epochs, start, end, gap_factor)
+    rate = _span_rate(epochs, start, end, gap_factor)
+    if reference_rate is None or rate is None:
+        return drift
+    drift['drift_ppm'] = (rate / reference_rate - 1) * 1e6
+    drift['drift_ms'] = drift['drift_ppm'] * (end - start) / 1e6
+    return drift
+
+
+def sensor_name(file_path):
+    """'acc' for 'acc-20240101-101010.csv', 'accelerometer' for 'accelerometer.csv'"""
+    return os.path.basename(file_path).rsplit('.', 1)[0].split('-')[0]
+
+
+def health_flags(record, limits=None):
+    """
+    Reasons a session is unhealthy, from its measured record and the given limits.
+
+    Kept apart from the measurements so a stored record can be judged again when
+    the limits change without re-reading its files.
+    """
+    limits = {**DEFAULT_HEALTH_LIMITS, **(limits or {})}
+    flags = [f"{name}: unreadable ({error})" for name, error in record.get('errors', {}).items()]
+    for name, health in record['sensors'].items():
+        if health['samples'] < 2:
+            flags.append(f"{name}: no data")
+            continue
+        if health['longest_gap_ms'] > limits['max_gap_ms']:
+            flags.append(f"{name}: gap of {health['longest_gap_ms']} ms")
+        if health['coverage'] is not None and health['coverage'] < limits['min_coverage']:
+            flags.append(f"{name}: coverage {health['coverage']:.2f}")
+        if health['out_of_order']:
+            flags.append(f"{name}: {health['out_of_order']} out-of-order samples")
+        if health.get('drift_ms') is not None and abs(health['drift_ms']) > limits['max_drift_ms']:
+            flags.append(f"{name}: clock drift {health['drift_ms']:.0f} ms")
+    if not record['sensors']:
+        flags.append("no sensor files")
+    return flags
+
+
+def session_health(folder_path, gap_factor=DEFAULT_GAP_FACTOR, limits=None):
+    """
+    Health record of one session folder.
+
+    Reads only the time column of every sensor CSV. The first sensor (the
+    accelerometer, in sorted file order) is the reference for clock drift.
+
+    Returns:
+        dict: 'session', 'sensors' (name -> sensor_health + drift against the
+        reference), 'errors' (name -> why the file could not be read), 'files'
+        (name -> [size, mtime_ns]) and 'gap_factor', to reuse the measurements
+        while both are unchanged, 'flags' (see health_flags) and 'ok'
+    """
+    record = {'session': os.path.basename(os.path.normpath(folder_path)), 'sensors': {}, 'errors': {},
+              'files': {}, 'gap_factor': gap_factor}
+    reference = None
+    for file_path in folder_csv_files(folder_path):
+        name = sensor_name(file_path)
+        stat = os.stat(file_path)
+        record['files'][name] = [stat.st_size, stat.st_mtime_ns]
+        try:
+            epochs = read_epochs(file_path)
+        except (ValueError, KeyError, pd.errors.ParserError) as e:
+            record['errors'][name] = str(e)
+            continue
+        health = sensor_health(epochs, gap_factor)
+        if reference is None:
+            reference = epochs
+        else:
+            health.update(clock_drift(reference, epochs, gap_factor))
+        record['sensors'][name] = health
+    record['flags'] = health_flags(record, limits)
+    record['ok'] = not record['flags']
+    return record
+
+
+def health_records_to_frame(records):
+    """One row per (session, sensor), for Parquet output and quick filtering"""
+    rows = []
+    for record in records:
+        for name, health in record['sensors'].items():
+            rows.append({'session': record['session'], 'sensor': name, 'ok': record['ok'], **health})
+    return pd.DataFrame(rows)
+
+
+def scan_sessions(folder_paths, report_path, workers=4, gap_factor=DEFAULT_GAP_FACTOR, limits=None):
+    """
+    Health records for many session folders, reusing the previous report for unchanged ones.
+
+    Only the measurements are reused: the flags of every session are worked out
+    again against the current limits.
+
+    The records are written to report_path as JSON (session -> record). When
+    pyarrow is available, a flat table with one row per sensor is written next to it
+    as Parquet.
+
+    Returns:
+        dict: session name -> record
+    """
+    previous = {}
+    if os.path.exists(report_path):
+        try:
+            with open(report_path, 'r') as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Health report unreadable, scanning every session: {e}")
+
+    def unchanged(folder_path, record):
+        if record.get('gap_factor') != gap_factor:
+            return False
+        files = {sensor_name(path): path for path in folder_csv_files(folder_path)}
+        if set(files) != set(record.get('files', {})):
+            return False
+        for name, path in files.items():
+            stat = os.stat(path)
+            if record['files'][name] != [stat.st_size, stat.st_mtime_ns]:
+                return False
+        return True
+
+    records = {}
+    to_scan = []
+    for folder_path in folder_paths:
+        session = os.path.basename(os.path.normpath(folder_path))
+        known = previous.get(session)
+        if known is not None and unchanged(folder_path, known):
+            known['flags'] = health_flags(known, limits)
+            known['ok'] = not known['flags']
+            records[session] = known
+        else:
+            to_scan.append(folder_path)
+
+    # reading the CSVs is mostly C parsing, threads keep several files in flight
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for record in executor.map(lambda path: session_health(path, gap_factor, limits), to_scan):
+            records[record['session']] = record
+
+    if os.path.dirname(report_path):
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    tmp_path = f"{report_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(records, f, indent=1)
+    os.replace(tmp_path, report_path)
+    try:
+        health_records_to_frame(records.values()).to_parquet(report_path.rsplit('.', 1)[0] + '.parquet', index=False)
+    except ImportError:
+        pass
+    print(f"Session health: {len(to_scan)} scanned, {len(records) - len(to_scan)} unchanged, "
+          f"{sum(not record['ok'] for record in records.values())} flagged")
+    return records
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+
+
+class SessionIndex:
+    """
+    Small SQLite index of recording intervals.
+
+    One row per IMU session folder or Garmin CSV with its [start, end] timestamps,
+    the device it came from and the size/mtime of the file the timestamps were read
+    from. update() only re-reads files that are new or changed, so a run over a
+    growing archive only pays for the new recordings. Timestamps are int64
+    nanoseconds since the epoch (UTC), stored with start <= end even when a file's
+    last sample is older than its first.
+    """
+    # bump when the table layout changes, older index files are then rebuilt from scratch
+    SCHEMA_VERSION = 3
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.conn.executescript(f"""
+                DROP TABLE IF EXISTS sessions;
+                PRAGMA user_version = {self.SCHEMA_VERSION};
+            """)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                name TEXT NOT NULL,
+                device TEXT NOT NULL,
+                path TEXT NOT NULL,
+                start_ts INTEGER NOT NULL,
+                end_ts INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                PRIMARY KEY (device, name)
+            );
+            CREATE INDEX IF NOT EXISTS sessions_interval ON sessions (device, start_ts, end_ts);
+        """)
+        # longest session per device, bounds the start_ts range scanned by overlapping()
+        self._max_duration = {}
+
+    def close(self):
+        self.conn.close()
+
+    def _known(self, device):
+        rows = self.conn.execute("SELECT name, size, mtime_ns FROM sessions WHERE device = ?", (device,))
+        return {name: (size, mtime_ns) for name, size, mtime_ns in rows}
+
+    def update(self, device, sources, read_timestamps):
+        """
+        Bring the rows of one device in line with what is on disk.
+
+        Args:
+            device (str): device name the rows are stored under, e.g. 'imu' or 'garmin'
+            sources (dict): session name -> path of the file the interval is read from
+            read_timestamps (callable): path -> (first_timestamp, last_timestamp) in ns,
+                called only for new or changed files
+
+        Returns:
+            int: number of sessions that were (re)read
+        """
+        known = self._known(device)
+        self._max_duration.pop(device, None)
+        n_read = 0
+        with self.conn:
+            for name in set(known) - set(sources):
+                self.conn.execute("DELETE FROM sessions WHERE device = ? AND name = ?", (device, name))
+
+            for name, path in sources.items():
+                if not os.path.exists(path):
+                    self.conn.execute("DELETE FROM sessions WHERE device = ? AND name = ?", (device, name))
+                    continue
+                stat = os.stat(path)
+                if known.get(name) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                first_ts, last_ts = read_timestamps(path)
+                n_read += 1
+                if first_ts is None or last_ts is None:
+                    self.conn.execute("DELETE FROM sessions WHERE device = ? AND name = ?", (device, name))
+                    continue
+                start_ts, end_ts = sorted((int(first_ts), int(last_ts)))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (name, device, path, start_ts, end_ts, stat.st_size, stat.st_mtime_ns))
+        return n_read
+
+    def intervals(self, device):
+        """{name: (start, end)} for every session of a device"""
+        rows = self.conn.execute("SELECT name, start_ts, end_ts FROM sessions WHERE device = ? ORDER BY start_ts",
+                                 (device,))
+        return {name: (start_ts, end_ts) for name, start_ts, end_ts in rows}
+
+    def overlapping(self, device, start, end):
+        """
+        {name: (start, end)} of the sessions of `device` that overlap [start, end], in start order.
+
+        An indexed range query: a session can only overlap if it starts within the
+        device's longest session duration before `start`, so only that slice of
+        sessions_interval is scanned, not every stored interval. Reversed bounds
+        are swapped round.
+        """
+        start, end = sorted((int(start), int(end)))
+        if device not in self._max_duration:
+            longest = self.conn.execute("SELECT MAX(end_ts - start_ts) FROM sessions WHERE device = ?",
+                                        (device,)).fetchone()[0]
+            self._max_duration[device] = longest or 0
+        rows = self.conn.execute(
+            "SELECT name, start_ts, end_ts FROM sessions WHERE device = ? AND start_ts BETWEEN ? AND ? "
+            "AND end_ts >= ? ORDER BY start_ts",
+            (device, start - self._max_duration[device], end, start))
+        return {name: (start_ts, end_ts) for name, start_ts, end_ts in rows}
@@ -0,0 +1,268 @@
+import argparse
+import os
+import struct
+import numpy as np
+import pandas as pd
+from fit_decoder import FIT_EPOCH_OFFSET, RECORD_MESG_NUM, decode_fit_records, write_records
+from fit_conversion import RECORDS_TO_STORE
+
+# sensor name -> file / column prefix of the recordings
+SENSORS = ('accelerometer', 'gyroscope', 'magnetometer')
+
+# fields fit_conversion.fit_to_csv writes, in its column order
+GARMIN_CSV_FIELDS = RECORDS_TO_STORE
+
+# earth magnetic field in the sensor frame when level (uT)
+EARTH_FIELD_UT = np.array([20.0, 0.0, -45.0])
+
+_FIT_CRC_TABLE = [0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+                  0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400]
+
+
+def fit_crc(data, crc=0):
+    """FIT CRC-16 of a byte string"""
+    for byte in data:
+        tmp = _FIT_CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _FIT_CRC_TABLE[byte & 0xF]
+        tmp = _FIT_CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ _FIT_CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+
+def dropout_windows(start_ms, end_ms, n_dropouts, dropout_ms, rng):
+    """
+    (starts, ends) of n_dropouts random gaps in [start_ms, end_ms), each lasting a
+    random length in dropout_ms (min, max), like a BLE link dropping out for a while
+    """
+    starts = rng.uniform(start_ms, end_ms, n_dropouts)
+    return starts, starts + rng.uniform(dropout_ms[0], dropout_ms[1], n_dropouts)
+
+
+def in_windows(timestamps_ms, starts, ends):
+    """Boolean mask of the timestamps inside any of the windows"""
+    mask = np.zeros(len(timestamps_ms), dtype=bool)
+    for start, end in zip(starts, ends):
+        mask |= (timestamps_ms >= start) & (timestamps_ms < end)
+    return mask
+
+
+def _orientation(t_s, phase, cadence_rpm=85):
+    """Roll/pitch (deg) of a bike: sway at the pedalling cadence on top of slow leaning"""
+    cadence_hz = cadence_rpm / 60
+    roll = 4.0 * np.sin(2 * np.pi * cadence_hz * t_s + phase) + 6.0 * np.sin(2 * np.pi * t_s / 45)
+    pitch = 1.5 * np.sin(2 * np.pi * 2 * cadence_hz * t_s) + 2.0 * np.sin(2 * np.pi * t_s / 300)
+    return roll, pitch
+
+
+def imu_samples(start_ms, duration_s, odr, rng, noise=0.02):
+    """
+    Accelerometer (g), gyroscope (deg/s) and magnetometer (uT) samples of one ride.
+
+    Returns:
+        dict: sensor name -> (timestamps_ms, (n, 3) values) at the sensor's ODR,
+        odr being a dict with one rate per sensor
+    """
+    samples = {}
+    phase = rng.uniform(0, 2 * np.pi)
+    for sensor in SENSORS:
+        t_ms = start_ms + np.arange(0, duration_s * 1000, 1000 / odr[sensor]).astype(np.int64)
+        t_s = (t_ms - start_ms) / 1000
+        roll, pitch = _orientation(t_s, phase)
+        roll_rad, pitch_rad = np.radians(roll), np.radians(pitch)
+        if sensor == 'accelerometer':
+            values = np.column_stack([-np.sin(pitch_rad),
+                                      np.sin(roll_rad) * np.cos(pitch_rad),
+                                      np.cos(roll_rad) * np.cos(pitch_rad)])
+            values += rng.normal(0, noise, values.shape)
+        elif sensor == 'gyroscope':
+            values = np.column_stack([np.gradient(roll, t_s), np.gradient(pitch, t_s), np.zeros(len(t_s))])
+            values += rng.normal(0, 50 * noise, values.shape) + np.array([0.3, -0.2, 0.1])
+        else:
+            # level field tilted by roll and pitch (small-angle approximation of the rotation)
+            bx, by, bz = EARTH_FIELD_UT
+            values = np.column_stack([bx * np.cos(pitch_rad) + bz * np.sin(pitch_rad),
+                                      by * np.cos(roll_rad) - bz * np.sin(roll_rad),
+                                      -bx * np.sin(pitch_rad) + bz * np.cos(roll_rad) * np.cos(pitch_rad)])
+            values += rng.normal(0, 20 * noise, values.shape)
+        samples[sensor] = (t_ms, values)
+    return samples
+
+
+def write_imu_session(output_folder, start, duration_s, layout='logger', odr=100, mag_odr=25, n_dropouts=0,
+                      dropout_ms=(200, 3000), packet_size=3, seed=0):
+    """
+    Write one synthetic IMU session in the layout of a real recording.
+
+    Args:
+        output_folder (str): run directory (logger) or S3 data folder (app)
+        start (pd.Timestamp): session start, UTC
+        duration_s (float): session length
+        layout (str): 'logger' writes '<sensor>-%Y%m%d-%H%M%S.csv' files with
+            'epoch,x,y,z' like raw_data_logger; 'app' writes a '%Y_%m_%d_%H_%M_%S'
+            folder with '<sensor>.csv' files with 'timestamp,x,y,z' like the phone app
+        odr (float): accelerometer and gyroscope rate (Hz)
+        mag_odr (float): magnetometer rate (Hz)
+        n_dropouts (int): number of gaps in all sensors
+        dropout_ms (tuple): (min, max) gap length
+        packet_size (int): 'app' layout only: samples arriving in one BLE packet,
+            which get the same phone timestamp
+        seed (int): random seed
+
+    Returns:
+        (str, dict): the session folder and the number of samples written per sensor
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+    start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+    start_ms = start.value // 1_000_000
+    samples = imu_samples(start_ms, duration_s, {'accelerometer': odr, 'gyroscope': odr, 'magnetometer': mag_odr}, rng)
+    # the same gaps in every sensor
+    gap_starts, gap_ends = dropout_windows(start_ms, start_ms + duration_s * 1000, n_dropouts, dropout_ms, rng)
+
+    if layout == 'logger':
+        folder = output_folder
+    elif layout == 'app':
+        folder = os.path.join(output_folder, start.strftime('%Y_%m_%d_%H_%M_%S'))
+    else:
+        raise ValueError(f"Unknown layout: {layout}")
+    os.makedirs(folder, exist_ok=True)
+
+    n_written = {}
+    for sensor, (t_ms, values) in samples.items():
+        in_gap = in_windows(t_ms, gap_starts, gap_ends)
+        t_ms, values = t_ms[~in_gap], values[~in_gap]
+        if layout == 'logger':
+            path = os.path.join(folder, f"{sensor}-{start.strftime('%Y%m%d-%H%M%S')}.csv")
+            time_column = 'epoch'
+        else:
+            path = os.path.join(folder, f"{sensor}.csv")
+            time_column = 'timestamp'
+            # the phone stamps samples when their packet arrives: late and in bursts
+            packet_end = np.minimum((np.arange(len(t_ms)) // packet_size + 1) * packet_size - 1, len(t_ms) - 1)
+            t_ms = t_ms[packet_end] + rng.integers(5, 25, len(t_ms))[packet_end]
+        df = pd.DataFrame({time_column: t_ms, 'x': values[:, 0], 'y': values[:, 1], 'z': values[:, 2]})
+        df.to_csv(path, index=False, float_format='%.6f')
+        n_written[sensor] = len(df)
+    return folder, n_written
+
+
+def garmin_records(start, duration_s, seed=0):
+    """One record per second of a ride: speed (m/s), altitude (m), cadence, power, heart rate, position"""
+    rng = np.random.default_rng(seed)
+    n = int(duration_s)
+    t_s = np.arange(n)
+    speed = np.clip(8.0 + 2.0 * np.sin(2 * np.pi * t_s / 600) + rng.normal(0, 0.3, n), 0, None)
+    distance = np.cumsum(speed)
+    return {
+        'timestamp': (pd.Timestamp(start).value // 1_000_000_000) + t_s,
+        'position_lat': (50.85 + 1e-5 * distance / 1.11) / 180 * 2 ** 31,
+        'position_long': (4.35 + 1e-5 * distance / 0.70) / 180 * 2 ** 31,
+        'heart_rate': np.clip(140 + 15 * np.sin(2 * np.pi * t_s / 900) + rng.normal(0, 2, n), 60, 200),
+        'cadence': np.clip(85 + rng.normal(0, 4, n), 0, 140),
+        'power': np.clip(200 + 60 * np.sin(2 * np.pi * t_s / 300) + rng.normal(0, 20, n), 0, 1500),
+        'enhanced_speed': speed,
+        'enhanced_altitude': 50 + 20 * np.sin(2 * np.pi * distance / 5000),
+    }
+
+
+def write_fit_file(path, records):
+    """
+    Write record messages (plus a file_id) as a FIT activity file.
+
+    Fields use the FIT profile types and scales fit_decoder reads: timestamp and
+    enhanced speed/altitude as uint32, positions as sint32 semicircles.
+    """
+    record_dtype = np.dtype([('header', 'u1'), ('timestamp', '<u4'), ('position_lat', '<i4'),
+                             ('position_long', '<i4'), ('heart_rate', 'u1'), ('cadence', 'u1'),
+                             ('power', '<u2'), ('enhanced_speed', '<u4'), ('enhanced_altitude', '<u4')])
+    fields = [(253, 4, 0x86), (0, 4, 0x85), (1, 4, 0x85), (3, 1, 0x02), (4, 1, 0x02), (7, 2, 0x84),
+              (73, 4, 0x86), (78, 4, 0x86)]
+    n = len(records['timestamp'])
+    rows = np.zeros(n, dtype=record_dtype)
+    rows['header'] = 1
+    rows['timestamp'] = np.asarray(records['timestamp']) - FIT_EPOCH_OFFSET
+    for name in ('position_lat', 'position_long', 'heart_rate', 'cadence', 'power'):
+        rows[name] = np.round(records[name])
+    rows['enhanced_speed'] = np.round(np.asarray(records['enhanced_speed']) * 1000)
+    rows['enhanced_altitude'] = np.round((np.asarray(records['enhanced_altitude']) + 500) * 5)
+
+    body = bytearray()
+    # file_id: type activity, manufacturer garmin, time_created
+    body += bytes([0x40, 0, 0]) + struct.pack('<HB', 0, 3) + bytes([0, 1, 0x00, 1, 2, 0x84, 4, 4, 0x86])
+    body += bytes([0x00, 4]) + struct.pack('<HI', 1, int(rows['timestamp'][0]) if n else 0)
+    body += bytes([0x41, 0, 0]) + struct.pack('<HB', RECORD_MESG_NUM, len(fields))
+    body += bytes(value for field in fields for value in field)
+    body += rows.tobytes()
+
+    header = struct.pack('<BBHI4s', 14, 0x20, 2132, len(body), b'.FIT')
+    header += struct.pack('<H', fit_crc(header))
+    data = header + bytes(body)
+    with open(path, 'wb') as f:
+        f.write(data + struct.pack('<H', fit_crc(data)))
+
+
+def write_garmin_activity(garmin_data_folder, start, duration_s, activity_id=1, seed=0):
+    """
+    Write a ride as '<type>_%Y_%m_%d_%H%M_<id>.fit' and the CSV fit_to_csv makes of it.
+
+    Returns:
+        (str, str): FIT and CSV paths
+    """
+    os.makedirs(garmin_data_folder, exist_ok=True)
+    start = pd.Timestamp(start)
+    start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+    fit_path = os.path.join(garmin_data_folder, f"Ride_{start.strftime('%Y_%m_%d_%H%M')}_{activity_id}.fit")
+    write_fit_file(fit_path, garmin_records(start, duration_s, seed))
+    csv_path = fit_path.replace(".fit", ".csv")
+    write_records(decode_fit_records(fit_path, fields=GARMIN_CSV_FIELDS), csv_path, fmt='csv')
+    return fit_path, csv_path
+
+
+def write_archive(output_folder, n_rides=3, duration_s=3600, layout='app', odr=100, mag_odr=25, n_dropouts=2,
+                  dropout_ms=(200, 3000), start='2024-05-01 08:00', seed=0):
+    """
+    A small archive shaped like the real one: per ride a Garmin FIT/CSV in
+    <output_folder>/garmin_data and an IMU session in <output_folder>/s3_data/data
+    (app layout) or <output_folder>/logger/<run> (logger layout), starting a minute
+    after the Garmin activity. Rides are one day apart.
+
+    Returns:
+        dict: folders written, the IMU samples per session and sensor, and their total
+    """
+    garmin_data_folder = os.path.join(output_folder, 'garmin_data')
+    imu_folder = os.path.join(output_folder, 's3_data', 'data') if layout == 'app' else \
+        os.path.join(output_folder, 'logger')
+    sessions, session_samples = [], {}
+    for ride in range(n_rides):
+        ride_start = pd.Timestamp(start, tz='UTC') + pd.Timedelta(days=ride)
+        write_garmin_activity(garmin_data_folder, ride_start, duration_s, activity_id=ride + 1, seed=seed + ride)
+        target = imu_folder if layout == 'app' else os.path.join(imu_folder, f"run_{ride + 1}")
+        folder, n = write_imu_session(target, ride_start + pd.Timedelta(minutes=1), duration_s - 120, layout, odr,
+                                      mag_odr, n_dropouts, dropout_ms, seed=seed + ride)
+        sessions.append(folder)
+        session_samples[folder] = n
+    return {'garmin_data_folder': garmin_data_folder, 'imu_folder': imu_folder, 'sessions': sessions,
+            'session_samples': session_samples,
+            'imu_samples': sum(sum(n.values()) for n in session_samples.values())}
+
+
+def command_line_args():
+    parser = argparse.ArgumentParser(description='Write a synthetic IMU / Garmin archive')
+    parser.add_argument('output_folder', type=str, help='Folder to write the archive to')
+    parser.add_argument('--rides', type=int, default=3, help='Number of rides')
+    parser.add_argument('--duration', type=float, default=3600, help='Ride length in seconds')
+    parser.add_argument('--layout', choices=['app', 'logger'], default='app', help='IMU file layout')
+    parser.add_argument('--odr', type=float, default=100, help='Accelerometer / gyroscope rate (Hz)')
+    parser.add_argument('--mag-odr', type=float, default=25, help='Magnetometer rate (Hz)')
+    parser.add_argument('--dropouts', type=int, default=2, help='BLE dropouts per session')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = command_line_args()
+    archive = write_archive(args.output_folder, args.rides, args.duration, args.layout, args.odr, args.mag_odr,
+                            args.dropouts, seed=args.seed)
+    print(f"Wrote {len(archive['sessions'])} rides, {archive['imu_samples']} IMU samples to {args.output_folder}")
@@ -0,0 +1,99 @@
+import http.server
+import threading
+
+import pytest
+
+from intervals_api import IntervalsAPI
+
+FIT_BODY = bytes(range(256)) * 400
+
+
+class FitFileHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.body with a strong ETag, honouring Range and If-Range like intervals.icu"""
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body, etag = self.server.body, self.server.etag
+        byte_range, if_range = self.headers.get('Range'), self.headers.get('If-Range')
+        self.server.requests.append({'Range': byte_range, 'If-Range': if_range})
+        if byte_range and if_range in (None, etag):
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FitFileHandler)
+    httpd.body, httpd.etag, httpd.requests = FIT_BODY, '"v1"', []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def api(server):
+    return IntervalsAPI(f'http://127.0.0.1:{server.server_address[1]}', 'i1', 'key')
+
+
+def leave_part(save_path, data, validator):
+    with open(f'{save_path}.part', 'wb') as f:
+        f.write(data)
+    with open(f'{save_path}.part.validator', 'w') as f:
+        f.write(validator)
+
+
+def test_download_keeps_no_part_file(api, server, tmp_path):
+    save_path = tmp_path / 'a.fit'
+    assert api.download_fit_file('1', str(save_path))
+    assert save_path.read_bytes() == FIT_BODY
+    assert [p.name for p in tmp_path.iterdir()] == ['a.fit']
+    assert server.requests == [{'Range': None, 'If-Range': None}]
+
+
+def test_resume_from_part_file(api, server, tmp_path):
+    save_path = tmp_path / 'a.fit'
+    leave_part(save_path, FIT_BODY[:1000], '"v1"')
+
+    assert api.download_fit_file('1', str(save_path))
+    assert server.requests == [{'Range': 'bytes=1000-', 'If-Range': '"v1"'}]
+    assert save_path.read_bytes() == FIT_BODY
+
+
+def test_changed_etag_downloads_whole_file(api, server, tmp_path):
+    save_path = tmp_path / 'a.fit'
+    leave_part(save_path, FIT_BODY[:1000], '"v1"')
+    server.body, server.etag = b'N' * 50000, '"v2"'
+
+    # the If-Range no longer matches, the server answers 200 with the new file
+    assert api.download_fit_file('1', str(save_path))
+    assert server.requests == [{'Range': 'bytes=1000-', 'If-Range': '"v1"'}]
+    assert save_path.read_bytes() == b'N' * 50000
+    assert [p.name for p in tmp_path.iterdir()] == ['a.fit']
+
+
+def test_unsatisfiable_range_discards_part_file(api, server, tmp_path):
+    save_path = tmp_path / 'a.fit'
+    leave_part(save_path, FIT_BODY + b'stale', '"v1"')
+
+    # 416 for the stale '.part', then one fresh download from the start
+    assert api.download_fit_file('1', str(save_path))
+    assert server.requests == [{'Range': f'bytes={len(FIT_BODY) + 5}-', 'If-Range': '"v1"'},
+                               {'Range': None, 'If-Range': None}]
+    assert save_path.read_bytes() == FIT_BODY
+    assert [p.name for p in tmp_path.iterdir()] == ['a.fit']
@@ -0,0 +1,91 @@
+import os
+
+import botocore.exceptions
+import pytest
+from moto import mock_aws
+
+from s3_sync import MANIFEST_FILE, S3Sync, list_objects, make_s3_client
+
+BUCKET = 'imu-bucket'
+MAX_ATTEMPTS = 3
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = make_s3_client('testing', 'testing', 'us-east-1', max_attempts=MAX_ATTEMPTS)
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def put(s3, key, body):
+    s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+
+def test_list_objects_follows_pagination(s3):
+    for i in range(1005):
+        put(s3, f'imu/{i:04d}.csv', b'x')
+    put(s3, 'other/a.csv', b'x')
+
+    keys = [obj['Key'] for obj in list_objects(s3, BUCKET, 'imu/')]
+    assert len(keys) == 1005
+    assert keys[0] == 'imu/0000.csv' and keys[-1] == 'imu/1004.csv'
+    assert len(list_objects(s3, BUCKET)) == 1006
+
+
+def test_sync_downloads_new_objects(s3, tmp_path):
+    put(s3, 'session_1/acc.csv', b'1,2,3')
+    put(s3, 'session_1/gyro.csv', b'4,5,6')
+    put(s3, 'session_1/', b'')
+
+    downloaded, failed = S3Sync(s3, BUCKET, str(tmp_path), workers=2).sync()
+    assert downloaded == ['session_1/acc.csv', 'session_1/gyro.csv']
+    assert failed == {}
+    assert (tmp_path / 'session_1' / 'acc.csv').read_bytes() == b'1,2,3'
+    assert (tmp_path / MANIFEST_FILE).exists()
+    assert not [name for name in os.listdir(tmp_path / 'session_1') if name.endswith('.part')]
+
+
+def test_sync_skips_unchanged_objects(s3, tmp_path):
+    put(s3, 'session_1/acc.csv', b'1,2,3')
+    put(s3, 'session_1/gyro.csv', b'4,5,6')
+    put(s3, 'session_1/mag.csv', b'7,8,9')
+    S3Sync(s3, BUCKET, str(tmp_path)).sync()
+
+    # a new sync reads the manifest back, nothing changed so nothing is downloaded
+    assert S3Sync(s3, BUCKET, str(tmp_path)).sync() == ([], {})
+
+    # changed content, a missing local copy and a new key are downloaded again
+    put(s3, 'session_1/acc.csv', b'1,2,3,4')
+    (tmp_path / 'session_1' / 'gyro.csv').unlink()
+    put(s3, 'session_2/acc.csv', b'0')
+    downloaded, failed = S3Sync(s3, BUCKET, str(tmp_path)).sync()
+    assert downloaded == ['session_1/acc.csv', 'session_1/gyro.csv', 'session_2/acc.csv']
+    assert failed == {}
+    assert (tmp_path / 'session_1' / 'acc.csv').read_bytes() == b'1,2,3,4'
+
+
+def test_failed_download_is_retried_by_the_client_only(s3, tmp_path):
+    put(s3, 'session_1/acc.csv', b'1,2,3')
+    attempts = []
+
+    def refuse_get(request, **kwargs):
+        attempts.append(request.url)
+        raise botocore.exceptions.EndpointConnectionError(endpoint_url=request.url)
+
+    # ahead of moto's own before-send handler, which would answer the request
+    s3.meta.events.register_first('before-send.s3.GetObject', refuse_get)
+    sync = S3Sync(s3, BUCKET, str(tmp_path))
+    assert sync.transfer_config.num_download_attempts == 1
+    downloaded, failed = sync.sync()
+
+    # the first request plus botocore's retries, no second retry loop from s3transfer on top
+    assert len(attempts) == 1 + MAX_ATTEMPTS
+    assert downloaded == []
+    assert list(failed) == ['session_1/acc.csv']
+    assert os.listdir(tmp_path / 'session_1') == []
+    assert 'session_1/acc.csv' not in sync.manifest
+
+    # the failed object is picked up by the next sync
+    s3.meta.events.unregister('before-send.s3.GetObject', refuse_get)
+    assert S3Sync(s3, BUCKET, str(tmp_path)).sync() == (['session_1/acc.csv'], {})
@@ -0,0 +1,131 @@
+import csv
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytz
+from utils import DEFAULT_TIMEZONE
+
+
+def convert_millis_to_datetime(millis):
+    dt = datetime.fromtimestamp(millis/1000)
+    formatted_time = dt.strftime('%Y-%m-%d %H:%M:%S')
+    return formatted_time
+
+def epoch_ms_to_datetime(millis, tz=DEFAULT_TIMEZONE):
+    """
+    Vectorized epoch milliseconds -> tz-aware timestamps.
+    
+    Args:
+        millis (pd.Series or array): epoch milliseconds
+        tz (str): timezone the result is expressed in
+    
+    Returns:
+        pd.Series: datetime64[ns, tz], keeps the sub-millisecond part (e.g. 400 Hz grids)
+    """
+    millis = millis if isinstance(millis, pd.Series) else pd.Series(millis)
+    values = millis.to_numpy()
+    if np.issubdtype(values.dtype, np.integer):
+        nanos = values.astype(np.int64) * 1_000_000
+    else:
+        # whole and fractional ms apart, epoch ns are beyond float64's exact integers
+        whole = np.floor(values)
+        nanos = whole.astype(np.int64) * 1_000_000 + np.round((values - whole) * 1_000_000).astype(np.int64)
+    return pd.Series(pd.to_datetime(nanos, unit='ns', utc=True), index=millis.index).dt.tz_convert(tz).astype(f'datetime64[ns, {tz}]')
+
+def utc_strings_to_datetime(timestamps, tz=DEFAULT_TIMEZONE):
+    """
+    Vectorized UTC timestamp strings (as written by fit_to_csv) -> tz-aware timestamps.
+    
+    Returns:
+        pd.Series: datetime64[ns, tz]
+    """
+    timestamps = timestamps if isinstance(timestamps, pd.Series) else pd.Series(timestamps)
+    return pd.to_datetime(timestamps, utc=True).dt.tz_convert(tz).astype(f'datetime64[ns, {tz}]')
+
+def read_csv_first_last_rows(file_path, block_size=8192):
+    """
+    Read the header, first and last data row of a CSV without loading the whole file.
+    
+    The first row comes from the top of the file; the last one is found by seeking
+    back from EOF block by block until a complete line is in the buffer. A trailing
+    line with the wrong number of fields (e.g. a logger killed mid-write) is skipped.
+    
+    Returns:
+        (first_row, last_row): dicts of column -> string value, (None, None) if there is no data
+    """
+    with open(file_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode()]), [])
+        first_line = f.readline()
+        if not header or not first_line.strip():
+            return None, None
+        data_start = f.tell() - len(first_line)
+        
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buffer = b''
+        lines = []
+        while pos > data_start:
+            read_size = min(block_size, pos - data_start)
+            pos -= read_size
+            f.seek(pos)
+            buffer = f.read(read_size) + buffer
+            lines = [line for line in buffer.splitlines() if line.strip()]
+            # need two lines in the buffer, so the last complete one is not cut at the front
+            if len(lines) > 2 or pos <= data_start:
+                break
+    
+    first_row = next(csv.reader([first_line.decode()]))
+    last_rows = list(csv.reader([line.decode() for line in lines[-2:]]))
+    last_row = last_rows[-1]
+    if len(last_row) != len(header) and len(last_rows) > 1:
+        last_row = last_rows[-2]
+    return dict(zip(header, first_row)), dict(zip(header, last_row))
+
+def get_s3_folder_timestamps(folder_path):
+    """Get first and last timestamp (int64 ns since the epoch, UTC) from accelerometer.csv in an S3 folder"""
+    acc_file = os.path.join(folder_path, "accelerometer.csv")
+    if not os.path.exists(acc_file):
+        return None, None
+    return get_imu_file_timestamps(acc_file)
+
+def get_imu_file_timestamps(file_path):
+    """
+    Get first and last timestamp from an IMU CSV, keyed by either 'timestamp' (S3) or 'epoch' (logger).
+    
+    Returns:
+        (first, last): int64 nanoseconds since the epoch (UTC), (None, None) if empty
+    """
+    first_row, last_row = read_csv_first_last_rows(file_path)
+    if first_row is None:
+        return None, None
+    
+    time_column = 'timestamp' if 'timestamp' in first_row else 'epoch'
+    first_timestamp = int(first_row[time_column]) * 1_000_000
+    last_timestamp = int(last_row[time_column]) * 1_000_000
+    return first_timestamp, last_timestamp
+
+def get_garmin_file_timestamps(file_path):
+    """Get first and last timestamp (int64 ns since the epoch, UTC) from a Garmin CSV file"""
+    first_row, last_row = read_csv_first_last_rows(file_path)
+    if first_row is None:
+        return None, None
+        
+    first_timestamp = pd.Timestamp(first_row['timestamp'], tz='UTC').value
+    last_timestamp = pd.Timestamp(last_row['timestamp'], tz='UTC').value
+    return first_timestamp, last_timestamp
+
+def change_timestamp_to_belgian_time(timestamp):
+    """Convert timestamp to Belgian time (Europe/Brussels)"""
+    # Parse the timestamp
+    dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    
+    # Make it UTC aware
+    utc = pytz.UTC
+    dt = utc.localize(dt)
+    
+    # Convert to Belgian time (Europe/Brussels timezone)
+    belgian_tz = pytz.timezone('Europe/Brussels')
+    belgian_time = dt.astimezone(belgian_tz)
+    
+    return belgian_time.strftime('%Y-%m-%d %H:%M:%S')